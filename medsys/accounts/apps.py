@@ -5,6 +5,5 @@ class AccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounts"
 
-def ready(self):
-        import accounts.signals 
-        
\ No newline at end of file
+    def ready(self):
+        import accounts.signals  # noqa: F401
@@ -0,0 +1,11 @@
+from medapp.models import UnreadCounter
+
+
+def unread_messages(request):
+    # Templates call this only where the badge is rendered, and then it is a
+    # single primary-key lookup on the counter row.
+    def count():
+        user = request.user
+        return UnreadCounter.for_user(user.pk) if user.is_authenticated else 0
+
+    return {'unread_messages': count}
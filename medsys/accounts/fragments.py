@@ -0,0 +1,125 @@
+import os
+import threading
+import uuid
+
+from django.core.cache import cache, caches
+from django.utils.safestring import mark_safe
+
+# Rendered dashboard fragments, keyed per patient, doctor and staff member,
+# are kept in each worker's own LocMemCache, which evicts the least recently
+# used. Only a small generation per key lives in the shared default cache;
+# accounts.signals and management commands replace it when the underlying
+# rows change, so every worker's copy stops matching.
+FRAGMENT_CACHE = 'fragments'
+# Part of every generation; clear() replaces it to retire all of them.
+EPOCH_KEY = 'accounts:fragments'
+
+
+def patient_key(patient_id):
+    return f'patient:{patient_id}'
+
+
+def doctor_key(user_id):
+    return f'doctor:{user_id}'
+
+
+def staff_key(user_id):
+    return f'staff:{user_id}'
+
+
+class FragmentStats:
+    """Hit and miss counts of this worker process, which has its own copies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def record(self, field, count=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + count)
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'pid': os.getpid(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+stats = FragmentStats()
+
+
+def _generation_key(key):
+    return f'accounts:fragments:{key}'
+
+
+def _shared_values(keys):
+    """Values of ``keys`` in the shared cache, starting any that are missing."""
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Never set, invalidated or evicted: start one no stored entry carries.
+            value = uuid.uuid4().hex
+            found[key] = value if cache.add(key, value, timeout=None) else cache.get(key, value)
+    return found
+
+
+def get_fragment(key):
+    """``(html, generation)`` for ``key``; ``html`` is None on a miss.
+
+    A render made after a miss is stored with the generation read here,
+    before rendering. Invalidation and clear() replace the generation in the
+    shared cache, so a render that started before a save and finishes after
+    it, or a copy left in another worker, is never served.
+    """
+    found = _shared_values([EPOCH_KEY, _generation_key(key)])
+    generation = found[EPOCH_KEY] + found[_generation_key(key)]
+    entry = caches[FRAGMENT_CACHE].get(key)
+    html = entry[1] if entry and entry[0] == generation else None
+    stats.record('misses' if html is None else 'hits')
+    return (None if html is None else mark_safe(html)), generation
+
+
+def set_fragment(key, generation, html):
+    caches[FRAGMENT_CACHE].set(key, (generation, str(html)))
+
+
+def cached_fragment(key, render):
+    """Return the fragment stored under ``key``, rendering it on a miss."""
+    html, generation = get_fragment(key)
+    if html is None:
+        html = mark_safe(render())
+        set_fragment(key, generation, html)
+    return html
+
+
+def cached_stream(key, generation, chunks):
+    """Yield ``chunks`` and store their concatenation once fully consumed."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    set_fragment(key, generation, ''.join(parts))
+
+
+def invalidate(*keys):
+    keys = [key for key in keys if key]
+    if keys:
+        cache.delete_many([_generation_key(key) for key in keys])
+        caches[FRAGMENT_CACHE].delete_many(keys)
+        stats.record('invalidations', len(keys))
+
+
+def clear():
+    """Drop every fragment, e.g. after bulk writes that bypass model signals."""
+    cache.delete(EPOCH_KEY)
+    caches[FRAGMENT_CACHE].clear()
@@ -0,0 +1,225 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from medapp.models import AdmissionRecord, Patient, Prescription
+
+from ...fragments import FRAGMENT_CACHE, clear as clear_fragments
+
+# Queries allowed per cold request, session and auth lookups included.
+# Override per view with MEDSYS_QUERY_BUDGETS in settings.
+DEFAULT_QUERY_BUDGETS = {
+    'doctor_dashboard': 6,
+    'staff_dashboard': 8,
+    'patient_dashboard': 8,
+    'staff_inbox': 6,
+    'send_message': 6,
+    'add_patient': 8,
+    'edit_patient': 10,
+    'add_prescription': 8,
+    'ward_round': 6,
+}
+
+# Swapped in for the fragment cache to measure full renders.
+UNCACHED = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+# (url name, role, needs patient id)
+VIEWS = [
+    ('doctor_dashboard', 'doctor', False),
+    ('add_patient', 'doctor', False),
+    ('edit_patient', 'doctor', True),
+    ('patient_dashboard', 'doctor', True),
+    ('staff_dashboard', 'staff', False),
+    ('staff_inbox', 'staff', False),
+    ('add_prescription', 'staff', False),
+    ('ward_round', 'staff', False),
+    ('patient_dashboard', 'patient', True),
+    ('send_message', 'patient', False),
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def pick_users():
+    """Pick the busiest doctor and staff member, and the doctor's busiest patient."""
+    doctor_id = (
+        AdmissionRecord.objects.values('primary_doctor').annotate(n=Count('id')).order_by('-n')[0]['primary_doctor']
+    )
+    staff_id = (
+        Prescription.objects.values('assistant_doctor').annotate(n=Count('id')).order_by('-n')[0]['assistant_doctor']
+    )
+    # edit_patient only opens the doctor's own latest admission of a patient with history.
+    patient = (
+        Patient.objects.filter(admissions__primary_doctor_id=doctor_id, medical_histories__isnull=False)
+        .select_related('user').annotate(n=Count('prescriptions', distinct=True)).order_by('-n').first()
+    )
+    doctor = AdmissionRecord.objects.filter(patient=patient).select_related('primary_doctor').last().primary_doctor
+    users = {'doctor': doctor, 'staff': User.objects.get(pk=staff_id), 'patient': patient.user}
+    return users, patient
+
+
+def fetch(client, url):
+    response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def time_requests(client, url, repeat):
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            fetch(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(ctx.captured_queries))
+    return timings, queries
+
+
+def measure_view(client, url, repeat):
+    """Time ``url`` with the fragment cache off (cold) and then on (warm).
+
+    Budgets apply to the cold numbers, which render every fragment, so an
+    N+1 in a render path shows up even though real traffic mostly hits.
+    """
+    fetch(client, url)  # warm the session-stored roles
+
+    with override_settings(CACHES={**settings.CACHES, FRAGMENT_CACHE: UNCACHED}):
+        timings, queries = time_requests(client, url, repeat)
+        tracemalloc.start()
+        response = fetch(client, url)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    fetch(client, url)  # store the fragments
+    warm_timings, warm_queries = time_requests(client, url, repeat)
+
+    return {
+        'status': response.status_code,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'queries': queries,
+        'peak_kib': round(peak / 1024, 1),
+        'warm_p50_ms': round(statistics.median(warm_timings), 3),
+        'warm_queries': warm_queries,
+    }
+
+
+def run_benchmark(sizes, repeat, seed=42, stdout=None):
+    """Seed the current database up to each size and measure every view."""
+    results = []
+    seeded = 0
+    for size in sizes:
+        if size > seeded:
+            call_command('seed_medsys', patients=size - seeded, seed=seed + seeded, stdout=stdout or StringIO())
+            seeded = size
+            # seed_medsys bulk-inserts without signals, so cached pages are stale.
+            clear_fragments()
+        users, patient = pick_users()
+        for name, role, needs_patient in VIEWS:
+            client = Client()
+            client.force_login(users[role])
+            url = reverse(name, args=[patient.id] if needs_patient else [])
+            result = measure_view(client, url, repeat)
+            result.update({'size': size, 'view': name, 'role': role})
+            results.append(result)
+    return results
+
+
+def over_budget(results, budgets):
+    return [r for r in results if r['view'] in budgets and r['queries'] > budgets[r['view']]]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database at several sizes and record latency, query count and memory per view, "
+        "rendered in full (cold) and served from the fragment cache (warm)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help="Comma-separated patient counts.")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='bench_views.json')
+        parser.add_argument('--compare', help="Previous report to diff against.")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        budgets = {**DEFAULT_QUERY_BUDGETS, **getattr(settings, 'MEDSYS_QUERY_BUDGETS', {})}
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmark(sizes, options['repeat'], options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'revision': git_revision(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'budgets': budgets,
+            'results': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+        self.print_results(results, options.get('compare'))
+        self.stdout.write(f"Report written to {options['output']}")
+
+        failures = over_budget(results, budgets)
+        if failures:
+            lines = [f"{r['view']} ({r['role']}, {r['size']} patients): {r['queries']} > {budgets[r['view']]}" for r in failures]
+            raise CommandError("Query budget exceeded:\n  " + "\n  ".join(lines))
+
+    def print_results(self, results, compare=None):
+        baseline = {}
+        if compare:
+            with open(compare) as fh:
+                baseline = {(r['size'], r['view'], r['role']): r for r in json.load(fh)['results']}
+
+        self.stdout.write(
+            f"{'size':>8} {'view':<18} {'role':<8} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KiB':>9} "
+            f"{'warm ms':>9} {'warm q':>7}"
+        )
+        for r in results:
+            line = (
+                f"{r['size']:>8} {r['view']:<18} {r['role']:<8} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                f"{r['queries']:>8} {r['peak_kib']:>9.1f} {r['warm_p50_ms']:>9.2f} {r['warm_queries']:>7}"
+            )
+            old = baseline.get((r['size'], r['view'], r['role']))
+            if old:
+                line += f"  (p50 {r['p50_ms'] - old['p50_ms']:+.2f} ms, queries {r['queries'] - old['queries']:+d})"
+            self.stdout.write(line)
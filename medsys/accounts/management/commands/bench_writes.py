@@ -0,0 +1,193 @@
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from medapp.beds import save_admission
+from medapp.models import AdmissionRecord, Medicine, Message, Patient, PatientMedicalHistory
+from medapp.prescriptions import create_prescriptions
+
+from .bench_views import percentile
+
+# Django's SQLite defaults. WAL is a property of the database file, so the
+# baseline switches it back off rather than inheriting it from a tuned run.
+BASELINE_OPTIONS = {'init_command': 'PRAGMA journal_mode=DELETE'}
+
+
+# ------------------------------
+# Workload
+# ------------------------------
+
+def send_message(rng, data):
+    patient = rng.choice(data['patients'])
+    Message(sender_id=patient['user_id'], recipient_id=rng.choice(data['staff']), subject='Bench', body='Hello').save()
+
+
+def add_prescription(rng, data):
+    patient = Patient(id=rng.choice(data['patients'])['id'])
+    line = {'medicine': rng.choice(data['medicines']), 'dosage': '1 tablet', 'duration_days': 5}
+    create_prescriptions(patient, User(id=rng.choice(data['staff'])), [line])
+
+
+def add_patient(rng, data):
+    # The add_patient view: a history row and an admission in one transaction.
+    patient_id = rng.choice(data['patients'])['id']
+    with transaction.atomic():
+        PatientMedicalHistory.objects.create(patient_id=patient_id, condition_name='Bench', diagnosis_date=timezone.localdate())
+        save_admission(AdmissionRecord(
+            patient_id=patient_id, primary_doctor_id=rng.choice(data['doctors']),
+            admission_reason='Bench', admission_date=timezone.now(),
+        ))
+
+
+def read_conversation(rng, data):
+    # Reads the unread rows, then updates them: the pattern that fails at
+    # once under deferred transactions when another writer holds the lock.
+    Message.objects.filter(recipient_id=rng.choice(data['staff'])).mark_read()
+
+
+# (name, weight, operation)
+OPERATIONS = [
+    ('send_message', 4, send_message),
+    ('add_prescription', 3, add_prescription),
+    ('add_patient', 1, add_patient),
+    ('read_conversation', 2, read_conversation),
+]
+
+
+def workload_data():
+    return {
+        'patients': list(Patient.objects.values('id', 'user_id')),
+        'doctors': list(User.objects.filter(groups__name='Doctors').values_list('id', flat=True)),
+        'staff': list(User.objects.filter(groups__name='Staff').values_list('id', flat=True)),
+        'medicines': list(Medicine.objects.values_list('id', flat=True)),
+    }
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+# ------------------------------
+# Runner
+# ------------------------------
+
+def run_profile(options, data, workers, seconds, seed=42):
+    """Hammer the database from ``workers`` threads for ``seconds`` with ``options``."""
+    connection.close()
+    connection.settings_dict['OPTIONS'] = options
+    connection.ensure_connection()  # applies the journal mode before the threads start
+    connection.close()
+
+    names = [name for name, _, _ in OPERATIONS]
+    weights = [weight for _, weight, _ in OPERATIONS]
+    operations = {name: operation for name, _, operation in OPERATIONS}
+    latencies = []
+    lock_errors = Counter()
+    other_errors = Counter()
+    deadline = time.perf_counter() + seconds
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        try:
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    operations[name](rng, data)
+                except OperationalError as exc:
+                    (lock_errors if is_lock_error(exc) else other_errors)[name] += 1
+                else:
+                    latencies.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'operations': len(latencies),
+        'per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'lock_errors': sum(lock_errors.values()),
+        'lock_errors_by_operation': dict(lock_errors),
+        'other_errors': sum(other_errors.values()),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent writers against a throwaway SQLite file, with Django's default settings and then "
+        "with the configured OPTIONS plus WAL, and compare throughput and lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--patients', type=int, default=200, help="Patients to seed before writing.")
+        parser.add_argument('--output', default='bench_writes.json')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_writes measures SQLite locking; the default database is not SQLite.")
+        configured = dict(connection.settings_dict.get('OPTIONS', {}))
+        # The throwaway file always gets the deployment profile, WAL included.
+        pragmas = {**settings.SQLITE_WAL_PRAGMAS, **settings.SQLITE_PRAGMAS}
+        tuned = {**configured, 'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items())}
+        profiles = {'default': BASELINE_OPTIONS, 'tuned': tuned}
+
+        # Threads need a database file they can all open; the usual in-memory
+        # test database is private to one connection.
+        directory = tempfile.mkdtemp(prefix='bench_writes')
+        connection.settings_dict['TEST']['NAME'] = str(Path(directory) / 'bench.sqlite3')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command('seed_medsys', patients=options['patients'], stdout=StringIO())
+            data = workload_data()
+            results = {
+                name: run_profile(profile, data, options['workers'], options['seconds'])
+                for name, profile in profiles.items()
+            }
+        finally:
+            connection.settings_dict['OPTIONS'] = configured
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        with open(options['output'], 'w') as fh:
+            json.dump({'workers': options['workers'], 'seconds': options['seconds'], 'profiles': profiles, 'results': results}, fh, indent=2)
+
+        self.stdout.write(f"{'profile':<8} {'ops':>7} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'lock errors':>12}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<8} {result['operations']:>7} {result['per_second']:>8.1f} {result['p50_ms'] or 0:>8.2f} "
+                f"{result['p95_ms'] or 0:>8.2f} {result['lock_errors']:>12}"
+            )
+        baseline = results['default']['per_second']
+        if baseline:
+            self.stdout.write(f"Throughput: {results['tuned']['per_second'] / baseline:.2f}x the default settings.")
+        self.stdout.write(f"Report written to {options['output']}")
+        if results['tuned']['lock_errors']:
+            raise CommandError(f"{results['tuned']['lock_errors']} lock error(s) with the configured settings.")
@@ -0,0 +1,15 @@
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .roles import get_roles
+
+
+class RoleMiddleware(MiddlewareMixin):
+    """Attach ``request.roles``, resolved at most once per request.
+
+    MiddlewareMixin keeps this usable under ASGI without forcing async views
+    onto a thread. Async views must resolve roles with sync_to_async.
+    """
+
+    def process_request(self, request):
+        request.roles = SimpleLazyObject(lambda: get_roles(request))
@@ -0,0 +1,98 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import F, Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+
+PAGE_SIZE = 25
+
+
+# ------------------------------
+# Keyset (cursor) Pagination
+# ------------------------------
+
+def encode_cursor(value, pk):
+    if value is not None:
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (None if value is None else field.to_python(value)), int(pk)
+    except (binascii.Error, ValueError, TypeError, ValidationError):
+        raise BadRequest("Invalid cursor.")
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, next_url):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.next_url = next_url
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def keyset_paginate(request, queryset, key, param='cursor', page_size=PAGE_SIZE):
+    """Newest-first page of ``queryset`` ordered by ``(key, pk)``.
+
+    The cursor is the last row's key and primary key, so each page is an index
+    range read whose cost does not depend on how far the user has scrolled.
+    """
+    field = queryset.model._meta.get_field(key)
+    queryset = queryset.order_by(F(key).desc(nulls_last=True), '-pk')
+
+    cursor = request.GET.get(param)
+    if not cursor:
+        rows = list(queryset[:page_size + 1])
+    else:
+        value, pk = decode_cursor(cursor, field)
+        nulls = queryset.filter(**{f'{key}__isnull': True})
+        if value is None:
+            rows = list(nulls.filter(pk__lt=pk)[:page_size + 1])
+        else:
+            # key <= value keeps the predicate an index range; the tie-break on
+            # pk only applies within equal keys.
+            after = Q(**{f'{key}__lte': value}) & (Q(**{f'{key}__lt': value}) | Q(pk__lt=pk))
+            rows = list(queryset.filter(after)[:page_size + 1])
+            # NULL keys sort last; read them separately so both reads stay ranges.
+            if field.null and len(rows) <= page_size:
+                rows += list(nulls[:page_size + 1 - len(rows)])
+
+    next_cursor = next_url = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(getattr(rows[-1], key), rows[-1].pk)
+        params = request.GET.copy()
+        params[param] = next_cursor
+        params.pop('format', None)
+        next_url = f'{request.path}?{params.urlencode()}'
+    return KeysetPage(rows, next_cursor, next_url)
+
+
+# ------------------------------
+# "Load more" Fragments
+# ------------------------------
+
+def wants_fragment(request):
+    return request.GET.get('format') == 'json'
+
+
+def fragment_response(request, template_name, page, context=None):
+    html = render_to_string(template_name, {**(context or {}), 'page': page}, request=request)
+    return JsonResponse({'html': html, 'next': page.next_url})
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.urls import reverse
+
+# Events buffered per connection before it is considered stalled and dropped.
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.closed = False
+
+    def deliver(self, event):
+        # Runs on the subscriber's loop; a full queue means the client has
+        # stopped reading, so close it rather than buffer without bound.
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close()
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout=None):
+        """Next event, ``None`` once closed; raises TimeoutError when idle."""
+        if self.closed and self.queue.empty():
+            return None
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class Broker:
+    """In-process fan-out of events to the connections of one user.
+
+    Idle subscribers cost one queue each and no database work. ``publish`` is
+    safe to call from any thread, e.g. a request thread committing a save.
+    Events only reach connections served by the same process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down.
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+broker = Broker()
+
+
+# ------------------------------
+# Message Events
+# ------------------------------
+
+def message_event(message):
+    sender = message.sender
+    return {
+        'id': message.id,
+        'sender': sender.id,
+        'sender_name': sender.get_full_name() or sender.username,
+        'subject': message.subject,
+        'timestamp': message.timestamp.isoformat(),
+        'url': reverse('staff_conversation', args=[sender.id]),
+    }
+
+
+def format_event(event, name='message'):
+    return f"id: {event['id']}\nevent: {name}\ndata: {json.dumps(event)}\n\n"
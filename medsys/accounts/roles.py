@@ -0,0 +1,127 @@
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.shortcuts import resolve_url
+
+DOCTORS = 'Doctors'
+STAFF = 'Staff'
+PATIENTS = 'Patients'
+
+SESSION_KEY = '_medsys_roles'
+
+
+# ------------------------------
+# Role Resolution
+# ------------------------------
+
+def _version_key(user_id):
+    return f'accounts:roles:{user_id}'
+
+
+def invalidate_roles(*user_ids):
+    # Sessions compare their stored version with this one, so any change
+    # forces a reload on the next request in every worker.
+    cache.set_many({_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, timeout=None)
+
+
+def current_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Never set or evicted: start a fresh version, which no session holds.
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key)
+    return version
+
+
+class Roles:
+    def __init__(self, groups=(), is_superuser=False, patient_id=None):
+        self.groups = frozenset(groups)
+        self.is_superuser = is_superuser
+        self.patient_id = patient_id
+
+    @property
+    def is_doctor(self):
+        return DOCTORS in self.groups
+
+    @property
+    def is_staff(self):
+        return STAFF in self.groups
+
+    @property
+    def is_patient(self):
+        return PATIENTS in self.groups
+
+    def has_any(self, *groups):
+        return not self.groups.isdisjoint(groups)
+
+    def to_session(self, user_id, version):
+        return {
+            'user_id': user_id,
+            'version': version,
+            'groups': sorted(self.groups),
+            'is_superuser': self.is_superuser,
+            'patient_id': self.patient_id,
+        }
+
+    @classmethod
+    def from_session(cls, data):
+        return cls(data['groups'], data['is_superuser'], data['patient_id'])
+
+
+ANONYMOUS = Roles()
+
+
+def load_roles(user):
+    # One query for groups, superuser flag and the linked Patient row.
+    rows = User.objects.filter(pk=user.pk).values_list('is_superuser', 'groups__name', 'patient_user__id')
+    groups = set()
+    is_superuser = False
+    patient_id = None
+    for superuser, group, patient in rows:
+        is_superuser = superuser
+        patient_id = patient
+        if group:
+            groups.add(group)
+    return Roles(groups, is_superuser, patient_id)
+
+
+def get_roles(request):
+    user = request.user
+    if not user.is_authenticated:
+        return ANONYMOUS
+
+    version = current_version(user.pk)
+    data = request.session.get(SESSION_KEY)
+    if data and data.get('user_id') == user.pk and data.get('version') == version:
+        return Roles.from_session(data)
+
+    roles = load_roles(user)
+    request.session[SESSION_KEY] = roles.to_session(user.pk, version)
+    return roles
+
+
+# ------------------------------
+# Decorators
+# ------------------------------
+
+def role_required(*groups, login_url=None):
+    """Replacement for user_passes_test that reads the cached roles."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.roles.has_any(*groups):
+                return view_func(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), resolve_url(login_url or settings.LOGIN_URL))
+        return _wrapped_view
+    return decorator
+
+
+doctor_required = role_required(DOCTORS)
+staff_required = role_required(STAFF)
+patient_required = role_required(PATIENTS)
@@ -0,0 +1,158 @@
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from medapp.interactions import alerts_changed
+from medapp.models import (
+    AdmissionRecord, Bed, Interaction, InteractionAlert, Medicine, Message, Patient, PatientMedicalHistory, Prescription, Room, Ward,
+)
+
+from .fragments import clear as clear_fragments, doctor_key, invalidate, patient_key, staff_key
+from .pubsub import broker, message_event
+from .roles import invalidate_roles
+
+
+# ------------------------------
+# Role Cache Invalidation
+# ------------------------------
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_roles(instance.pk)
+    elif action == 'pre_clear':
+        invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+    else:
+        invalidate_roles(*pk_set)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    # login() saves last_login on every sign-in; only is_superuser matters here.
+    if created or (update_fields and 'is_superuser' not in update_fields):
+        return
+    invalidate_roles(instance.pk)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def patient_changed(sender, instance, **kwargs):
+    invalidate_roles(instance.user_id)
+
+
+# ------------------------------
+# Dashboard Fragment Invalidation
+# ------------------------------
+
+# Foreign keys whose rendered pages embed each model's rows.
+FRAGMENT_OWNERS = {
+    PatientMedicalHistory: {'patient_id': patient_key},
+    AdmissionRecord: {'patient_id': patient_key, 'primary_doctor_id': doctor_key, 'assistant_doctor_id': staff_key},
+    Prescription: {'patient_id': patient_key, 'assistant_doctor_id': staff_key},
+    Patient: {'id': patient_key},
+    InteractionAlert: {'patient_id': patient_key},
+}
+
+
+def owner_keys(owners, values):
+    return {make_key(values[field]) for field, make_key in owners.items() if values[field] is not None}
+
+
+def record_pre_save(sender, instance, raw, **kwargs):
+    # Remember the old owners so a reassigned row also leaves their pages.
+    owners = FRAGMENT_OWNERS[sender]
+    instance._fragment_keys = set()
+    if instance.pk and not raw:
+        old = sender.objects.filter(pk=instance.pk).values(*owners).first()
+        if old:
+            instance._fragment_keys = owner_keys(owners, old)
+
+
+def record_changed(sender, instance, **kwargs):
+    keys = owner_keys(FRAGMENT_OWNERS[sender], instance.__dict__)
+    invalidate(*keys | getattr(instance, '_fragment_keys', set()))
+
+
+for model in FRAGMENT_OWNERS:
+    pre_save.connect(record_pre_save, sender=model, dispatch_uid=f'fragments_pre_save_{model.__name__}')
+    post_save.connect(record_changed, sender=model, dispatch_uid=f'fragments_post_save_{model.__name__}')
+    post_delete.connect(record_changed, sender=model, dispatch_uid=f'fragments_post_delete_{model.__name__}')
+
+
+def prescription_keys(prescriptions):
+    keys = set()
+    for patient_id, staff_id in prescriptions.values_list('patient_id', 'assistant_doctor_id').distinct():
+        keys.update(owner_keys(FRAGMENT_OWNERS[Prescription], {'patient_id': patient_id, 'assistant_doctor_id': staff_id}))
+    return keys
+
+
+@receiver(post_save, sender=User)
+def user_name_changed(sender, instance, created, update_fields, **kwargs):
+    # Names appear on the patient's own page, on the dashboards of clinicians
+    # treating them, and on patient pages where the user is the clinician.
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    user_id = instance.pk
+    admissions = AdmissionRecord.objects.filter(
+        Q(patient__user_id=user_id) | Q(assistant_doctor_id=user_id)
+    ).values('patient_id', 'primary_doctor_id', 'assistant_doctor_id')
+    keys = set()
+    for admission in admissions:
+        keys |= owner_keys(FRAGMENT_OWNERS[AdmissionRecord], admission)
+    keys |= prescription_keys(Prescription.objects.filter(Q(patient__user_id=user_id) | Q(assistant_doctor_id=user_id)))
+    keys.update(patient_key(patient_id) for patient_id in Patient.objects.filter(user_id=user_id).values_list('id', flat=True))
+    invalidate(*keys)
+    # The exported Patient resource and the JSON API carry the name, so the
+    # rows showing it move on: re-exported, and given a new ETag.
+    now = timezone.now()
+    Patient.objects.filter(user_id=user_id).update(updated_at=now)
+    Message.objects.filter(sender_id=user_id).update(updated_at=now)
+
+
+@receiver(post_save, sender=Medicine)
+def medicine_changed(sender, instance, created, **kwargs):
+    if not created:
+        invalidate(*prescription_keys(Prescription.objects.filter(medicine_id=instance.pk)))
+
+
+@receiver(post_save, sender=Interaction)
+def interaction_changed(sender, instance, created, **kwargs):
+    if not created:
+        patients = instance.alerts.values_list('patient_id', flat=True).distinct()
+        invalidate(*(patient_key(patient_id) for patient_id in patients))
+
+
+@receiver(alerts_changed)
+def interaction_alerts_changed(sender, patient_ids, **kwargs):
+    # Alerts are written with bulk_create, which sends no post_save.
+    invalidate(*(patient_key(patient_id) for patient_id in patient_ids))
+
+
+@receiver(post_save, sender=Ward)
+@receiver(post_save, sender=Room)
+@receiver(post_save, sender=Bed)
+def bed_layout_changed(sender, instance, created, **kwargs):
+    # Bed names appear on every admission; renames are rare admin edits.
+    if not created:
+        clear_fragments()
+
+
+# ------------------------------
+# Live Message Delivery
+# ------------------------------
+
+@receiver(post_save, sender=Message)
+def message_sent(sender, instance, created, **kwargs):
+    if created:
+        event = message_event(instance)
+        transaction.on_commit(lambda: broker.publish(instance.recipient_id, event))
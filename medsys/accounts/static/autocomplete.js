@@ -0,0 +1,40 @@
+// Search boxes rendered by medapp.widgets.AutocompleteWidget.
+document.addEventListener('DOMContentLoaded', function () {
+  document.querySelectorAll('.autocomplete').forEach(function (box) {
+    var hidden = box.querySelector('input[type=hidden]');
+    var input = box.querySelector('input[type=search]');
+    var results = box.querySelector('.autocomplete-results');
+    var timer = null;
+
+    function choose(item) {
+      hidden.value = item.id;
+      input.value = item.label;
+      results.innerHTML = '';
+    }
+
+    input.addEventListener('input', function () {
+      hidden.value = '';
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        if (!input.value.trim()) {
+          results.innerHTML = '';
+          return;
+        }
+        var url = box.dataset.url + (box.dataset.url.indexOf('?') < 0 ? '?' : '&');
+        fetch(url + 'q=' + encodeURIComponent(input.value), {credentials: 'same-origin'})
+          .then(function (response) { return response.json(); })
+          .then(function (data) {
+            results.innerHTML = '';
+            data.results.forEach(function (item) {
+              var option = document.createElement('button');
+              option.type = 'button';
+              option.className = 'list-group-item list-group-item-action';
+              option.textContent = item.label;
+              option.addEventListener('click', function () { choose(item); });
+              results.appendChild(option);
+            });
+          });
+      }, 200);
+    });
+  });
+});
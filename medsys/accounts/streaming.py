@@ -0,0 +1,41 @@
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+SLOT = '<!--medsys:stream-->'
+
+
+def render_around(template_name, context, slot, chunks, request=None):
+    """Yield ``template_name`` with the ``slot`` variable filled from ``chunks``.
+
+    The template around the slot is rendered once and split, so its head is
+    available immediately and each chunk as soon as it has been produced.
+    """
+    html = render_to_string(template_name, {**context, slot: mark_safe(SLOT)}, request=request)
+    head, tail = html.split(SLOT, 1)
+    yield head
+    yield from chunks
+    yield tail
+
+
+def stream_template(request, template_name, context, slot, chunks):
+    content = render_around(template_name, context, slot, chunks, request=request)
+    return StreamingHttpResponse(content, content_type='text/html; charset=utf-8')
+
+
+def accepts_gzip(request):
+    """Whether the Accept-Encoding header allows gzip, honouring q-values."""
+    qvalues = {}
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            qvalues[coding.lower()] = q
+    return qvalues.get('gzip', qvalues.get('*', 0.0)) > 0
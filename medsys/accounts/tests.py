@@ -1,3 +1,770 @@
-from django.test import TestCase
+import asyncio
+import csv
+import os
+import re
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from medapp import importer
+from medapp.interactions import scan_all
+from medapp.models import AdmissionRecord, Interaction, Medicine, MedicineCategory, Message, Patient, PatientMedicalHistory, Prescription, UnreadCounter
+
+from .fragments import cached_fragment, clear as clear_fragments, invalidate, patient_key, stats as fragment_stats
+from .pubsub import Broker
+from .roles import SESSION_KEY
+
 
 # Create your tests here.
+
+class RoleResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = Group.objects.create(name='Doctors')
+        cls.staff = Group.objects.create(name='Staff')
+        cls.patients = Group.objects.create(name='Patients')
+        cls.doctor = User.objects.create_user('doc', password='pw')
+        cls.doctor.groups.add(cls.doctors)
+        cls.patient_user = User.objects.create_user('pat', password='pw')
+        cls.patient_user.groups.add(cls.patients)
+        cls.patient = Patient.objects.create(user=cls.patient_user, gender='F', blood_group='O+')
+
+    def test_login_redirects_by_role(self):
+        response = self.client.post('/accounts/login/', {'username': 'pat', 'password': 'pw'})
+        self.assertRedirects(response, reverse('patient_dashboard', args=[self.patient.id]), fetch_redirect_response=False)
+        self.assertEqual(self.client.session[SESSION_KEY]['patient_id'], self.patient.id)
+
+    def test_role_checks_use_session_cache(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('after_login_redirect'))
+        # Session + user lookups only; no group queries once roles are cached.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('after_login_redirect'))
+        self.assertRedirects(response, reverse('doctor_dashboard'), fetch_redirect_response=False)
+
+    def test_group_change_invalidates_cached_roles(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('after_login_redirect'))
+        self.doctor.groups.remove(self.doctors)
+        response = self.client.get(reverse('doctor_dashboard'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith('/accounts/login/'))
+
+        self.staff.user_set.add(self.doctor)
+        response = self.client.get(reverse('after_login_redirect'))
+        self.assertRedirects(response, reverse('staff_dashboard'), fetch_redirect_response=False)
+
+    def test_missing_version_reloads_roles(self):
+        # A worker that never saw the version, or evicted it, must not trust
+        # the session: remove the group without signals and drop the version.
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.client.get(reverse('doctor_dashboard')).status_code, 200)
+        User.groups.through.objects.filter(user=self.doctor).delete()
+        cache.delete(f'accounts:roles:{self.doctor.pk}')
+        self.assertEqual(self.client.get(reverse('doctor_dashboard')).status_code, 302)
+
+    def test_patient_cannot_view_other_patient(self):
+        other = Patient.objects.create(user=User.objects.create_user('other'), gender='M', blood_group='A+')
+        self.client.force_login(self.patient_user)
+        response = self.client.get(reverse('patient_dashboard', args=[other.id]))
+        self.assertEqual(response.status_code, 403)
+
+
+# ------------------------------
+# Query Plan Regression
+# ------------------------------
+
+# Tables a view deliberately reads in full. Pickers for large tables use
+# AutocompleteWidget instead of listing every row.
+EXPECTED_SCANS = {
+    # Substring matches on names cannot use an index; the result is limited.
+    'patient_search': {'medapp_patient'},
+    # One stock row per medicine, compared against its own reorder level.
+    'low_stock_report': {'medapp_medicinestock'},
+    # Open admissions overlap any window, so there is no lower bound to seek to.
+    'staff_report': {'medapp_admissionrecord'},
+    # A bulk export without _since is every row by definition.
+    'fhir_export': {
+        'medapp_patient', 'medapp_patientmedicalhistory', 'medapp_admissionrecord', 'medapp_prescription',
+    },
+}
+
+SCAN_RE = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_medsys', patients=60, doctors=3, staff=3, medicines=40, stdout=StringIO())
+        cls.patient = Patient.objects.filter(
+            medical_histories__isnull=False, admissions__isnull=False,
+        ).select_related('user').first()
+        admission = AdmissionRecord.objects.filter(patient=cls.patient).last()
+        cls.doctor = admission.primary_doctor
+        cls.staff = admission.assistant_doctor
+        cls.sender_id = Message.objects.filter(recipient=cls.staff).values_list('sender_id', flat=True).first()
+        cls.admission_id = admission.id
+        cls.medicine = Medicine.objects.values_list('name', flat=True).first()
+        cls.admin = User.objects.create_superuser('admin')
+
+    def setUp(self):
+        clear_fragments()
+
+    def view_urls(self):
+        patient_id = self.patient.id
+        # Later views are appended in the order they were added.
+        return [
+            (self.doctor, 'doctor_dashboard', reverse('doctor_dashboard')),
+            (self.doctor, 'add_patient', reverse('add_patient')),
+            (self.doctor, 'edit_patient', reverse('edit_patient', args=[patient_id])),
+            (self.doctor, 'patient_dashboard', reverse('patient_dashboard', args=[patient_id])),
+            (self.staff, 'staff_dashboard', reverse('staff_dashboard')),
+            (self.staff, 'staff_patient_prescriptions', reverse('staff_patient_prescriptions', args=[patient_id])),
+            (self.staff, 'staff_inbox', reverse('staff_inbox')),
+            (self.staff, 'staff_conversation', reverse('staff_conversation', args=[self.sender_id])),
+            (self.staff, 'add_prescription', reverse('add_prescription')),
+            (self.staff, 'ward_round', reverse('ward_round')),
+            (self.patient.user, 'patient_dashboard', reverse('patient_dashboard', args=[patient_id])),
+            (self.patient.user, 'send_message', reverse('send_message')),
+            (self.doctor, 'bed_search', reverse('bed_search') + '?q=a'),
+            (self.staff, 'medicine_search', reverse('medicine_search') + f'?q={self.medicine[:4]}'),
+            (self.staff, 'patient_search', reverse('patient_search') + f'?q={self.patient.user.last_name}'),
+            (self.doctor, 'staff_search', reverse('staff_search') + f'?q={self.staff.last_name}'),
+            (self.staff, 'low_stock_report', reverse('low_stock_report')),
+            (self.staff, 'staff_report', reverse('staff_report')),
+            (self.patient.user, 'admission_invoice', reverse('admission_invoice', args=[self.admission_id])),
+            (self.admin, 'fhir_export', reverse('fhir_export')),
+            (self.patient.user, 'api_patient_summary', reverse('api_patient_summary', args=[patient_id])),
+            (self.doctor, 'api_doctor_admissions', reverse('api_doctor_admissions')),
+            (self.staff, 'api_staff_prescriptions', reverse('api_staff_prescriptions')),
+            (self.staff, 'api_inbox', reverse('api_inbox')),
+        ]
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT name FROM sqlite_master WHERE type = %s AND sql LIKE %s', ['index', '% WHERE %'])
+            partial_indexes = {row[0] for row in cursor.fetchall()}
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+        scans = set()
+        for detail in plan:
+            match = SCAN_RE.match(detail)
+            if match and match.group(2) not in partial_indexes:
+                scans.add(match.group(1))
+        return scans
+
+    def test_views_avoid_full_table_scans(self):
+        for user, name, url in self.view_urls():
+            self.client.force_login(user)
+            with self.subTest(view=name, user=user.username):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, 200)
+                for query in ctx.captured_queries:
+                    sql = query['sql']
+                    if not sql.startswith('SELECT'):
+                        continue
+                    # captured_queries holds interpolated SQL; re-run it as-is.
+                    scans = self.full_scans(sql) - EXPECTED_SCANS.get(name, set())
+                    self.assertFalse(scans, f'{name} scans {sorted(scans)}: {sql}')
+
+
+# ------------------------------
+# View Benchmark
+# ------------------------------
+
+class BenchViewsTests(TestCase):
+    def test_run_benchmark_reports_every_view(self):
+        from .management.commands.bench_views import VIEWS, over_budget, run_benchmark
+
+        results = run_benchmark([30], repeat=1)
+        self.assertEqual(len(results), len(VIEWS))
+        for result in results:
+            self.assertEqual(result['status'], 200, result)
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['warm_queries'], 0)
+        # Cold requests render the records rather than reading the fragment.
+        patient_page = next(r for r in results if r['view'] == 'patient_dashboard')
+        self.assertGreater(patient_page['queries'], patient_page['warm_queries'])
+        self.assertEqual(over_budget(results, {'send_message': 0}), [r for r in results if r['view'] == 'send_message'])
+
+
+# ------------------------------
+# Keyset Pagination
+# ------------------------------
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        staff = Group.objects.create(name='Staff')
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.groups.add(staff)
+        cls.sender = User.objects.create_user('sender')
+        Message.objects.bulk_create([
+            Message(sender=cls.sender, recipient=cls.staff, subject=f'Message {i}', body='...') for i in range(60)
+        ])
+
+    def test_cursor_walks_every_row_once(self):
+        self.client.force_login(self.staff)
+        seen = []
+        url = reverse('staff_conversation', args=[self.sender.id]) + '?format=json'
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(re.findall(r'Message (\d+)', data['html']))
+            url = data['next'] and data['next'] + '&format=json'
+        self.assertEqual(sorted(seen, key=int), [str(i) for i in range(60)])
+
+    def test_invalid_cursor_is_bad_request(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('staff_conversation', args=[self.sender.id]), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+# ------------------------------
+# Inbox Conversations
+# ------------------------------
+
+class InboxConversationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.groups.add(Group.objects.create(name='Staff'))
+        cls.alice = User.objects.create_user('alice', first_name='Alice')
+        cls.bob = User.objects.create_user('bob', first_name='Bob')
+        Message.objects.create(sender=cls.alice, recipient=cls.staff, subject='First', body='.', is_read=True)
+        Message.objects.create(sender=cls.alice, recipient=cls.staff, subject='Second', body='.')
+        Message.objects.create(sender=cls.bob, recipient=cls.staff, subject='Hi', body='.')
+
+    def test_summary_is_one_row_per_sender(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('staff_inbox'))
+        # Session, user, conversation summary and the unread badge.
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('staff_inbox'))
+        summary = {c['sender_username']: c for c in response.context['conversations']}
+        self.assertEqual(summary['alice']['total'], 2)
+        self.assertEqual(summary['alice']['unread'], 1)
+        self.assertEqual(summary['alice']['last_subject'], 'Second')
+        self.assertEqual(summary['bob']['unread'], 1)
+
+    def test_mark_conversation_read(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('mark_conversation_read', args=[self.alice.id]))
+        self.assertRedirects(response, reverse('staff_conversation', args=[self.alice.id]))
+        self.assertFalse(Message.objects.filter(sender=self.alice, is_read=False).exists())
+        self.assertTrue(Message.objects.filter(sender=self.bob, is_read=False).exists())
+        self.assertEqual(UnreadCounter.for_user(self.staff.id), 1)
+
+    def test_unread_badge_reads_counter_not_messages(self):
+        self.client.force_login(self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('staff_inbox'))
+        self.assertContains(response, 'Inbox <span class="badge bg-primary">2</span>', html=False)
+        counter_queries = [q['sql'] for q in ctx.captured_queries if 'medapp_unreadcounter' in q['sql']]
+        self.assertEqual(len(counter_queries), 1)
+        self.assertNotIn('medapp_message', counter_queries[0])
+
+
+# ------------------------------
+# Staff Dashboard
+# ------------------------------
+
+class StaffDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.groups.add(Group.objects.create(name='Staff'))
+        medicine = Medicine.objects.create(
+            name='Ibuprofen', category=MedicineCategory.objects.create(name='Tablets'), unit_price=2,
+        )
+        for i in range(3):
+            user = User.objects.create_user(f'patient{i}', first_name='Patient', last_name=str(i))
+            patient = Patient.objects.create(user=user, gender='F', blood_group='O+')
+            Prescription.objects.bulk_create([
+                Prescription(patient=patient, assistant_doctor=cls.staff, medicine=medicine) for _ in range(i + 1)
+            ])
+
+    def setUp(self):
+        clear_fragments()
+
+    def render(self):
+        response = self.client.get(reverse('staff_dashboard'))
+        return b''.join(response.streaming_content).decode()
+
+    def test_groups_prescriptions_per_patient(self):
+        self.client.force_login(self.staff)
+        html = self.render()
+        for i in range(3):
+            self.assertEqual(html.count(f'Patient {i} ({i + 1} prescriptions)'), 1)
+
+    def test_groups_load_prescriptions_on_demand(self):
+        self.client.force_login(self.staff)
+        html = self.render()
+        self.assertNotIn('Ibuprofen', html)
+        patient = Patient.objects.get(user__username='patient2')
+        url = reverse('staff_patient_prescriptions', args=[patient.id])
+        self.assertIn(url, html)
+        with self.assertNumQueries(3):
+            data = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual(data['html'].count('Ibuprofen'), 3)
+        self.assertIsNone(data['next'])
+        # Only the signed-in staff member's prescriptions.
+        other = User.objects.create_user('other')
+        other.groups.add(Group.objects.get(name='Staff'))
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url, {'format': 'json'}).json()['html'].strip(), '')
+
+    def test_query_count_does_not_grow_with_patients(self):
+        self.client.force_login(self.staff)
+        self.render()
+        clear_fragments()
+        with self.assertNumQueries(5):
+            self.render()
+
+
+# ------------------------------
+# Dashboard Fragment Cache
+# ------------------------------
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('doc', first_name='Greg')
+        cls.doctor.groups.add(Group.objects.create(name='Doctors'))
+        cls.other_doctor = User.objects.create_user('doc2')
+        cls.other_doctor.groups.add(Group.objects.get(name='Doctors'))
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.groups.add(Group.objects.create(name='Staff'))
+        cls.patient_user = User.objects.create_user('pat', first_name='Pat', last_name='Smith')
+        cls.patient_user.groups.add(Group.objects.create(name='Patients'))
+        cls.patient = Patient.objects.create(user=cls.patient_user, gender='F', blood_group='O+')
+        cls.admission = AdmissionRecord.objects.create(
+            patient=cls.patient, primary_doctor=cls.doctor, assistant_doctor=cls.staff,
+            admission_reason='Asthma', admission_date=timezone.now(),
+        )
+        cls.medicine = Medicine.objects.create(
+            name='Ibuprofen', category=MedicineCategory.objects.create(name='Tablets'), unit_price=2,
+        )
+
+    def setUp(self):
+        clear_fragments()
+        fragment_stats.reset()
+
+    def patient_page(self):
+        return self.client.get(reverse('patient_dashboard', args=[self.patient.id])).content.decode()
+
+    def test_repeat_view_only_queries_auth(self):
+        self.client.force_login(self.patient_user)
+        self.patient_page()
+        # Session + user lookups only.
+        with self.assertNumQueries(2):
+            self.patient_page()
+        self.assertEqual(fragment_stats.as_dict()['hits'], 1)
+
+    def test_saving_record_invalidates_patient_and_staff_pages(self):
+        self.client.force_login(self.patient_user)
+        self.assertNotIn('Ibuprofen', self.patient_page())
+        Prescription.objects.create(patient=self.patient, assistant_doctor=self.staff, medicine=self.medicine)
+        self.assertIn('Ibuprofen', self.patient_page())
+
+        self.medicine.name = 'Paracetamol'
+        self.medicine.save()
+        self.assertIn('Paracetamol', self.patient_page())
+
+        self.client.force_login(self.staff)
+        staff_page = lambda: b''.join(self.client.get(reverse('staff_dashboard')).streaming_content).decode()
+        self.assertIn('Pat Smith (1 prescriptions)', staff_page())
+        Prescription.objects.create(patient=self.patient, assistant_doctor=self.staff, medicine=self.medicine)
+        self.assertIn('Pat Smith (2 prescriptions)', staff_page())
+
+    def test_reassigned_admission_leaves_old_doctor_page(self):
+        self.client.force_login(self.doctor)
+        self.assertContains(self.client.get(reverse('doctor_dashboard')), 'Pat Smith')
+        self.admission.primary_doctor = self.other_doctor
+        self.admission.save()
+        self.assertNotContains(self.client.get(reverse('doctor_dashboard')), 'Pat Smith')
+
+    def test_patient_rename_invalidates_doctor_page(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('doctor_dashboard'))
+        self.patient_user.first_name = 'Patricia'
+        self.patient_user.save()
+        self.assertContains(self.client.get(reverse('doctor_dashboard')), 'Patricia Smith')
+
+    def test_interaction_scan_invalidates_patient_page(self):
+        aspirin = Medicine.objects.create(name='Aspirin', category=self.medicine.category, unit_price=1)
+        for medicine in (self.medicine, aspirin):
+            Prescription.objects.create(patient=self.patient, assistant_doctor=self.staff, medicine=medicine)
+        self.client.force_login(self.patient_user)
+        self.assertNotIn('Interaction Warnings', self.patient_page())
+        Interaction.objects.create(medicine_a=self.medicine, medicine_b=aspirin, severity=3)
+        self.assertEqual(scan_all().alerts, 1)
+        self.assertIn('Interaction Warnings', self.patient_page())
+
+    def test_render_interrupted_by_invalidation_is_not_served(self):
+        key = patient_key(self.patient.id)
+
+        def render():
+            # A save lands while the stale page is still being rendered.
+            invalidate(key)
+            return 'stale'
+
+        self.assertEqual(cached_fragment(key, render), 'stale')
+        self.assertEqual(cached_fragment(key, lambda: 'fresh'), 'fresh')
+        self.assertEqual(cached_fragment(key, lambda: 'again'), 'fresh')
+
+    def test_invalidation_from_another_worker_is_seen(self):
+        key = patient_key(self.patient.id)
+        cached_fragment(key, lambda: 'stale')
+        # Workers share only the generations, not each other's copies.
+        cache.delete(f'accounts:fragments:{key}')
+        self.assertEqual(cached_fragment(key, lambda: 'fresh'), 'fresh')
+
+    def test_stats_are_superuser_only(self):
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.client.get(reverse('fragment_cache_stats')).status_code, 403)
+        self.client.force_login(User.objects.create_superuser('admin'))
+        self.assertEqual(set(self.client.get(reverse('fragment_cache_stats')).json()), {'pid', 'hits', 'misses', 'invalidations', 'hit_rate'})
+
+
+# ------------------------------
+# Live Message Delivery
+# ------------------------------
+
+class BrokerTests(SimpleTestCase):
+    async def test_publish_from_other_thread_reaches_subscriber(self):
+        pubsub = Broker()
+        async with pubsub.subscribe(1) as subscription:
+            pubsub.subscribe(2)
+            thread = threading.Thread(target=pubsub.publish, args=(1, {'id': 7}))
+            thread.start()
+            thread.join()
+            self.assertEqual(await subscription.get(timeout=1), {'id': 7})
+            with self.assertRaises(TimeoutError):
+                await subscription.get(timeout=0.01)
+        self.assertEqual(pubsub.connection_count(), 1)
+
+    async def test_stalled_subscriber_is_dropped(self):
+        pubsub = Broker()
+        subscription = pubsub.subscribe(1)
+        for i in range(200):
+            pubsub.publish(1, {'id': i})
+        await asyncio.sleep(0)
+        self.assertEqual(pubsub.connection_count(), 0)
+        events = []
+        while (event := await subscription.get(timeout=1)) is not None:
+            events.append(event)
+        self.assertEqual(len(events), 99)
+
+
+class MessageStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.groups.add(Group.objects.create(name='Staff'))
+        cls.patient = User.objects.create_user('pat', first_name='Pat')
+
+    def send(self, subject):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(sender=self.patient, recipient=self.staff, subject=subject, body='.')
+
+    async def test_new_message_is_pushed(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('message_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        message = await sync_to_async(self.send)('Chest pain')
+        chunk = (await asyncio.wait_for(anext(stream), 1)).decode()
+        self.assertTrue(chunk.startswith(f'id: {message.id}\nevent: message\n'))
+        self.assertIn('Chest pain', chunk)
+        await stream.aclose()
+
+    async def test_reconnect_replays_missed_messages(self):
+        first = await sync_to_async(self.send)('First')
+        await sync_to_async(self.send)('Second')
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('message_stream'), headers={'Last-Event-ID': str(first.id)})
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        self.assertIn('Second', (await anext(stream)).decode())
+        await stream.aclose()
+
+    async def test_only_staff_can_subscribe(self):
+        await self.async_client.aforce_login(self.patient)
+        response = await self.async_client.get(reverse('message_stream'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_stream_is_disabled_under_wsgi(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('message_stream')).status_code, 204)
+
+
+# ------------------------------
+# Batch Prescriptions
+# ------------------------------
+
+class PrescriptionBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.groups.add(Group.objects.create(name='Staff'))
+        cls.patient = Patient.objects.create(user=User.objects.create_user('pat'), gender='F', blood_group='O+')
+        cls.stranger = Patient.objects.create(user=User.objects.create_user('other'), gender='M', blood_group='A+')
+        AdmissionRecord.objects.create(
+            patient=cls.patient, assistant_doctor=cls.staff, admission_reason='Asthma', admission_date=timezone.now(),
+        )
+        category = MedicineCategory.objects.create(name='Tablets')
+        cls.medicines = Medicine.objects.bulk_create([
+            Medicine(name=f'Medicine {i}', category=category, unit_price=1) for i in range(15)
+        ])
+
+    def lines(self):
+        return [{'medicine': m.id, 'dosage': '1 tablet', 'duration_days': 7} for m in self.medicines]
+
+    def post_json(self, payload):
+        return self.client.post(reverse('add_prescription_batch'), payload, content_type='application/json')
+
+    def test_json_batch_is_one_insert(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('add_prescription_batch'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post_json({'patient': self.patient.id, 'prescriptions': self.lines()})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['created']), 15)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "medapp_prescription"')]
+        self.assertEqual(len(inserts), 1)
+        # Session, user, medicines, patient, then the insert inside a
+        # savepoint and the interaction index version check.
+        self.assertEqual(len(ctx.captured_queries), 8)
+
+    def test_invalid_line_rejects_whole_batch(self):
+        self.client.force_login(self.staff)
+        lines = self.lines()
+        lines[3]['medicine'] = 0
+        response = self.post_json({'patient': self.patient.id, 'prescriptions': lines})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('medicine', response.json()['errors']['prescriptions'][3])
+        self.assertFalse(Prescription.objects.exists())
+
+        response = self.post_json({'patient': self.stranger.id, 'prescriptions': self.lines()})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['errors']['patient'])
+
+    def test_formset_post(self):
+        self.client.force_login(self.staff)
+        data = {'patient': self.patient.id, 'form-TOTAL_FORMS': 3, 'form-INITIAL_FORMS': 0}
+        for i in range(2):
+            data.update({f'form-{i}-medicine': self.medicines[i].id, f'form-{i}-dosage': '5 ml'})
+        # The third row is left blank and skipped.
+        data['form-2-dosage'] = '1'
+        response = self.client.post(reverse('add_prescription_batch'), data)
+        self.assertRedirects(response, reverse('staff_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(Prescription.objects.filter(patient=self.patient, assistant_doctor=self.staff).count(), 2)
+
+
+# ------------------------------
+# CSV Import
+# ------------------------------
+
+class ImportCsvTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w', newline='') as output:
+            csv.writer(output).writerows(rows)
+        return path
+
+    def read_csv(self, path):
+        with open(path, newline='') as source:
+            return list(csv.DictReader(source))
+
+    def run_import(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_csv', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_patients_skip_bad_rows_and_get_links(self):
+        User.objects.create_user('taken')
+        path = self.write_csv('patients.csv', [
+            ['username', 'email', 'first_name', 'last_name', 'date_of_birth', 'gender', 'blood_group', 'phone'],
+            ['ann', 'ann@example.com', 'Ann', 'Lee', '1980-02-03', 'F', 'a+', '555'],
+            ['taken', '', '', '', '', 'M', 'O+', ''],
+            ['bob', '', 'Bob', '', 'not a date', 'M', 'O+', ''],
+            ['cat', '', 'Cat', '', '', 'F', 'Z', ''],
+            ['dan', 'dan@example.com', 'Dan', '', '', 'M', 'B-', ''],
+            ['dan', '', '', '', '', 'M', 'B-', ''],
+        ])
+        errors, links = os.path.join(self.dir.name, 'errors.csv'), os.path.join(self.dir.name, 'links.csv')
+        out, _ = self.run_import('patients', path, '--chunk-size', '3', '--errors', errors, '--links', links)
+        self.assertIn('Imported 2 patients, skipped 4', out)
+
+        self.assertEqual([row['line'] for row in self.read_csv(errors)], ['3', '4', '5', '7'])
+        ann = Patient.objects.select_related('user').get(user__username='ann')
+        self.assertEqual((ann.blood_group, ann.user.email, str(ann.date_of_birth)), ('A+', 'ann@example.com', '1980-02-03'))
+        self.assertFalse(ann.user.has_usable_password())
+        self.assertTrue(ann.user.groups.filter(name='Patients').exists())
+
+        rows = self.read_csv(links)
+        self.assertEqual([row['username'] for row in rows], ['ann', 'dan'])
+        response = self.client.get(rows[0]['link'].removeprefix('http://localhost:8000'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('set-password', response.url)
+
+    def test_username_taken_during_the_chunk_only_skips_that_row(self):
+        path = self.write_csv('patients.csv', [
+            ['username', 'email', 'gender', 'blood_group'],
+            ['zoë', 'zoe@example.com', 'F', 'A+'],
+            ['ann', '', 'F', 'O+'],
+            ['bob', '', 'M', 'B+'],
+        ])
+        real_reject = importer.reject
+
+        def reject_then_race(*args):
+            # Another worker creates 'ann' after the taken-usernames check.
+            User.objects.get_or_create(username='ann')
+            return real_reject(*args)
+
+        links = os.path.join(self.dir.name, 'links.csv')
+        with mock.patch.object(importer, 'reject', side_effect=reject_then_race):
+            out, err = self.run_import('patients', path, '--links', links)
+        self.assertIn('Imported 2 patients, skipped 1', out)
+        self.assertIn("line 3: username 'ann' already exists.", err)
+        self.assertEqual(sorted(Patient.objects.values_list('user__username', flat=True)), ['bob', 'zoë'])
+        with open(links, newline='', encoding='utf-8') as source:
+            self.assertEqual([row['username'] for row in csv.DictReader(source)], ['zoë', 'bob'])
+
+    def test_medicines_create_categories_once(self):
+        MedicineCategory.objects.create(name='Tablets')
+        path = self.write_csv('medicines.csv', [
+            ['name', 'category', 'unit_price', 'active'],
+            ['Aspirin', 'Tablets', '0.50', 'yes'],
+            ['Saline', 'Fluids', '3', 'no'],
+            ['Aspirin', 'Tablets', '0.60', ''],
+            ['Ibuprofen', 'Tablets', '0.125', ''],
+        ])
+        out, err = self.run_import('medicines', path)
+        self.assertIn('Imported 2 medicines, skipped 2', out)
+        self.assertIn('line 4:', err)
+        self.assertIn('line 5: unit_price', err)
+        self.assertEqual(MedicineCategory.objects.count(), 2)
+        self.assertFalse(Medicine.objects.get(name='Saline').active)
+
+    def test_histories_resolve_patients(self):
+        patient = Patient.objects.create(user=User.objects.create_user('pat'), gender='F', blood_group='O+')
+        cached_fragment(patient_key(patient.id), lambda: 'stale')
+        path = self.write_csv('histories.csv', [
+            ['patient', 'condition_name', 'diagnosis_date', 'status', 'notes'],
+            ['pat', 'Asthma', '2020-01-01', 'Chronic', ''],
+            ['nobody', 'Asthma', '2020-01-01', '', ''],
+            ['pat', 'Flu', '2999-01-01', '', ''],
+        ])
+        out, _ = self.run_import('histories', path)
+        self.assertIn('Imported 1 histories, skipped 2', out)
+        self.assertEqual(list(patient.medical_histories.values_list('condition_name', 'status1')), [('Asthma', 'chronic')])
+        self.assertEqual(cached_fragment(patient_key(patient.id), lambda: 'fresh'), 'fresh')
+
+
+# ------------------------------
+# Conditional JSON API
+# ------------------------------
+
+class ConditionalApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('doc')
+        cls.doctor.groups.add(Group.objects.create(name='Doctors'))
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.groups.add(Group.objects.create(name='Staff'))
+        cls.patient_user = User.objects.create_user('pat', first_name='Pat')
+        cls.patient_user.groups.add(Group.objects.create(name='Patients'))
+        cls.patient = Patient.objects.create(user=cls.patient_user, gender='F', blood_group='O+')
+        cls.other = Patient.objects.create(user=User.objects.create_user('other'), gender='M', blood_group='A+')
+        AdmissionRecord.objects.create(
+            patient=cls.patient, primary_doctor=cls.doctor, assistant_doctor=cls.staff,
+            admission_reason='Asthma', admission_date=timezone.now(),
+        )
+        medicine = Medicine.objects.create(name='Aspirin', category=MedicineCategory.objects.create(name='Tablets'), unit_price=1)
+        Prescription.objects.create(patient=cls.patient, assistant_doctor=cls.staff, medicine=medicine, dosage='1 tablet')
+
+    def get(self, name, *args, **headers):
+        return self.client.get(reverse(name, args=args), headers=headers)
+
+    def test_patient_summary_revalidates_without_building_the_body(self):
+        self.client.force_login(self.staff)
+        response = self.get('api_patient_summary', self.patient.id)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['patient']['user__first_name'], 'Pat')
+        self.assertEqual([row['medicine__name'] for row in data['prescriptions']], ['Aspirin'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get('api_patient_summary', self.patient.id, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'updated_at' in q['sql']]), 1)
+        self.assertFalse([q for q in ctx.captured_queries if '"dosage"' in q['sql']])
+
+        PatientMedicalHistory.objects.create(patient=self.patient, condition_name='Flu', diagnosis_date='2020-01-01')
+        response = self.get('api_patient_summary', self.patient.id, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Deleting an older row leaves the latest updated_at alone; the count moves.
+        etag = response['ETag']
+        Prescription.objects.filter(patient=self.patient).delete()
+        response = self.get('api_patient_summary', self.patient.id, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['prescriptions'], [])
+
+    def test_patient_only_sees_own_summary(self):
+        self.client.force_login(self.patient_user)
+        self.assertEqual(self.get('api_patient_summary', self.patient.id).status_code, 200)
+        self.assertEqual(self.get('api_patient_summary', self.other.id).status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.get('api_patient_summary', 0).status_code, 404)
+
+    def test_doctor_admissions_if_modified_since(self):
+        self.client.force_login(self.doctor)
+        response = self.get('api_doctor_admissions')
+        self.assertEqual(response.json()['admissions'][0]['patient__user__first_name'], 'Pat')
+        since = response['Last-Modified']
+        self.assertEqual(self.get('api_doctor_admissions', if_modified_since=since).status_code, 304)
+
+        self.patient_user.first_name = 'Patricia'
+        self.patient_user.save()
+        self.assertEqual(self.get('api_doctor_admissions', if_none_match=response['ETag']).status_code, 200)
+
+    def test_inbox_and_prescriptions_etags_follow_changes(self):
+        Message.objects.create(sender=self.patient_user, recipient=self.staff, subject='Hi', body='Hello')
+        self.client.force_login(self.staff)
+        inbox = self.get('api_inbox')
+        self.assertEqual(inbox.json()['conversations'][0]['unread'], 1)
+        prescriptions = self.get('api_staff_prescriptions')
+        self.assertEqual(len(prescriptions.json()['prescriptions']), 1)
+
+        Message.objects.filter(recipient=self.staff).mark_read()
+        response = self.get('api_inbox', if_none_match=inbox['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['conversations'][0]['unread'], 0)
+        self.assertEqual(self.get('api_staff_prescriptions', if_none_match=prescriptions['ETag']).status_code, 304)
+        self.assertEqual(self.client.post(reverse('api_inbox')).status_code, 405)
@@ -7,14 +7,35 @@ urlpatterns = [
     path("logout/", views.logout_view, name="custom_logout"),
     path("doctor/dashboard", views.doctor_dashboard, name="doctor_dashboard"),
     path("staff/", views.staff_dashboard, name="staff_dashboard"),
+    path('staff/patients/<int:patient_id>/prescriptions/', views.staff_patient_prescriptions, name='staff_patient_prescriptions'),
     path('staff/inbox/', views.inbox, name='staff_inbox'),
+    path('staff/inbox/stream/', views.message_stream, name='message_stream'),
+    path('staff/inbox/<int:sender_id>/', views.conversation, name='staff_conversation'),
+    path('staff/inbox/<int:sender_id>/read/', views.mark_conversation_read, name='mark_conversation_read'),
     path('staff/add-prescription/', views.add_prescription, name='add_prescription'),
+    path('staff/add-prescriptions/', views.add_prescription_batch, name='add_prescription_batch'),
+    path('staff/prescriptions/<int:prescription_id>/dispense/', views.dispense_prescription, name='dispense_prescription'),
+    path('staff/stock/receive/', views.receive_stock, name='receive_stock'),
+    path('staff/stock/low/', views.low_stock_report, name='low_stock_report'),
+    path('staff/reports/', views.staff_report, name='staff_report'),
     path("patient/<int:patient_id>/", views.patient_dashboard, name="patient_dashboard"),
+    path('cache/stats/', views.fragment_cache_stats, name='fragment_cache_stats'),
+    path('api/v1/patients/<int:patient_id>/', views.api_patient_summary, name='api_patient_summary'),
+    path('api/v1/doctor/admissions/', views.api_doctor_admissions, name='api_doctor_admissions'),
+    path('api/v1/staff/prescriptions/', views.api_staff_prescriptions, name='api_staff_prescriptions'),
+    path('api/v1/staff/inbox/', views.api_inbox, name='api_inbox'),
+    path('fhir/$export', views.fhir_export, name='fhir_export'),
     path('redirect/', views.after_login_redirect, name='after_login_redirect'),
     path('patient/message/send/', views.send_message, name='send_message'),
     path("dashboard/", views.default_dashboard, name="default_dashboard"),
     path("add-patient/", views.add_patient, name='add_patient'),
     path('patients/<int:patient_id>/edit/', views.edit_patient, name='edit_patient'),
+    path('beds/free/', views.bed_search, name='bed_search'),
+    path('admissions/<int:admission_id>/invoice/', views.admission_invoice, name='admission_invoice'),
+    path('ward-round/', views.ward_round, name='ward_round'),
+    path('medicines/search/', views.medicine_search, name='medicine_search'),
+    path('patients/search/', views.patient_search, name='patient_search'),
+    path('staff/search/', views.staff_search, name='staff_search'),
     path("add-prescription/", views.add_prescription, name='add_prescription'),
     path("signup/", views.patient_signup_view, name="patient_signup"),
 ]
@@ -1,15 +1,56 @@
+import datetime
+import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.decorators import login_required, user_passes_test
-from medapp.forms import PatientForm, PrescriptionForm, PatientSignUpForm, HistoryForm, AdmissionForm, MessageForm
-from medapp.models import Patient, Prescription, PatientMedicalHistory, AdmissionRecord, Message
-from django.contrib.auth.models import Group
-from django.http import HttpResponseForbidden
-from collections import defaultdict
+from django.contrib.auth.decorators import login_required
+from medapp.forms import PatientForm, PrescriptionForm, PatientSignUpForm, HistoryForm, AdmissionForm, MessageForm, PrescriptionBatchForm, PrescriptionLineFormSet, medicine_choices, submitted_medicines, assigned_patients, patients_without_history, person_label, staff_users
+from medapp.models import Patient, Prescription, PatientMedicalHistory, AdmissionRecord, Message, Bed, DoseEvent, InteractionAlert, Invoice, Medicine
+from medapp.beds import BedUnavailable, free_beds, save_admission
+from medapp.billing import build_invoices
+from medapp.fhir import RESOURCES as FHIR_RESOURCES, buffered, export_resources, gzipped, parse_since
+from medapp.prescriptions import create_prescriptions
+from medapp.reports import build_report, report_window
+from medapp.schedules import ward_round as ward_round_doses, ward_round_changes
+from medapp.search import search_beds, search_medicines, search_people
+from medapp.stock import OutOfStock, dispense, low_stock, receive
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.views.decorators.http import require_POST, require_safe
+from django.core.exceptions import BadRequest, PermissionDenied
+from django.http import HttpResponse, HttpResponseForbidden, Http404, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.safestring import mark_safe
+from itertools import groupby
+from .conditional import conditional_json, newest
+from .pagination import decode_cursor, encode_cursor, keyset_paginate, wants_fragment, fragment_response
+from .fragments import stats as fragment_stats, invalidate, cached_fragment, cached_stream, get_fragment, doctor_key, patient_key, staff_key
+from .streaming import accepts_gzip, render_around, stream_template
+from .pubsub import broker, format_event, message_event
+from .roles import DOCTORS, STAFF, PATIENTS, get_roles, role_required, doctor_required, staff_required, patient_required
 
 
 # Create your views here.
 
+def dashboard_redirect(request):
+    roles = get_roles(request)
+    if roles.is_doctor:
+        return redirect("doctor_dashboard")
+    elif roles.is_staff:
+        return redirect("staff_dashboard")
+    elif roles.is_patient:
+        if roles.patient_id is None:
+            raise Http404("No Patient matches the given query.")
+        return redirect("patient_dashboard", patient_id=roles.patient_id)
+    elif roles.is_superuser:
+        return redirect("admin:index")
+    else:
+        return redirect("default_dashboard")
+
 def login_view(request):
     if request.method == "POST":
         username = request.POST.get("username")
@@ -17,15 +58,7 @@ def login_view(request):
         user = authenticate(request, username=username, password=password)
         if user is not None:
             login(request, user)
-            if user.groups.filter(name="Doctors").exists():
-                return redirect("doctor_dashboard")
-            elif user.groups.filter(name="Staff").exists():
-                return redirect("staff_dashboard")
-            elif user.groups.filter(name="Patients").exists():
-                patient = get_object_or_404(Patient, user=user)
-                return redirect("patient_dashboard", patient_id=patient.id)
-            else:
-                return redirect("default_dashboard")  
+            return dashboard_redirect(request)
         else:
             return render(request, "registration/login.html", {
                 "username": username,
@@ -44,91 +77,167 @@ def default_dashboard(request):
 
 # Doctor Dashboard
 
-def is_doctor(user):
-    return user.groups.filter(name='Doctors').exists()
-
 @login_required
-@user_passes_test(is_doctor)
+@doctor_required
 def doctor_dashboard(request):
     admissions = AdmissionRecord.objects.filter(
         primary_doctor=request.user,
         patient__isnull=False
     ).select_related('patient', 'patient__user')
     
-    patient_records = []
-    for admission in admissions:
-        patient = admission.patient
-        patient_records.append({
-            'patient': patient,
-            'created_at': admission.created_at
-        })
+    def render_patients():
+        page = keyset_paginate(request, admissions, 'created_at')
+        if wants_fragment(request):
+            return page
+        return render_to_string('registration/_doctor_patients.html', {'page': page}, request=request)
+
+    # Only the first page is cached; "Load more" pages are read directly.
+    if request.GET:
+        page = render_patients()
+        if wants_fragment(request):
+            return fragment_response(request, 'registration/_patient_rows.html', page)
+        patients = mark_safe(page)
+    else:
+        patients = cached_fragment(doctor_key(request.user.id), render_patients)
 
-    return render(request, 'registration/doctorgroup.html', {'patient_records': patient_records})
+    return render(request, 'registration/doctorgroup.html', {'patients': patients})
 
 # Staff Dashboard
 
-def is_staff(user):
-    return user.groups.filter(name='Staff').exists()
-
 @login_required
-@user_passes_test(is_staff)
+@staff_required
 def staff_dashboard(request):
-    prescriptions = Prescription.objects.filter(assistant_doctor=request.user).select_related('patient', 'medicine')
+    key = staff_key(request.user.id)
+    records, generation = get_fragment(key)
+    if records is not None:
+        return stream_template(request, 'registration/staffgroup.html', {}, 'staff_records', [records])
+
+    # Only the group headers are rendered: one aggregate over the
+    # (assistant_doctor, patient, created_at) index. Each group's prescriptions
+    # are fetched from staff_patient_prescriptions when it is first opened.
+    groups = (
+        Patient.objects.filter(prescriptions__assistant_doctor=request.user)
+        .annotate(prescription_count=Count('prescriptions'))
+        .select_related('user')
+        .order_by('-id')
+    )
+    group_template = get_template('registration/_prescription_group.html')
+
+    def prescription_groups():
+        counter = 0
+        for counter, patient in enumerate(groups.iterator(chunk_size=500), 1):
+            yield group_template.render({'patient': patient, 'counter': counter})
+        if not counter:
+            yield '<p>No prescriptions yet.</p>'
 
-    grouped = defaultdict(list)
-    for p in prescriptions:
-        grouped[p.patient].append(p)
-
-    grouped_prescriptions = list(grouped.items())  
-    
     assigned_patients = Patient.objects.filter(
         admissions__assistant_doctor=request.user
     ).select_related('user').distinct()
     
-    return render(request, 'registration/staffgroup.html', {'grouped_prescriptions': grouped_prescriptions, 'assigned_patients': assigned_patients})
+    records = render_around('registration/_staff_records.html', {'assigned_patients': assigned_patients}, 'prescription_groups', prescription_groups())
+    return stream_template(request, 'registration/staffgroup.html', {}, 'staff_records', cached_stream(key, generation, records))
+
+
+# One patient's prescriptions on the staff dashboard, a keyset page at a time.
+
+@login_required
+@staff_required
+def staff_patient_prescriptions(request, patient_id):
+    prescriptions = Prescription.objects.filter(assistant_doctor=request.user, patient_id=patient_id).select_related('medicine')
+    page = keyset_paginate(request, prescriptions, 'created_at')
+    return fragment_response(request, 'registration/_prescription_group_items.html', page)
 
 
 # Patient Dashboard
 
-def is_patient_or_doctor_or_staff(user):
-    return user.groups.filter(name__in=['Patients', 'Doctors', 'Staff']).exists()
+INTERACTION_ALERT_LIMIT = 20
 
 @login_required
-@user_passes_test(is_patient_or_doctor_or_staff)
+@role_required(PATIENTS, DOCTORS, STAFF)
 def patient_dashboard(request, patient_id):
    
-    patient = get_object_or_404(Patient, id=patient_id)
-    
-    if request.user.groups.filter(name='Patients').exists() and patient.user != request.user:
+    if request.roles.is_patient and request.roles.patient_id != patient_id:
         return HttpResponseForbidden("You are not allowed to view this page.")
     
-    history = PatientMedicalHistory.objects.filter(patient=patient).order_by('-diagnosis_date')
-    admissions = AdmissionRecord.objects.filter(patient=patient).order_by('-admission_date')
-    prescriptions = Prescription.objects.filter(patient=patient).select_related('medicine', 'assistant_doctor').order_by('-created_at')
+    # name: (queryset, keyset column)
+    record_lists = {
+        'history': (PatientMedicalHistory.objects.filter(patient_id=patient_id), 'diagnosis_date'),
+        'admissions': (AdmissionRecord.objects.filter(patient_id=patient_id).select_related('assistant_doctor', 'bed__room', 'bed__ward'), 'admission_date'),
+        'prescriptions': (Prescription.objects.filter(patient_id=patient_id).select_related('medicine', 'assistant_doctor'), 'created_at'),
+    }
+
+    if wants_fragment(request):
+        name = request.GET.get('list')
+        if name not in record_lists:
+            raise BadRequest("Unknown list.")
+        queryset, key = record_lists[name]
+        page = keyset_paginate(request, queryset, key, param=f'{name}_cursor')
+        return fragment_response(request, f'registration/_{name}_items.html', page)
+
+    def render_records():
+        patient = get_object_or_404(Patient.objects.select_related('user'), id=patient_id)
+        pages = {
+            name: keyset_paginate(request, queryset, key, param=f'{name}_cursor')
+            for name, (queryset, key) in record_lists.items()
+        }
+        alerts = (
+            InteractionAlert.objects.filter(patient_id=patient_id)
+            .select_related('interaction', 'prescription__medicine', 'other__medicine')
+            .order_by('-severity', '-detected_at')[:INTERACTION_ALERT_LIMIT]
+        )
+        return render_to_string('registration/_patient_records.html', {
+            'patient': patient,
+            'alerts': alerts,
+            'history': pages['history'],
+            'admissions': pages['admissions'],
+            'prescriptions': pages['prescriptions'],
+        })
+
+    # Only the first page of each list is cached.
+    records = mark_safe(render_records()) if request.GET else cached_fragment(patient_key(patient_id), render_records)
     
-    return render(request, 'registration/patientgroup.html', {
-        'patient': patient,
-        'user': request.user, 
-        'history': history,
-        'admissions': admissions,
-        'prescriptions': prescriptions,
-    })
+    return render(request, 'registration/patientgroup.html', {'records': records})
     
+# FHIR bulk export ($export) of patient records as NDJSON, for downstream systems.
+
+@login_required
+def fhir_export(request):
+    if not request.roles.is_superuser:
+        return HttpResponseForbidden("You are not allowed to export records.")
+    types = request.GET.get('_type')
+    types = types.split(',') if types else list(FHIR_RESOURCES)
+    if not set(types) <= FHIR_RESOURCES.keys():
+        raise BadRequest("Unknown _type.")
+    try:
+        since = parse_since(request.GET['_since']) if request.GET.get('_since') else None
+    except ValueError:
+        raise BadRequest("Invalid _since.")
+
+    # Clients pass this back as _since; rows changed during the export are sent again.
+    transaction_time = timezone.now()
+    lines = (line for resource_type in types for line in export_resources(resource_type, since))
+    content = buffered(lines)
+    gzip = accepts_gzip(request)
+    if gzip:
+        content = gzipped(content)
+    response = StreamingHttpResponse(content, content_type='application/fhir+ndjson')
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['X-Transaction-Time'] = transaction_time.isoformat()
+    return response
+
+# Fragment cache hit rates. Counts are per worker process; 'pid' says which one answered.
+
+@login_required
+def fragment_cache_stats(request):
+    if not request.roles.is_superuser:
+        return HttpResponseForbidden("You are not allowed to view this page.")
+    return JsonResponse(fragment_stats.as_dict())
+
 @login_required
 def after_login_redirect(request):
-    user = request.user
-    if user.groups.filter(name="Doctors").exists():
-        return redirect("doctor_dashboard")
-    elif user.groups.filter(name="Patients").exists():
-        patient = get_object_or_404(Patient, user=user)
-        print("Redirecting patient ID:", patient.id)
-        return redirect("patient_dashboard", patient_id=patient.id)
-    elif user.groups.filter(name="Staff").exists():
-        return redirect("staff_dashboard")
-    elif user.is_superuser:
-        return redirect("admin:index")
-    else:
-        return redirect("default_dashboard")
+    return dashboard_redirect(request)
 
 
 # Form for Sign-Up 
@@ -158,7 +267,7 @@ def patient_signup_view(request):
 # Form for Adding Patient's Details. 
 
 @login_required
-@user_passes_test(is_doctor)
+@doctor_required
 def add_patient(request):
     error = None
     if request.method == 'POST':
@@ -173,20 +282,30 @@ def add_patient(request):
 
             admission.patient = history.patient
 
-            history.save()
-            admission.save()
-
-            return redirect('doctor_dashboard')
+            try:
+                with transaction.atomic():
+                    history.save()
+                    save_admission(admission)
+            except BedUnavailable as exc:
+                admission_form.add_error('bed', str(exc))
+                error = "Please correct the errors in the form."
+            else:
+                return redirect('doctor_dashboard')
         else:
             error = "Please correct the errors in the form."
     else:
         history_form = HistoryForm()
         admission_form = AdmissionForm()
 
-    return render(request, 'forms/patients.html', {"history_form": history_form, "admission_form": admission_form, "error": error})
+    return render(request, 'forms/patients.html', {
+        "history_form": history_form,
+        "admission_form": admission_form,
+        "media": history_form.media + admission_form.media,
+        "error": error,
+    })
 
 @login_required
-@user_passes_test(is_doctor)
+@doctor_required
 def edit_patient(request, patient_id):
     patient = get_object_or_404(Patient, id=patient_id)
 
@@ -210,10 +329,15 @@ def edit_patient(request, patient_id):
             admission.patient = history.patient
             admission.primary_doctor = request.user
 
-            history.save()
-            admission.save()
-
-            return redirect('doctor_dashboard')
+            try:
+                with transaction.atomic():
+                    history.save()
+                    save_admission(admission)
+            except BedUnavailable as exc:
+                admission_form.add_error('bed', str(exc))
+                error = "Please correct the errors."
+            else:
+                return redirect('doctor_dashboard')
         else:
             error = "Please correct the errors."
     else:
@@ -223,15 +347,120 @@ def edit_patient(request, patient_id):
     return render(request, 'forms/patients.html', {
         'history_form': history_form,
         'admission_form': admission_form,
+        'media': history_form.media + admission_form.media,
         'error': error,
         'edit': True,
         'patient': patient,
     })
 
+# Free bed search used by the admission form.
+
+BED_SEARCH_LIMIT = 200
+
+@login_required
+@role_required(DOCTORS, STAFF)
+def bed_search(request):
+    bed_type = request.GET.get('type')
+    if bed_type and bed_type not in dict(Bed.TYPE_CHOICES):
+        raise BadRequest("Unknown bed type.")
+    try:
+        limit = min(int(request.GET.get('limit', 50)), BED_SEARCH_LIMIT)
+    except ValueError:
+        raise BadRequest("Invalid limit.")
+
+    beds = search_beds(free_beds(ward=request.GET.get('ward'), bed_type=bed_type), request.GET.get('q', ''))[:limit]
+    # 'results' is the shape AutocompleteWidget reads.
+    return JsonResponse({
+        'beds': [
+            {
+                'id': bed.id,
+                'ward': bed.ward.code,
+                'room': bed.room.number,
+                'label': bed.label,
+                'type': bed.bed_type,
+                'name': str(bed),
+            }
+            for bed in beds
+        ],
+        'results': [{'id': bed.id, 'label': str(bed)} for bed in beds],
+    })
+
+# Doses due on the ward round, optionally as a delta since a cursor.
+
+WARD_ROUND_HOURS = 4
+WARD_ROUND_MAX_HOURS = 24
+WARD_ROUND_OVERDUE = datetime.timedelta(minutes=30)
+
+@login_required
+@role_required(DOCTORS, STAFF)
+def ward_round(request):
+    try:
+        hours = min(max(int(request.GET.get('hours', WARD_ROUND_HOURS)), 1), WARD_ROUND_MAX_HOURS)
+    except ValueError:
+        raise BadRequest("Invalid hours.")
+    now = timezone.now()
+    start, end = now - WARD_ROUND_OVERDUE, now + datetime.timedelta(hours=hours)
+
+    since = request.GET.get('since')
+    if since:
+        value, pk = decode_cursor(since, DoseEvent._meta.get_field('updated_at'))
+        rows, (value, pk) = ward_round_changes(start, end, value, pk)
+        return JsonResponse({'rows': rows, 'cursor': encode_cursor(value, pk)})
+
+    # Hand out the cursor before reading so nothing changed meanwhile is missed.
+    cursor = encode_cursor(now, 0)
+    rows = list(ward_round_doses(start, end))
+    if wants_fragment(request):
+        return JsonResponse({'rows': rows, 'cursor': cursor})
+    rooms = [
+        (ward, room, list(doses))
+        for (ward, room), doses in groupby(rows, key=lambda row: (row['ward'], row['room']))
+    ]
+    return render(request, 'registration/ward_round.html', {
+        'rooms': rooms,
+        'hours': hours,
+        'cursor': cursor,
+        'dose_count': len(rows),
+    })
+
+# Medicine autocomplete for prescription forms.
+
+@login_required
+@role_required(DOCTORS, STAFF)
+def medicine_search(request):
+    rows = search_medicines(request.GET.get('q', ''))
+    return JsonResponse({'results': [
+        {'id': pk, 'label': name, 'category': category} for pk, name, category in rows
+    ]})
+
+# Patient and staff pickers. Scopes mirror the querysets the forms validate against.
+
+PATIENT_SCOPES = {
+    'unrecorded': lambda request: patients_without_history(),
+    'assigned': lambda request: assigned_patients(request.user),
+}
+
+@login_required
+@role_required(DOCTORS, STAFF)
+def patient_search(request):
+    scope = request.GET.get('scope')
+    if scope and scope not in PATIENT_SCOPES:
+        raise BadRequest("Unknown scope.")
+    patients = PATIENT_SCOPES[scope](request) if scope else Patient.objects.select_related('user')
+    patients = search_people(patients, request.GET.get('q', ''), user='user__')
+    return JsonResponse({'results': [{'id': p.id, 'label': person_label(p.user)} for p in patients]})
+
+
+@login_required
+@doctor_required
+def staff_search(request):
+    users = search_people(staff_users(), request.GET.get('q', ''))
+    return JsonResponse({'results': [{'id': u.id, 'label': person_label(u)} for u in users]})
+
 #Form for Adding Prescription.
 
 @login_required
-@user_passes_test(is_staff)
+@staff_required
 def add_prescription(request):
     if request.method =="POST":
         form = PrescriptionForm(request.POST, doctor=request.user)
@@ -244,21 +473,186 @@ def add_prescription(request):
         form = PrescriptionForm(doctor=request.user)
     return render(request, 'forms/prescription.html', {'form': form})
 
+# Batch entry: the form posts a formset, API clients post JSON with the same
+# fields, e.g. {"patient": 1, "prescriptions": [{"medicine": 3, "dosage": "5 ml"}]}.
+
+def json_formset_data(payload, prefix='form'):
+    lines = payload.get('prescriptions')
+    if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+        raise BadRequest("'prescriptions' must be a list of objects.")
+    data = {
+        'patient': payload.get('patient'),
+        f'{prefix}-TOTAL_FORMS': len(lines),
+        f'{prefix}-INITIAL_FORMS': 0,
+    }
+    for i, line in enumerate(lines):
+        for field, value in line.items():
+            data[f'{prefix}-{i}-{field}'] = value
+    return data
+
+
 @login_required
-@user_passes_test(lambda u: u.groups.filter(name='Staff').exists())
-def inbox(request):
-    messages = Message.objects.filter(recipient=request.user).order_by('-timestamp')
-    return render(request, 'messaging/inbox.html', {'messages': messages})
+@staff_required
+def add_prescription_batch(request):
+    is_json = request.content_type == 'application/json'
+    if request.method == 'POST':
+        if is_json:
+            try:
+                data = json_formset_data(json.loads(request.body))
+            except (ValueError, AttributeError):
+                raise BadRequest("Invalid JSON body.")
+        else:
+            data = request.POST
+    else:
+        data = None
+
+    medicines = medicine_choices(submitted_medicines(data))
+    form = PrescriptionBatchForm(data, doctor=request.user)
+    formset = PrescriptionLineFormSet(data, form_kwargs={'medicines': medicines})
+
+    if data is not None:
+        if form.is_valid() and formset.is_valid():
+            patient = form.cleaned_data['patient']
+            lines = [line for line in formset.cleaned_data if line]
+            prescriptions = create_prescriptions(patient, request.user, lines)
+            invalidate(patient_key(patient.id), staff_key(request.user.id))
+            if is_json:
+                alerts = {(a.prescription_id, a.other_id, a.interaction_id): a for p in prescriptions for a in p.alerts}
+                return JsonResponse({
+                    'created': [p.id for p in prescriptions],
+                    'interactions': [
+                        {'prescription': a.prescription_id, 'other': a.other_id, 'interaction': a.interaction_id,
+                         'severity': a.get_severity_display()}
+                        for a in sorted(alerts.values(), key=lambda a: (-a.severity, a.prescription_id, a.other_id))
+                    ],
+                }, status=201)
+            return redirect(staff_dashboard)
+        if is_json:
+            errors = {'patient': form.errors.get('patient', []), 'prescriptions': formset.errors,
+                      'non_field_errors': formset.non_form_errors()}
+            return JsonResponse({'errors': errors}, status=400)
+
+    return render(request, 'forms/prescription_batch.html', {
+        'form': form,
+        'formset': formset,
+        'media': form.media + formset.media,
+    })
+
+# Pharmacy: receiving and dispensing stock, and the reorder list.
+
+def posted_data(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            raise BadRequest("Invalid JSON body.")
+        if not isinstance(data, dict):
+            raise BadRequest("Expected a JSON object.")
+        return data
+    return request.POST
+
+
+def posted_quantity(data):
+    try:
+        quantity = int(data.get('quantity'))
+    except (TypeError, ValueError):
+        raise BadRequest("Invalid quantity.")
+    if quantity <= 0:
+        raise BadRequest("Quantity must be positive.")
+    return quantity
+
+
+@login_required
+@staff_required
+@require_POST
+def dispense_prescription(request, prescription_id):
+    prescription = get_object_or_404(Prescription.objects.filter(medicine__isnull=False), id=prescription_id)
+    quantity = posted_quantity(posted_data(request))
+    try:
+        movements = dispense(prescription, quantity, user=request.user)
+    except OutOfStock as exc:
+        return JsonResponse({'error': str(exc)}, status=409)
+    return JsonResponse({
+        'dispensed': quantity,
+        'lots': [{'lot': m.lot.lot_number, 'quantity': -m.quantity} for m in movements],
+    })
+
+
+@login_required
+@staff_required
+@require_POST
+def receive_stock(request):
+    data = posted_data(request)
+    quantity = posted_quantity(data)
+    medicine = get_object_or_404(Medicine, id=data.get('medicine'))
+    lot_number = str(data.get('lot_number') or '').strip()
+    if not lot_number:
+        raise BadRequest("lot_number is required.")
+    try:
+        expiry = datetime.date.fromisoformat(data['expiry_date']) if data.get('expiry_date') else None
+    except (TypeError, ValueError):
+        raise BadRequest("Invalid expiry_date.")
+    movement = receive(medicine.id, lot_number, quantity, expiry_date=expiry, user=request.user)
+    return JsonResponse({'movement': movement.id, 'lot': movement.lot_id}, status=201)
+
+
+@login_required
+@staff_required
+def low_stock_report(request):
+    rows = list(low_stock())
+    if wants_fragment(request):
+        return JsonResponse({'medicines': rows})
+    return render(request, 'registration/low_stock.html', {'rows': rows})
+
+# Occupancy, length of stay and prescribing report.
+
+REPORT_DAYS = 30
+REPORT_MAX_DAYS = 366
+
+@login_required
+@staff_required
+def staff_report(request):
+    try:
+        days = int(request.GET.get('days', REPORT_DAYS))
+        start, end = report_window(request.GET.get('start'), request.GET.get('end'), days)
+    except ValueError:
+        raise BadRequest("Invalid report dates.")
+    if (end - start).days > REPORT_MAX_DAYS:
+        raise BadRequest(f"Reports cover at most {REPORT_MAX_DAYS} days.")
+    report = build_report(start, end)
+    if wants_fragment(request):
+        return JsonResponse(report)
+    return render(request, 'registration/report.html', {'report': report})
+
+# Admission invoices: the materialised invoice once discharged, else a running estimate.
+
+@login_required
+@role_required(PATIENTS, DOCTORS, STAFF)
+def admission_invoice(request, admission_id):
+    admission = get_object_or_404(AdmissionRecord.objects.select_related('invoice'), id=admission_id)
+    if request.roles.is_patient and request.roles.patient_id != admission.patient_id:
+        return HttpResponseForbidden("You are not allowed to view this invoice.")
+    try:
+        invoice = admission.invoice
+    except Invoice.DoesNotExist:
+        invoice = build_invoices(AdmissionRecord.objects.filter(id=admission_id))[0]
+    return JsonResponse({
+        'admission': admission_id,
+        'final': invoice.issued_at is not None,
+        'issued_at': invoice.issued_at,
+        'room_days': invoice.room_days,
+        **{field: f'{getattr(invoice, field):.2f}' for field in ('room_charges', 'medicine_charges', 'total')},
+    })
 
 #Form for Sending Messages.
 
 @login_required
-@user_passes_test(lambda u: u.groups.filter(name='Patients').exists())
+@patient_required
 def send_message(request):
-    patient = request.user.patient_user
+    patient_id = request.roles.patient_id
 
     try:
-        assigned = AdmissionRecord.objects.filter(patient=patient).latest('admission_date').assistant_doctor
+        assigned = AdmissionRecord.objects.select_related('assistant_doctor').filter(patient_id=patient_id).latest('admission_date').assistant_doctor
     except AdmissionRecord.DoesNotExist:
         return HttpResponseForbidden("No assigned doctor found.")
     
@@ -267,29 +661,215 @@ def send_message(request):
         if form.is_valid():
             message = form.save(commit=False)
             message.sender = request.user 
-            
-            patient = request.user.patient_user
-            assigned = AdmissionRecord.objects.filter(patient=patient).last().assistant_doctor
-            
             message.recipient = assigned
             
             message.save()
-            return redirect('patient_dashboard', patient_id=request.user.patient_user.id)
+            return redirect('patient_dashboard', patient_id=patient_id)
     else:
         form = MessageForm()
 
     return render(request, 'messaging/send_message.html', {'form': form, 'assigned_doctor': assigned})
 
+def inbox_conversations(user):
+    # One row per sender, aggregated in SQL over the recipient's messages.
+    latest = Message.objects.filter(recipient=user, sender=OuterRef('sender')).order_by('-timestamp', '-id')
+    sender = User.objects.filter(pk=OuterRef('sender'))
+    return (
+        Message.objects.filter(recipient=user)
+        .values('sender')
+        .annotate(
+            last_at=Max('timestamp'),
+            total=Count('id'),
+            unread=Count('id', filter=Q(is_read=False)),
+        )
+        # Annotated separately so the subqueries run once per sender rather
+        # than being added to the GROUP BY and evaluated for every message.
+        .annotate(
+            last_subject=Subquery(latest.values('subject')[:1]),
+            sender_first_name=Subquery(sender.values('first_name')),
+            sender_last_name=Subquery(sender.values('last_name')),
+            sender_username=Subquery(sender.values('username')),
+        )
+        .order_by('-last_at', '-sender')
+    )
+
 @login_required
-@user_passes_test(lambda u: u.groups.filter(name='Staff').exists())
+@staff_required
 def inbox(request):
-    messages = Message.objects.filter(recipient=request.user).order_by('-timestamp')
-    
-    grouped = defaultdict(list)
-    for msg in messages:
-        print(f"- From {msg.sender} | Subject: {msg.subject}")
-        grouped[msg.sender].append(msg)
-        
-    grouped_messages = list(grouped.items())
-    
-    return render(request, 'messaging/inbox.html', {'grouped_messages': grouped_messages})
\ No newline at end of file
+    return render(request, 'messaging/inbox.html', {'conversations': inbox_conversations(request.user)})
+
+# Seconds between keep-alive comments on an idle stream; proxies tend to drop
+# connections that stay silent for a minute.
+STREAM_KEEPALIVE = 25
+STREAM_BACKLOG = 50
+
+async def message_stream(request):
+    """Server-Sent Events feed of messages received by the logged-in staff member.
+
+    Needs an ASGI server (e.g. ``uvicorn mysite.asgi:application``); an idle
+    connection is a queue in ``pubsub.broker`` and costs no queries.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would pin a worker thread; 204 tells
+        # EventSource not to reconnect.
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated or not (await sync_to_async(get_roles)(request)).is_staff:
+        return HttpResponseForbidden("You are not allowed to view this page.")
+
+    last_id = request.headers.get('Last-Event-ID', '')
+    last_id = int(last_id) if last_id.isdigit() else None
+
+    async def events():
+        async with broker.subscribe(user.pk) as subscription:
+            yield 'retry: 5000\n\n'
+            sent = last_id or 0
+            if last_id is not None:
+                # Replay what arrived while the client was reconnecting.
+                missed = Message.objects.filter(recipient_id=user.pk, id__gt=last_id).select_related('sender').order_by('id')
+                for message in await sync_to_async(list)(missed[:STREAM_BACKLOG]):
+                    sent = message.id
+                    yield format_event(message_event(message))
+            while True:
+                try:
+                    event = await subscription.get(timeout=STREAM_KEEPALIVE)
+                except TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event is None:
+                    return
+                if event['id'] > sent:
+                    sent = event['id']
+                    yield format_event(event)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@staff_required
+def conversation(request, sender_id):
+    sender = get_object_or_404(User, id=sender_id)
+    messages = Message.objects.filter(recipient=request.user, sender_id=sender_id)
+    page = keyset_paginate(request, messages, 'timestamp')
+
+    if wants_fragment(request):
+        return fragment_response(request, 'messaging/_thread_messages.html', page)
+
+    return render(request, 'messaging/thread.html', {'sender': sender, 'page': page})
+
+@login_required
+@staff_required
+@require_POST
+def mark_conversation_read(request, sender_id):
+    Message.objects.filter(recipient=request.user, sender_id=sender_id).mark_read()
+    return redirect('staff_conversation', sender_id=sender_id)
+
+
+# Read-only JSON API for the ward tablets. Every endpoint answers
+# If-None-Match / If-Modified-Since from one aggregate query (see
+# accounts.conditional); the projections are .values() rows, not models.
+# Medicine names are read live and do not move the ETag.
+
+def record_stamps(queryset):
+    """Correlated row count and latest updated_at of a patient's ``queryset``."""
+    rows = queryset.filter(patient_id=OuterRef('pk')).order_by().values('patient_id')
+    return (
+        Subquery(rows.annotate(count=Count('pk')).values('count')),
+        Subquery(rows.annotate(latest=Max('updated_at')).values('latest')),
+    )
+
+PATIENT_API_RECORDS = {
+    'history': (PatientMedicalHistory, ('id', 'condition_name', 'diagnosis_date', 'status1', 'notes'), '-diagnosis_date'),
+    'admissions': (
+        AdmissionRecord,
+        ('id', 'admission_date', 'discharge_date', 'admission_reason', 'primary_doctor_id', 'assistant_doctor_id', 'bed_id'),
+        '-admission_date',
+    ),
+    'prescriptions': (
+        Prescription,
+        ('id', 'medicine_id', 'medicine__name', 'dosage', 'duration_days', 'frequency', 'dose_times', 'start_date', 'created_at'),
+        '-created_at',
+    ),
+}
+
+def patient_api_version(request, patient_id):
+    if request.roles.is_patient and request.roles.patient_id != patient_id:
+        raise PermissionDenied
+    stamps = {}
+    for name, (model, _, _) in PATIENT_API_RECORDS.items():
+        stamps[f'{name}_count'], stamps[f'{name}_latest'] = record_stamps(model.objects.all())
+    row = Patient.objects.filter(pk=patient_id).annotate(**stamps).values('updated_at', *stamps).first()
+    if row is None:
+        raise Http404("No such patient.")
+    return list(row.values()), newest(row['updated_at'], *(row[f'{name}_latest'] for name in PATIENT_API_RECORDS))
+
+@login_required
+@role_required(PATIENTS, DOCTORS, STAFF)
+@require_safe
+@conditional_json(patient_api_version)
+def api_patient_summary(request, patient_id):
+    patient = Patient.objects.values(
+        'id', 'user__first_name', 'user__last_name', 'date_of_birth', 'gender', 'blood_group', 'phone', 'emergency_contact',
+    ).get(pk=patient_id)
+    return JsonResponse({
+        'patient': patient,
+        **{
+            name: list(model.objects.filter(patient_id=patient_id).values(*columns).order_by(order, '-id'))
+            for name, (model, columns, order) in PATIENT_API_RECORDS.items()
+        },
+    })
+
+def doctor_api_admissions(request):
+    return AdmissionRecord.objects.filter(primary_doctor=request.user, patient__isnull=False)
+
+def doctor_api_version(request):
+    # Patient rows are bumped when their user is renamed, so the names count.
+    stamps = doctor_api_admissions(request).aggregate(
+        count=Count('pk'), latest=Max('updated_at'), patients=Max('patient__updated_at'),
+    )
+    return list(stamps.values()), newest(stamps['latest'], stamps['patients'])
+
+@login_required
+@doctor_required
+@require_safe
+@conditional_json(doctor_api_version)
+def api_doctor_admissions(request):
+    admissions = doctor_api_admissions(request).values(
+        'id', 'patient_id', 'patient__user__first_name', 'patient__user__last_name',
+        'admission_date', 'discharge_date', 'admission_reason', 'bed_id',
+    ).order_by('-admission_date', '-id')
+    return JsonResponse({'admissions': list(admissions)})
+
+def staff_api_prescriptions(request):
+    return Prescription.objects.filter(assistant_doctor=request.user)
+
+def staff_api_version(request):
+    stamps = staff_api_prescriptions(request).aggregate(
+        count=Count('pk'), latest=Max('updated_at'), patients=Max('patient__updated_at'),
+    )
+    return list(stamps.values()), newest(stamps['latest'], stamps['patients'])
+
+@login_required
+@staff_required
+@require_safe
+@conditional_json(staff_api_version)
+def api_staff_prescriptions(request):
+    prescriptions = staff_api_prescriptions(request).values(
+        'id', 'patient_id', 'patient__user__first_name', 'patient__user__last_name', 'medicine_id', 'medicine__name',
+        'dosage', 'duration_days', 'frequency', 'dose_times', 'start_date', 'created_at',
+    ).order_by('-created_at', '-id')
+    return JsonResponse({'prescriptions': list(prescriptions)})
+
+def inbox_api_version(request):
+    # Renaming a user bumps the messages they sent, so sender names count.
+    stamps = Message.objects.filter(recipient=request.user).aggregate(count=Count('pk'), latest=Max('updated_at'))
+    return list(stamps.values()), stamps['latest']
+
+@login_required
+@staff_required
+@require_safe
+@conditional_json(inbox_api_version)
+def api_inbox(request):
+    return JsonResponse({'conversations': list(inbox_conversations(request.user))})
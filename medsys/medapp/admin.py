@@ -1,4 +1,10 @@
 from django.contrib import admin
 
+from .models import Bed, Interaction, Room, Ward
+
 # Register your models here.
 
+admin.site.register(Ward)
+admin.site.register(Room)
+admin.site.register(Bed)
+admin.site.register(Interaction)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MedappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "medapp"
+
+    def ready(self):
+        import medapp.signals  # noqa: F401
@@ -0,0 +1,113 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import AdmissionRecord, Bed, BedOccupancy, DoseEvent
+
+
+class BedUnavailable(Exception):
+    def __init__(self, bed, message=None):
+        super().__init__(message or f"Bed {bed} is already occupied.")
+        self.bed = bed
+
+
+# ------------------------------
+# Search
+# ------------------------------
+
+def free_beds(ward=None, bed_type=None, keep=None):
+    """Active beds without an open admission, optionally narrowed by ward and type.
+
+    ``ward`` is a ward code. ``keep`` is a bed the caller already holds and is
+    included even though it is occupied. Filters on the partial
+    (ward, bed_type) index and anti-joins the unique occupancy index.
+    """
+    beds = Bed.objects.filter(active=True, occupancy__isnull=True)
+    if ward:
+        beds = beds.filter(ward__code=ward)
+    if bed_type:
+        beds = beds.filter(bed_type=bed_type)
+    if keep is not None:
+        beds = beds | Bed.objects.filter(pk=keep)
+    return beds.select_related('room', 'ward').order_by('ward__code', 'room__number', 'label')
+
+
+# ------------------------------
+# Allocation
+# ------------------------------
+
+def sync_occupancy(admission):
+    """Make the occupancy table agree with a saved admission.
+
+    Raises BedUnavailable if the bed, or another bed for the same patient, is
+    held by another open admission; callers run this in the same transaction
+    as the admission save so it rolls back.
+    """
+    if admission.discharge_date is not None or admission.bed_id is None:
+        if BedOccupancy.objects.filter(admission=admission).delete()[0]:
+            touch_doses(admission.patient_id)
+        return
+
+    current = BedOccupancy.objects.filter(admission=admission).values_list('bed_id', flat=True).first()
+    if current == admission.bed_id:
+        return
+    try:
+        with transaction.atomic():
+            BedOccupancy.objects.update_or_create(
+                admission=admission,
+                defaults={'bed_id': admission.bed_id, 'patient_id': admission.patient_id},
+                create_defaults={
+                    'bed_id': admission.bed_id,
+                    'patient_id': admission.patient_id,
+                    'occupied_since': admission.admission_date,
+                },
+            )
+    except IntegrityError:
+        held = BedOccupancy.objects.filter(patient_id=admission.patient_id).exclude(admission=admission)
+        if held.exists():
+            raise BedUnavailable(admission.bed, "This patient already has a bed from another open admission.")
+        raise BedUnavailable(admission.bed)
+    touch_doses(admission.patient_id)
+
+
+def touch_doses(patient_id):
+    # The ward round feed follows DoseEvent.updated_at, so moving a patient in
+    # or out of a bed re-sends their upcoming doses.
+    now = timezone.now()
+    DoseEvent.objects.filter(patient_id=patient_id, scheduled_at__gte=now).update(updated_at=now)
+
+
+@transaction.atomic
+def save_admission(admission):
+    """Save ``admission``, claim or release its bed and invoice a discharge atomically."""
+    from .billing import sync_invoice
+
+    admission.save()
+    sync_occupancy(admission)
+    sync_invoice(admission)
+    return admission
+
+
+def rebuild_occupancy():
+    """Recreate the occupancy table from open admissions, e.g. after bulk loads.
+
+    If several open admissions share a bed, or a patient has several, the
+    most recent admission wins. Returns the number of occupied beds.
+    """
+    with transaction.atomic():
+        BedOccupancy.objects.all().delete()
+        occupancies = {}
+        patients = set()
+        open_admissions = (
+            AdmissionRecord.objects.filter(discharge_date__isnull=True, bed__isnull=False)
+            .order_by('-admission_date', '-id')
+            .values_list('id', 'bed_id', 'patient_id', 'admission_date')
+        )
+        for admission_id, bed_id, patient_id, admitted in open_admissions:
+            if bed_id in occupancies or patient_id in patients:
+                continue
+            patients.add(patient_id)
+            occupancies[bed_id] = BedOccupancy(
+                bed_id=bed_id, admission_id=admission_id, patient_id=patient_id, occupied_since=admitted,
+            )
+        BedOccupancy.objects.bulk_create(occupancies.values())
+    return len(occupancies)
@@ -0,0 +1,115 @@
+import datetime
+
+from django.db.models import DateTimeField, DecimalField, F, Func, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Least, NullIf
+from django.utils import timezone
+
+from .models import AdmissionRecord, Invoice, Prescription
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+INVOICE_FIELDS = ('room_days', 'room_charges', 'medicine_charges', 'total')
+
+
+class StayDays(Func):
+    """Started 24-hour periods between two datetimes, at least one."""
+    arity = 2
+    output_field = IntegerField()
+    template = 'GREATEST(CEIL(EXTRACT(EPOCH FROM %(end)s - %(start)s) / 86400)::integer, 1)'
+    # Whole seconds keep the arithmetic exact, unlike julianday() differences.
+    sqlite_template = "MAX((strftime('%%%%s', %(end)s) - strftime('%%%%s', %(start)s) + 86399) / 86400, 1)"
+
+    def as_sql(self, compiler, connection, **extra_context):
+        (start, start_params), (end, end_params) = (compiler.compile(arg) for arg in self.get_source_expressions())
+        template = self.sqlite_template if connection.vendor == 'sqlite' else self.template
+        return template % {'start': start, 'end': end}, (*end_params, *start_params)
+
+
+class JSONArrayLength(Func):
+    function = 'JSONB_ARRAY_LENGTH'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='JSON_ARRAY_LENGTH', **extra_context)
+
+
+# ------------------------------
+# Charges
+# ------------------------------
+
+def medicine_charges():
+    """Per-admission cost of the prescriptions written during the stay.
+
+    Each prescription costs unit price x doses a day x days, the days capped
+    at the stay so a course running past discharge is billed for the time in
+    hospital. Doses a day come from dose_times, else the frequency, else one.
+    """
+    doses_per_day = Coalesce(NullIf(JSONArrayLength('dose_times'), Value(0)), 'frequency', Value(1))
+    days = Coalesce(Least('duration_days', OuterRef('room_days')), OuterRef('room_days'))
+    prescriptions = Prescription.objects.filter(
+        patient_id=OuterRef('patient_id'),
+        created_at__gte=OuterRef('admission_date'),
+        created_at__lte=OuterRef('billed_until'),
+    )
+    cost = Sum(F('medicine__unit_price') * doses_per_day * days, output_field=MONEY)
+    return Subquery(prescriptions.order_by().values('patient_id').annotate(cost=cost).values('cost'), output_field=MONEY)
+
+
+def invoice_rows(admissions, now=None):
+    """``admissions`` annotated with their charges, as one aggregate query.
+
+    Open admissions are billed up to ``now`` as an estimate. A stay is
+    charged per started day, so the bill does not depend on the time zone.
+    """
+    billed_until = Coalesce('discharge_date', Value(now or timezone.now(), output_field=DateTimeField()))
+    room_charges = F('room_days') * Coalesce('bed__room__daily_rate', Value(0), output_field=MONEY)
+    return (
+        admissions.order_by()
+        .annotate(billed_until=billed_until)
+        .annotate(room_days=StayDays('admission_date', 'billed_until'))
+        .annotate(
+            room_charges=room_charges,
+            medicine_charges=Coalesce(medicine_charges(), Value(0), output_field=MONEY),
+        )
+        .annotate(total=F('room_charges') + F('medicine_charges'))
+        .values('id', 'patient_id', *INVOICE_FIELDS)
+    )
+
+
+# ------------------------------
+# Invoices
+# ------------------------------
+
+def build_invoices(admissions, issued_at=None):
+    """Unsaved invoices for ``admissions``; without ``issued_at`` they are estimates."""
+    return [
+        Invoice(admission_id=row['id'], patient_id=row['patient_id'], issued_at=issued_at,
+                **{field: row[field] for field in INVOICE_FIELDS})
+        for row in invoice_rows(admissions)
+    ]
+
+
+def issue_invoices(admissions, batch_size=1000):
+    """Materialise invoices for discharged ``admissions``, replacing earlier ones.
+
+    One query for the charges and one upsert per batch. Returns the invoices.
+    """
+    invoices = build_invoices(admissions.filter(discharge_date__isnull=False), issued_at=timezone.now())
+    return Invoice.objects.bulk_create(
+        invoices, batch_size=batch_size, update_conflicts=True,
+        unique_fields=['admission'], update_fields=[*INVOICE_FIELDS, 'issued_at'],
+    )
+
+
+def sync_invoice(admission):
+    """Invoice a discharged admission, or drop the invoice of a reopened one."""
+    if admission.discharge_date is None:
+        Invoice.objects.filter(admission_id=admission.pk).delete()
+        return None
+    return issue_invoices(AdmissionRecord.objects.filter(pk=admission.pk))[0]
+
+
+def invoice_discharges(day):
+    """Invoice every admission discharged on ``day``, in local time."""
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    end = start + datetime.timedelta(days=1)
+    return issue_invoices(AdmissionRecord.objects.filter(discharge_date__gte=start, discharge_date__lt=end))
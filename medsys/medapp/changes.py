@@ -0,0 +1,5 @@
+import datetime
+
+# auto_now stamps are taken before commit, so a slow transaction can land rows
+# just behind a cursor already handed out; deltas re-read this much overlap.
+CURSOR_OVERLAP = datetime.timedelta(seconds=5)
@@ -0,0 +1,191 @@
+import json
+import zlib
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .changes import CURSOR_OVERLAP
+from .interactions import is_active
+from .models import AdmissionRecord, Patient, PatientMedicalHistory, Prescription
+
+EXPORT_CHUNK_SIZE = 2000
+# Lines are grouped into writes of about this many bytes.
+WRITE_SIZE = 64 * 1024
+CONDITION_STATUS = 'http://terminology.hl7.org/CodeSystem/condition-clinical'
+ENCOUNTER_CLASS = 'http://terminology.hl7.org/CodeSystem/v3-ActCode'
+GENDERS = {'m': 'male', 'f': 'female', 'o': 'other'}
+
+
+def instant(value):
+    return value.isoformat() if value else None
+
+
+def reference(kind, pk):
+    return {'reference': f'{kind}/{pk}'} if pk else None
+
+
+def parse_since(value):
+    """An aware datetime from an ISO 8601 ``_since`` value; raises ValueError."""
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f"Invalid _since: {value!r}")
+    return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+
+def compact(resource):
+    return {key: value for key, value in resource.items() if value not in (None, '', [], {})}
+
+
+# ------------------------------
+# Resources
+# ------------------------------
+
+def patient_resource(row, today):
+    return compact({
+        'resourceType': 'Patient',
+        'id': str(row['id']),
+        'meta': {'lastUpdated': instant(row['updated_at'])},
+        'name': [compact({'family': row['user__last_name'], 'given': [row['user__first_name']] if row['user__first_name'] else []})],
+        'gender': GENDERS.get((row['gender'] or 'u')[0].lower(), 'unknown'),
+        'birthDate': instant(row['date_of_birth']),
+        'telecom': [{'system': 'phone', 'value': row['phone']}] if row['phone'] else [],
+        'contact': [{'name': {'text': row['emergency_contact']}}] if row['emergency_contact'] else [],
+        'extension': [{'url': 'urn:medsys:blood-group', 'valueString': row['blood_group']}] if row['blood_group'] else [],
+    })
+
+
+def condition_resource(row, today):
+    # FHIR has no "chronic" clinical status; a chronic condition is active.
+    status = 'resolved' if row['status1'] == 'resolved' else 'active' if row['status1'] else None
+    return compact({
+        'resourceType': 'Condition',
+        'id': str(row['id']),
+        'meta': {'lastUpdated': instant(row['updated_at'])},
+        'subject': reference('Patient', row['patient_id']),
+        'code': {'text': row['condition_name']},
+        'clinicalStatus': {'coding': [{'system': CONDITION_STATUS, 'code': status}]} if status else None,
+        'onsetDateTime': instant(row['diagnosis_date']),
+        'note': [{'text': row['notes']}] if row['notes'] else [],
+    })
+
+
+def encounter_resource(row, today):
+    bed = f"{row['bed__ward__code']} {row['bed__room__number']}-{row['bed__label']}" if row['bed__label'] else None
+    return compact({
+        'resourceType': 'Encounter',
+        'id': str(row['id']),
+        'meta': {'lastUpdated': instant(row['updated_at'])},
+        'status': 'finished' if row['discharge_date'] else 'in-progress',
+        'class': {'system': ENCOUNTER_CLASS, 'code': 'IMP', 'display': 'inpatient encounter'},
+        'subject': reference('Patient', row['patient_id']),
+        'period': compact({'start': instant(row['admission_date']), 'end': instant(row['discharge_date'])}),
+        'participant': [
+            {'type': [{'text': role}], 'individual': reference('Practitioner', pk)}
+            for role, pk in (('primary', row['primary_doctor_id']), ('assistant', row['assistant_doctor_id'])) if pk
+        ],
+        'reasonCode': [{'text': row['admission_reason']}] if row['admission_reason'] else [],
+        'location': [{'location': {'display': bed}}] if bed else [],
+        'hospitalization': {'dischargeDisposition': {'text': row['discharge_summary']}} if row['discharge_summary'] else None,
+    })
+
+
+def medication_request_resource(row, today):
+    timing = compact({
+        'frequency': row['frequency'] or len(row['dose_times']) or None,
+        'period': 1 if row['frequency'] or row['dose_times'] else None,
+        'periodUnit': 'd' if row['frequency'] or row['dose_times'] else None,
+        'timeOfDay': [f'{value}:00' for value in row['dose_times']],
+    })
+    return compact({
+        'resourceType': 'MedicationRequest',
+        'id': str(row['id']),
+        'meta': {'lastUpdated': instant(row['updated_at'])},
+        'status': 'active' if is_active(row, today) else 'completed',
+        'intent': 'order',
+        'medicationCodeableConcept': {'text': row['medicine__name']} if row['medicine__name'] else None,
+        'subject': reference('Patient', row['patient_id']),
+        'authoredOn': instant(row['created_at']),
+        'requester': reference('Practitioner', row['assistant_doctor_id']),
+        'dosageInstruction': [compact({'text': row['dosage'], 'timing': {'repeat': timing} if timing else None})],
+        'dispenseRequest': compact({
+            'validityPeriod': {'start': instant(row['start_date'])} if row['start_date'] else None,
+            'expectedSupplyDuration': (
+                {'value': row['duration_days'], 'unit': 'days'} if row['duration_days'] is not None else None
+            ),
+        }),
+        'note': [{'text': row['notes']}] if row['notes'] else [],
+    })
+
+
+# resourceType: (model, columns, builder)
+RESOURCES = {
+    'Patient': (
+        Patient,
+        ('id', 'updated_at', 'date_of_birth', 'gender', 'blood_group', 'phone', 'emergency_contact',
+         'user__first_name', 'user__last_name'),
+        patient_resource,
+    ),
+    'Condition': (
+        PatientMedicalHistory,
+        ('id', 'updated_at', 'patient_id', 'condition_name', 'diagnosis_date', 'status1', 'notes'),
+        condition_resource,
+    ),
+    'Encounter': (
+        AdmissionRecord,
+        ('id', 'updated_at', 'patient_id', 'admission_date', 'discharge_date', 'primary_doctor_id', 'assistant_doctor_id',
+         'admission_reason', 'discharge_summary', 'bed__label', 'bed__room__number', 'bed__ward__code'),
+        encounter_resource,
+    ),
+    'MedicationRequest': (
+        Prescription,
+        ('id', 'updated_at', 'patient_id', 'assistant_doctor_id', 'created_at', 'medicine__name', 'dosage',
+         'duration_days', 'frequency', 'dose_times', 'start_date', 'notes'),
+        medication_request_resource,
+    ),
+}
+
+
+# ------------------------------
+# Export
+# ------------------------------
+
+def export_resources(resource_type, since=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """NDJSON lines, as bytes, for every ``resource_type`` row changed after ``since``.
+
+    Rows are streamed in primary key order, so memory stays at one chunk and
+    each resource appears once. ``since`` is moved back by CURSOR_OVERLAP so
+    rows stamped before a cursor but committed after it are sent next time;
+    clients upsert by id, so the repeats are harmless.
+    """
+    model, columns, build = RESOURCES[resource_type]
+    rows = model.objects.order_by('pk')
+    if since is not None:
+        rows = rows.filter(updated_at__gt=since - CURSOR_OVERLAP)
+    today = timezone.localdate()
+    for row in rows.values(*columns).iterator(chunk_size=chunk_size):
+        yield json.dumps(build(row, today), separators=(',', ':')).encode() + b'\n'
+
+
+def buffered(lines, size=WRITE_SIZE):
+    """Join ``lines`` into writes of about ``size`` bytes."""
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzipped(chunks):
+    """Compress a stream of byte chunks into one gzip member as it goes."""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,7 +1,13 @@
+import datetime
+import re
+
 from django import forms
+from django.core.exceptions import ValidationError
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Patient, Prescription, PatientMedicalHistory, AdmissionRecord, ROOM_CHOICES, Message
+from .models import Patient, Prescription, PatientMedicalHistory, AdmissionRecord, Message, Medicine, FREQUENCY_CHOICES
+from .beds import free_beds
+from .widgets import AutocompleteWidget
 
 class PatientSignUpForm(UserCreationForm):
     first_name = forms.CharField(required=True)
@@ -29,12 +35,34 @@ class PatientForm(forms.ModelForm):
             'date_of_birth': forms.DateInput(attrs={'type': 'date'}),
         }
         
+# Patient and staff pickers search over JSON instead of listing every row;
+# validation only looks up the submitted primary key in these querysets.
+
+def person_label(user):
+    return user.get_full_name() or user.username
+
+
+class PersonChoiceField(forms.ModelChoiceField):
+    def label_from_instance(self, obj):
+        return person_label(getattr(obj, 'user', obj))
+
+
+def patients_without_history():
+    return Patient.objects.filter(medical_histories__isnull=True).select_related('user')
+
+
+def staff_users():
+    return User.objects.filter(groups__name="Staff")
+
+
 class HistoryForm(forms.ModelForm):
     class Meta:
         model = PatientMedicalHistory
         fields = ['patient', 'condition_name', 'diagnosis_date','status1', 'notes']
+        field_classes = {'patient': PersonChoiceField}
         widgets = {
             'diagnosis_date': forms.DateInput(attrs={'type': 'date'}),
+            'patient': AutocompleteWidget('patient_search', params={'scope': 'unrecorded'}),
         }
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -43,55 +71,135 @@ class HistoryForm(forms.ModelForm):
         if self.instance and self.instance.pk:
             self.fields.pop('patient')
         else:
-            used_patients = list(PatientMedicalHistory.objects.values_list('patient_id', flat=True))
-            self.fields['patient'].queryset = Patient.objects.exclude(id__in=used_patients)
+            self.fields['patient'].queryset = patients_without_history()
         
 class AdmissionForm(forms.ModelForm):
-    assistant_doctor = forms.ModelChoiceField(
-        queryset=User.objects.filter(groups__name="Staff"),
+    assistant_doctor = PersonChoiceField(
+        queryset=staff_users(),
         required=False,
-        label="Assistant Doctor"
+        label="Assistant Doctor",
+        widget=AutocompleteWidget('staff_search'),
     )
     class Meta:
         model = AdmissionRecord
-        fields = ['admission_date', 'discharge_date', 'assistant_doctor', 'room_number', 'admission_reason', 'discharge_summary', 'status']
+        fields = ['admission_date', 'discharge_date', 'assistant_doctor', 'bed', 'admission_reason', 'discharge_summary', 'status']
         widgets = {
             'discharge_date': forms.DateInput(attrs={'type': 'date'}),
             'admission_date': forms.DateInput(attrs={'type': 'date'}),
+            # Free beds are found through the search endpoint, not listed.
+            'bed': AutocompleteWidget('bed_search'),
         }
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        occupied_rooms = AdmissionRecord.objects.filter(discharge_date__isnull=True).values_list('room_number', flat=True)
-
-        available_choices = [(num, str(num)) for num, label in ROOM_CHOICES if num not in occupied_rooms]
-        
-        if self.instance and self.instance.pk and self.instance.room_number:
-            current_room = self.instance.room_number
-            if (current_room, str(current_room)) not in available_choices:
-                available_choices.append((current_room, str(current_room)))
-                
-        available_choices = sorted(available_choices, key=lambda x: x[0])
-        
-        self.fields['room_number'].choices = available_choices
+        # The bed itself is claimed by beds.save_admission when the admission is saved.
+        current_bed = self.instance.bed_id if self.instance.pk else None
+        self.fields['bed'].queryset = free_beds(keep=current_bed)
         
     
+def assigned_patients(doctor):
+    return Patient.objects.filter(
+        id__in=AdmissionRecord.objects.filter(assistant_doctor=doctor).values('patient_id')
+    ).select_related('user')
+
+
+def medicine_choices(ids):
+    """Choices for the medicines in ``ids`` only; the rest are found by search."""
+    ids = [int(pk) for pk in ids if str(pk).isdigit()]
+    if not ids:
+        return []
+    return list(Medicine.objects.filter(active=True, id__in=ids).values_list('id', 'name'))
+
+
+def submitted_medicines(data, prefix='form'):
+    pattern = re.compile(rf'^{re.escape(prefix)}-\d+-medicine$')
+    return [value for key, value in data.items() if pattern.match(key)] if data else []
+
+
+class DoseTimesField(forms.CharField):
+    """Comma-separated times of day, e.g. "08:00, 20:00", cleaned to a sorted list."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('help_text', "Times of day such as 08:00, 20:00. Leave blank to use the frequency.")
+        super().__init__(**kwargs)
+
+    def prepare_value(self, value):
+        return ', '.join(value) if isinstance(value, (list, tuple)) else value
+
+    def to_python(self, value):
+        if isinstance(value, (list, tuple)):
+            value = ','.join(str(item) for item in value)
+        value = super().to_python(value)
+        times = []
+        for item in filter(None, (part.strip() for part in value.split(','))):
+            try:
+                times.append(datetime.time.fromisoformat(item).strftime('%H:%M'))
+            except ValueError:
+                raise ValidationError(f"'{item}' is not a time of day.")
+        return sorted(set(times))
+
+    def has_changed(self, initial, data):
+        try:
+            return self.to_python(initial or []) != self.to_python(data)
+        except ValidationError:
+            return True
+
+
 class PrescriptionForm(forms.ModelForm):
+    dose_times = DoseTimesField()
+
     class Meta:
         model = Prescription
-        fields = ['patient', 'medicine', 'dosage', 'duration_days','notes']
+        fields = ['patient', 'medicine', 'dosage', 'frequency', 'dose_times', 'start_date', 'duration_days','notes']
+        field_classes = {'patient': PersonChoiceField}
+        widgets = {
+            'start_date': forms.DateInput(attrs={'type': 'date'}),
+            'patient': AutocompleteWidget('patient_search', params={'scope': 'assigned'}),
+            'medicine': AutocompleteWidget('medicine_search'),
+        }
         
     def __init__(self, *args, **kwargs):
         doctor = kwargs.pop('doctor', None)  
         super().__init__(*args, **kwargs)
+        self.fields['medicine'].queryset = Medicine.objects.filter(active=True)
 
         if doctor:
-            assigned_patient_ids = AdmissionRecord.objects.filter(
-                assistant_doctor=doctor
-            ).values_list('patient__id', flat=True).distinct()
+            self.fields['patient'].queryset = assigned_patients(doctor)
+
+
+# Batch entry: one patient, many prescription lines.
+
+class PrescriptionBatchForm(forms.Form):
+    patient = PersonChoiceField(
+        queryset=Patient.objects.none(), widget=AutocompleteWidget('patient_search', params={'scope': 'assigned'}),
+    )
+
+    def __init__(self, *args, doctor=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['patient'].queryset = assigned_patients(doctor)
+
+
+class PrescriptionLineForm(forms.Form):
+    # A plain ChoiceField: the submitted medicines are fetched once per batch
+    # and shared by every line instead of each line re-running a queryset.
+    medicine = forms.TypedChoiceField(coerce=int, widget=AutocompleteWidget('medicine_search'))
+    dosage = forms.CharField(max_length=100, initial="1")
+    frequency = forms.TypedChoiceField(choices=[('', '---------')] + FREQUENCY_CHOICES, coerce=int, empty_value=None, required=False)
+    dose_times = DoseTimesField()
+    start_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    duration_days = forms.IntegerField(required=False, min_value=1)
+    notes = forms.CharField(required=False, widget=forms.TextInput)
+
+    def __init__(self, *args, medicines=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['medicine'].choices = medicines
+
+
+PrescriptionLineFormSet = forms.formset_factory(
+    PrescriptionLineForm, extra=5, min_num=1, validate_min=True, max_num=30, validate_max=True,
+)
 
-            self.fields['patient'].queryset = Patient.objects.filter(id__in=assigned_patient_ids)
-        
 class MessageForm(forms.ModelForm):
     class Meta:
         model = Message
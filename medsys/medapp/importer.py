@@ -0,0 +1,309 @@
+import csv
+import datetime
+import re
+import secrets
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import Group, User
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Medicine, MedicineCategory, Patient, PatientMedicalHistory
+
+IMPORT_CHUNK_SIZE = 5000
+BLOOD_GROUPS = {'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'}
+USERNAME = re.compile(r'^[\w.@+-]+\Z')
+HISTORY_STATUSES = {value for value, label in PatientMedicalHistory.STATUS_CHOICES1}
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportResult:
+    """Rows written, and ``(line, message)`` for every row skipped."""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+        self.patient_ids = set()
+
+    def add(self, other):
+        self.created += other.created
+        self.errors += other.errors
+        self.patient_ids |= other.patient_ids
+
+
+# ------------------------------
+# Field Checks
+# ------------------------------
+
+def text(row, column, max_length, required=False):
+    value = (row.get(column) or '').strip()
+    if required and not value:
+        raise RowError(f"{column} is required.")
+    if len(value) > max_length:
+        raise RowError(f"{column} is longer than {max_length} characters.")
+    return value
+
+
+def date(row, column, required=False):
+    value = (row.get(column) or '').strip()
+    if not value:
+        if required:
+            raise RowError(f"{column} is required.")
+        return None
+    try:
+        parsed = datetime.date.fromisoformat(value)
+    except ValueError:
+        raise RowError(f"{column} must be YYYY-MM-DD.")
+    if parsed > timezone.localdate():
+        raise RowError(f"{column} is in the future.")
+    return parsed
+
+
+def money(row, column):
+    try:
+        value = Decimal((row.get(column) or '').strip())
+    except InvalidOperation:
+        raise RowError(f"{column} must be a number.")
+    if not value.is_finite() or value < 0 or value != value.quantize(Decimal('0.01')) or value >= 10 ** 8:
+        raise RowError(f"{column} must be an amount with at most two decimals.")
+    return value
+
+
+# ------------------------------
+# Row Cleaning
+# ------------------------------
+
+def clean_patient(row):
+    username = text(row, 'username', 150, required=True)
+    if not USERNAME.match(username):
+        raise RowError("username may only contain letters, digits and @/./+/-/_.")
+    email = text(row, 'email', 254)
+    if email and '@' not in email:
+        raise RowError("email is not an email address.")
+    blood_group = text(row, 'blood_group', 5, required=True).upper()
+    if blood_group not in BLOOD_GROUPS:
+        raise RowError(f"Unknown blood_group {blood_group!r}.")
+    return {
+        'username': username,
+        'email': email,
+        'first_name': text(row, 'first_name', 150),
+        'last_name': text(row, 'last_name', 150),
+        'date_of_birth': date(row, 'date_of_birth'),
+        'gender': text(row, 'gender', 10, required=True),
+        'blood_group': blood_group,
+        'phone': text(row, 'phone', 20) or None,
+        'emergency_contact': text(row, 'emergency_contact', 100) or None,
+    }
+
+
+def clean_medicine(row):
+    active = (row.get('active') or 'true').strip().lower()
+    if active not in ('true', 'false', '1', '0', 'yes', 'no'):
+        raise RowError("active must be true or false.")
+    return {
+        'name': text(row, 'name', 100, required=True),
+        'category': text(row, 'category', 50, required=True),
+        'unit_price': money(row, 'unit_price'),
+        'description': text(row, 'description', 10000) or None,
+        'active': active in ('true', '1', 'yes'),
+    }
+
+
+def clean_history(row):
+    status = text(row, 'status', 20).lower() or None
+    if status and status not in HISTORY_STATUSES:
+        raise RowError(f"Unknown status {status!r}.")
+    return {
+        'patient': text(row, 'patient', 150, required=True),
+        'condition_name': text(row, 'condition_name', 100, required=True),
+        'diagnosis_date': date(row, 'diagnosis_date', required=True),
+        'status1': status,
+        'notes': text(row, 'notes', 10000) or None,
+    }
+
+
+def clean_chunk(rows, clean, result):
+    """``(line, cleaned)`` for the rows of one chunk that pass ``clean``."""
+    cleaned = []
+    for line, row in rows:
+        try:
+            cleaned.append((line, clean(row)))
+        except RowError as exc:
+            result.errors.append((line, str(exc)))
+    return cleaned
+
+
+def reject(cleaned, result, bad, message):
+    """Drop the rows ``bad`` flags, recording ``message(row)`` for each."""
+    kept = []
+    for line, row in cleaned:
+        if bad(row):
+            result.errors.append((line, message(row)))
+        else:
+            kept.append((line, row))
+    return kept
+
+
+# ------------------------------
+# Writers
+# ------------------------------
+
+def write_patients(cleaned, result):
+    # Usernames already in the database come back from one IN query; a
+    # repeat within the file keeps its first row.
+    taken = set(
+        User.objects.filter(username__in={row['username'] for _, row in cleaned}).values_list('username', flat=True)
+    )
+
+    def duplicate(row):
+        if row['username'] in taken:
+            return True
+        taken.add(row['username'])
+        return False
+
+    cleaned = reject(cleaned, result, duplicate, lambda row: f"username {row['username']!r} already exists.")
+
+    # Accounts get an unusable password and patients set their own through
+    # a password reset link, so no password is hashed during the import.
+    users = User.objects.bulk_create([
+        User(
+            username=row['username'], email=row['email'], first_name=row['first_name'], last_name=row['last_name'],
+            password=UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30),
+        )
+        for _, row in cleaned
+    ])
+    group_id = Group.objects.get_or_create(name='Patients')[0].id
+    Membership = User.groups.through
+    Membership.objects.bulk_create([Membership(user_id=user.id, group_id=group_id) for user in users])
+    Patient.objects.bulk_create([
+        Patient(
+            user_id=user.id, date_of_birth=row['date_of_birth'], gender=row['gender'], blood_group=row['blood_group'],
+            phone=row['phone'], emergency_contact=row['emergency_contact'],
+        )
+        for user, (_, row) in zip(users, cleaned)
+    ])
+    result.created += len(users)
+    return users
+
+
+def write_medicines(cleaned, result):
+    names = {row['category'] for _, row in cleaned}
+    categories = dict(MedicineCategory.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = names - categories.keys()
+    if missing:
+        MedicineCategory.objects.bulk_create([MedicineCategory(name=name) for name in sorted(missing)])
+        categories = dict(MedicineCategory.objects.filter(name__in=names).values_list('name', 'id'))
+
+    existing = set(
+        Medicine.objects.filter(name__in={row['name'] for _, row in cleaned}, category_id__in=categories.values())
+        .values_list('name', 'category_id')
+    )
+    seen = set()
+
+    def duplicate(row):
+        key = (row['name'], categories[row['category']])
+        if key in existing or key in seen:
+            return True
+        seen.add(key)
+        return False
+
+    cleaned = reject(cleaned, result, duplicate, lambda row: f"{row['name']!r} is already in {row['category']!r}.")
+    Medicine.objects.bulk_create([
+        Medicine(
+            name=row['name'], category_id=categories[row['category']], unit_price=row['unit_price'],
+            description=row['description'], active=row['active'],
+        )
+        for _, row in cleaned
+    ])
+    result.created += len(cleaned)
+    return cleaned
+
+
+def write_histories(cleaned, result):
+    usernames = {row['patient'] for _, row in cleaned}
+    patients = dict(Patient.objects.filter(user__username__in=usernames).values_list('user__username', 'id'))
+    cleaned = reject(cleaned, result, lambda row: row['patient'] not in patients, lambda row: f"No patient {row['patient']!r}.")
+    PatientMedicalHistory.objects.bulk_create([
+        PatientMedicalHistory(
+            patient_id=patients[row['patient']], condition_name=row['condition_name'],
+            diagnosis_date=row['diagnosis_date'], status1=row['status1'], notes=row['notes'],
+        )
+        for _, row in cleaned
+    ])
+    result.created += len(cleaned)
+    result.patient_ids.update(patients[row['patient']] for _, row in cleaned)
+    return cleaned
+
+
+# ------------------------------
+# Import
+# ------------------------------
+
+# kind: (row cleaner, chunk writer)
+IMPORTERS = {
+    'patients': (clean_patient, write_patients),
+    'medicines': (clean_medicine, write_medicines),
+    'histories': (clean_history, write_histories),
+}
+
+
+def numbered_rows(file):
+    # Line 1 is the header, so data starts on line 2.
+    return enumerate(csv.DictReader(file), start=2)
+
+
+def attempt(write, cleaned, result):
+    # One savepoint; what it created is only counted once it is released.
+    partial = ImportResult()
+    with transaction.atomic():
+        created = write(cleaned, partial)
+    result.add(partial)
+    return created
+
+
+def write_chunk(write, cleaned, result):
+    """Write one chunk, retrying row by row if another writer got in first.
+
+    The writers check for existing rows before inserting, but a username
+    created concurrently can still land between that check and the insert.
+    The chunk is then rewritten one savepoint per row, so only the clashing
+    rows are reported.
+    """
+    try:
+        return attempt(write, cleaned, result)
+    except IntegrityError:
+        pass
+    created = []
+    for line, row in cleaned:
+        try:
+            created += attempt(write, [(line, row)], result)
+        except IntegrityError as exc:
+            result.errors.append((line, f"Could not be saved: {exc}"))
+    return created
+
+
+def import_csv(kind, file, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """Import a CSV of ``kind`` rows, one transaction per chunk.
+
+    Bad rows are recorded in the result and skipped; the rest of their chunk
+    is still written. ``on_chunk`` is called with what each committed chunk
+    created, the new users for patients.
+    """
+    clean, write = IMPORTERS[kind]
+    result = ImportResult()
+    rows = numbered_rows(file)
+    while chunk := list(islice(rows, chunk_size)):
+        cleaned = clean_chunk(chunk, clean, result)
+        if not cleaned:
+            continue
+        with transaction.atomic():
+            created = write_chunk(write, cleaned, result)
+        if on_chunk:
+            on_chunk(created)
+    result.errors.sort()
+    return result
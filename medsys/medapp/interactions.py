@@ -0,0 +1,241 @@
+import datetime
+import threading
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Interaction, InteractionAlert, InteractionScan, Prescription
+
+# Sent with ``patient_ids`` whenever alerts are raised, re-graded or removed.
+alerts_changed = Signal()
+
+# Prescription columns needed to place a drug and decide if it is still taken.
+DRUG_FIELDS = ('id', 'patient_id', 'medicine_id', 'medicine__category_id', 'start_date', 'created_at', 'duration_days')
+
+
+# ------------------------------
+# Pair Index
+# ------------------------------
+
+class InteractionIndex:
+    """Every interaction keyed both ways, by medicine id and by category id.
+
+    Checking two drugs is two dictionary probes, so checking one drug against
+    a patient's others costs O(active medicines) and no queries.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.medicines = defaultdict(dict)
+        self.categories = defaultdict(dict)
+        for pk, medicine_a, medicine_b, category_a, category_b, severity in rows:
+            if medicine_a:
+                pairs, a, b = self.medicines, medicine_a, medicine_b
+            else:
+                pairs, a, b = self.categories, category_a, category_b
+            pairs[a][b] = pairs[b][a] = (pk, severity)
+
+    def __bool__(self):
+        return bool(self.medicines or self.categories)
+
+    def between(self, first, second):
+        """``(interaction_id, severity)`` pairs between two ``(medicine, category)`` drugs."""
+        found = []
+        if first[0] in self.medicines and second[0] in self.medicines[first[0]]:
+            found.append(self.medicines[first[0]][second[0]])
+        if first[1] in self.categories and second[1] in self.categories[first[1]]:
+            found.append(self.categories[first[1]][second[1]])
+        return found
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def index_version():
+    # Any insert, update or delete changes the row count or the latest stamp.
+    version = Interaction.objects.aggregate(n=Count('id'), latest=Max('updated_at'))
+    return version['n'], version['latest']
+
+
+def get_index():
+    """The process-wide index, rebuilt when the interaction table has changed."""
+    global _index
+    version = index_version()
+    with _lock:
+        if _index is None or _index.version != version:
+            rows = Interaction.objects.values_list(
+                'id', 'medicine_a_id', 'medicine_b_id', 'category_a_id', 'category_b_id', 'severity',
+            )
+            _index = InteractionIndex(version, rows)
+        return _index
+
+
+# ------------------------------
+# Checking
+# ------------------------------
+
+def is_active(drug, today):
+    duration = drug['duration_days']
+    if duration is None:
+        return True
+    start = drug['start_date'] or timezone.localdate(drug['created_at'])
+    return start + datetime.timedelta(days=duration) > today
+
+
+def find_alerts(index, drugs, new_ids=None):
+    """Alerts for interacting pairs among one patient's ``drugs``.
+
+    With ``new_ids`` only pairs involving those prescriptions are checked.
+    """
+    alerts = {}
+    for drug in drugs:
+        if new_ids is not None and drug['id'] not in new_ids:
+            continue
+        key = (drug['medicine_id'], drug['medicine__category_id'])
+        for other in drugs:
+            if other['id'] == drug['id'] or other['medicine_id'] is None:
+                continue
+            for interaction_id, severity in index.between(key, (other['medicine_id'], other['medicine__category_id'])):
+                later, earlier = max(drug['id'], other['id']), min(drug['id'], other['id'])
+                alerts[later, earlier, interaction_id] = InteractionAlert(
+                    patient_id=drug['patient_id'], prescription_id=later, other_id=earlier,
+                    interaction_id=interaction_id, severity=severity,
+                )
+    return list(alerts.values())
+
+
+def sync_alerts(scope, alerts, batch_size=5000):
+    """Make the alerts in ``scope`` exactly ``alerts``, in one transaction.
+
+    New alerts and re-graded ones are upserted and the rest of ``scope`` is
+    deleted, so alerts go away when a drug is changed, ends or moves to
+    another patient. bulk_create sends no model signals, so the patients
+    affected are announced through ``alerts_changed``. Returns ``alerts``.
+    """
+    existing = {
+        (row['prescription_id'], row['other_id'], row['interaction_id']): row
+        for row in scope.values('id', 'patient_id', 'prescription_id', 'other_id', 'interaction_id', 'severity')
+    }
+    found = set()
+    changed = []
+    for alert in alerts:
+        key = (alert.prescription_id, alert.other_id, alert.interaction_id)
+        found.add(key)
+        old = existing.get(key)
+        if old is None or old['severity'] != alert.severity:
+            changed.append(alert)
+    stale = [row for key, row in existing.items() if key not in found]
+    if not changed and not stale:
+        return alerts
+
+    with transaction.atomic():
+        # A severity edited in the table is carried over to alerts already raised.
+        InteractionAlert.objects.bulk_create(
+            changed, batch_size=batch_size, update_conflicts=True,
+            unique_fields=['prescription', 'other', 'interaction'], update_fields=['severity'],
+        )
+        for start in range(0, len(stale), batch_size):
+            InteractionAlert.objects.filter(id__in=[row['id'] for row in stale[start:start + batch_size]]).delete()
+        patient_ids = {alert.patient_id for alert in changed} | {row['patient_id'] for row in stale}
+        if patient_ids:
+            alerts_changed.send(sender=InteractionAlert, patient_ids=patient_ids)
+    return alerts
+
+
+def check_prescriptions(prescriptions, created=False):
+    """Check new or changed ``prescriptions`` against their patients' active ones.
+
+    After the index version check, one query per patient for their
+    prescriptions, one for the alerts they already had (skipped when
+    ``created``, as new rows have none) and one insert. Returns the alerts
+    raised.
+    """
+    checked = {p.pk for p in prescriptions if p.pk}
+    new_ids = {p.pk for p in prescriptions if p.pk and p.medicine_id}
+    if created:
+        if not new_ids:
+            return []
+        scope = InteractionAlert.objects.none()
+    elif checked:
+        scope = InteractionAlert.objects.filter(Q(prescription_id__in=checked) | Q(other_id__in=checked))
+    else:
+        return []
+
+    index = get_index() if new_ids else None
+    today = timezone.localdate()
+    alerts = []
+    if index:
+        for patient_id in {p.patient_id for p in prescriptions if p.pk in new_ids}:
+            drugs = Prescription.objects.filter(patient_id=patient_id, medicine__isnull=False).values(*DRUG_FIELDS)
+            drugs = [drug for drug in drugs if drug['id'] in new_ids or is_active(drug, today)]
+            alerts += find_alerts(index, drugs, new_ids)
+    return sync_alerts(scope, alerts)
+
+
+def check_patient(patient_id):
+    """Check every pair of a patient's active prescriptions."""
+    index = get_index()
+    today = timezone.localdate()
+    drugs = Prescription.objects.filter(patient_id=patient_id, medicine__isnull=False).values(*DRUG_FIELDS)
+    alerts = find_alerts(index, [drug for drug in drugs if is_active(drug, today)])
+    return sync_alerts(InteractionAlert.objects.filter(patient_id=patient_id), alerts)
+
+
+def patient_batches(last_id, batch_size):
+    """Active-medicine rows up to ``last_id``, a few whole patients at a time.
+
+    Keyset pages on patient id, so no cursor stays open across the writes
+    made between pages. Yields ``(first patient id, last patient id, drugs)``.
+    """
+    prescriptions = Prescription.objects.filter(medicine__isnull=False, id__lte=last_id).order_by('patient_id', 'id')
+    after = 0
+    while True:
+        drugs = list(prescriptions.filter(patient_id__gt=after).values(*DRUG_FIELDS)[:batch_size])
+        if not drugs:
+            return
+        cut = drugs[-1]['patient_id']
+        if len(drugs) == batch_size:
+            if drugs[0]['patient_id'] == cut:
+                # One patient fills the page; read all of theirs.
+                drugs = list(prescriptions.filter(patient_id=cut).values(*DRUG_FIELDS))
+            else:
+                # The last patient may continue on the next page.
+                drugs = [drug for drug in drugs if drug['patient_id'] != cut]
+                cut = drugs[-1]['patient_id']
+        yield after, cut, drugs
+        after = cut
+
+
+def scan_all(force=False, batch_size=5000):
+    """Re-check every patient's active prescriptions if the table changed.
+
+    Reads and commits one page of patients at a time, so writers elsewhere
+    wait for one page at most. Prescriptions added during the scan are left
+    to their own check. Returns the InteractionScan recorded, or None when
+    the last scan already covered this version.
+    """
+    index = get_index()
+    count, latest = index.version
+    last = InteractionScan.objects.order_by('-finished_at', '-id').first()
+    if not force and last and (last.interactions, last.latest_change) == (count, latest):
+        return None
+
+    today = timezone.localdate()
+    last_id = Prescription.objects.aggregate(last=Max('id'))['last'] or 0
+    alerts = InteractionAlert.objects.filter(prescription_id__lte=last_id)
+    raised = 0
+    after = 0
+    for after, through, drugs in patient_batches(last_id, batch_size):
+        found = []
+        for _, patient_drugs in groupby(drugs, key=lambda drug: drug['patient_id']):
+            found += find_alerts(index, [drug for drug in patient_drugs if is_active(drug, today)])
+        # Patients in the range without a listed drug keep no alerts either.
+        raised += len(sync_alerts(alerts.filter(patient_id__gt=after, patient_id__lte=through), found, batch_size))
+        after = through
+    sync_alerts(alerts.filter(patient_id__gt=after), [], batch_size)
+    return InteractionScan.objects.create(interactions=count, latest_change=latest, alerts=raised)
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from medapp.fhir import EXPORT_CHUNK_SIZE, RESOURCES, buffered, export_resources, gzipped, parse_since
+
+
+class Command(BaseCommand):
+    help = "Bulk-export patients, conditions, encounters and medication requests as FHIR NDJSON, one file per type."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='.', help="Directory to write <Type>.ndjson files into.")
+        parser.add_argument('--type', action='append', choices=list(RESOURCES), help="Resource type; repeat for several.")
+        parser.add_argument('--since', help="Only resources changed after this ISO 8601 time, less a few seconds of overlap.")
+        parser.add_argument('--gzip', action='store_true', help="Write .ndjson.gz files.")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since']) if options['since'] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+        os.makedirs(options['output'], exist_ok=True)
+
+        transaction_time = timezone.now()
+        for resource_type in options['type'] or RESOURCES:
+            path = os.path.join(options['output'], f"{resource_type}.ndjson" + ('.gz' if options['gzip'] else ''))
+            count = 0
+
+            def counted(lines):
+                nonlocal count
+                for line in lines:
+                    count += 1
+                    yield line
+
+            content = buffered(counted(export_resources(resource_type, since, options['chunk_size'])))
+            if options['gzip']:
+                content = gzipped(content)
+            with open(path, 'wb') as output:
+                output.writelines(content)
+            self.stdout.write(f"{resource_type}: {count} resource(s) -> {path}")
+        self.stdout.write(self.style.SUCCESS(f"Export complete. Pass --since {transaction_time.isoformat()} next time."))
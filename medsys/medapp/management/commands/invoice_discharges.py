@@ -0,0 +1,25 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from medapp.billing import invoice_discharges
+
+
+class Command(BaseCommand):
+    help = "Materialise invoices for every admission discharged on one day."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Discharge date as YYYY-MM-DD; defaults to yesterday.")
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                day = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError("--date must be YYYY-MM-DD.")
+        else:
+            day = timezone.localdate() - datetime.timedelta(days=1)
+        invoices = invoice_discharges(day)
+        total = sum(invoice.total for invoice in invoices)
+        self.stdout.write(self.style.SUCCESS(f"Issued {len(invoices)} invoice(s) for {day}, totalling {total:.2f}."))
@@ -0,0 +1,84 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from medapp.models import SEVERITY_CHOICES, Interaction, Medicine, MedicineCategory
+
+SEVERITIES = {label.lower(): value for value, label in SEVERITY_CHOICES}
+SEVERITIES.update({str(value): value for value, label in SEVERITY_CHOICES})
+
+# CSV column "kind" -> (model, Interaction field prefix)
+KINDS = {
+    'medicine': (Medicine, 'medicine'),
+    'category': (MedicineCategory, 'category'),
+}
+
+
+def read_interactions(rows):
+    """Build unsaved Interactions from CSV dicts, resolving names in two queries.
+
+    Rows have ``kind`` (medicine or category), ``first``, ``second``,
+    ``severity`` (name or 1-4) and an optional ``description``.
+    """
+    rows = list(rows)
+    ids = {}
+    for kind, (model, _) in KINDS.items():
+        names = {row[key].strip() for row in rows if row['kind'].strip() == kind for key in ('first', 'second')}
+        # The lowest id wins where names repeat, matching the catalog's oldest entry.
+        found = model.objects.filter(name__in=names).order_by('-id').values_list('name', 'id')
+        ids[kind] = dict(found)
+
+    interactions, errors = [], []
+    for line, row in enumerate(rows, start=2):
+        kind = row['kind'].strip()
+        if kind not in KINDS:
+            errors.append(f"line {line}: unknown kind {kind!r}")
+            continue
+        first, second = (ids[kind].get(row[key].strip()) for key in ('first', 'second'))
+        severity = SEVERITIES.get(row['severity'].strip().lower())
+        if first is None or second is None:
+            errors.append(f"line {line}: unknown {kind} {row['first']!r} or {row['second']!r}")
+        elif severity is None:
+            errors.append(f"line {line}: unknown severity {row['severity']!r}")
+        else:
+            prefix = KINDS[kind][1]
+            a, b = sorted((first, second))
+            interactions.append(Interaction(
+                **{f'{prefix}_a_id': a, f'{prefix}_b_id': b},
+                severity=severity, description=(row.get('description') or '').strip(),
+            ))
+    return interactions, errors
+
+
+@transaction.atomic
+def load_interactions(interactions, replace=False, batch_size=5000):
+    """Upsert ``interactions`` on their pair; ``replace`` drops pairs not given."""
+    if replace:
+        Interaction.objects.all().delete()
+    for prefix in ('medicine', 'category'):
+        rows = [i for i in interactions if getattr(i, f'{prefix}_a_id')]
+        Interaction.objects.bulk_create(
+            rows, batch_size=batch_size, update_conflicts=True,
+            unique_fields=[f'{prefix}_a', f'{prefix}_b'], update_fields=['severity', 'description', 'updated_at'],
+        )
+    return len(interactions)
+
+
+class Command(BaseCommand):
+    help = "Load drug interactions from a CSV with columns kind, first, second, severity, description."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--replace', action='store_true', help="Delete interactions missing from the file.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='') as fh:
+                interactions, errors = read_interactions(csv.DictReader(fh))
+        except (OSError, KeyError) as exc:
+            raise CommandError(f"Cannot read {options['path']}: {exc}")
+        if errors:
+            raise CommandError("Nothing loaded:\n  " + "\n  ".join(errors))
+        count = load_interactions(interactions, replace=options['replace'])
+        self.stdout.write(self.style.SUCCESS(f"Loaded {count} interaction(s)."))
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from medapp.reports import build_report, report_window
+
+
+class Command(BaseCommand):
+    help = "Report bed occupancy, length of stay per doctor and prescribing volume over a date range."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day, YYYY-MM-DD.")
+        parser.add_argument('--end', help="Last day, YYYY-MM-DD; defaults to today.")
+        parser.add_argument('--days', type=int, default=30, help="Days ending on --end when --start is not given.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            start, end = report_window(options['start'], options['end'], options['days'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        report = build_report(start, end)
+        if options['json']:
+            self.stdout.write(json.dumps(report, cls=DjangoJSONEncoder, indent=2))
+            return
+
+        occupancy = report['occupancy']
+        self.stdout.write(f"MedSys report {report['start']} to {report['end']}")
+        self.stdout.write(
+            f"\nBed occupancy ({report['beds']} beds): mean {occupancy['mean']}, peak {occupancy['peak']} on {occupancy['peak_date']}"
+        )
+        self.stdout.write("\nLength of stay by primary doctor (" + ", ".join(report['stay_buckets']) + "):")
+        for row in report['stays']:
+            buckets = ' '.join(str(count) for count in row['buckets'])
+            self.stdout.write(f"  {row['doctor']}: {row['stays']} stays, mean {row['mean_days']} days [{buckets}]")
+        self.stdout.write("\nPrescriptions by category:")
+        for row in report['categories']:
+            self.stdout.write(f"  {row['category']}: {row['prescriptions']}")
+        self.stdout.write("\nMost prescribed medicines:")
+        for row in report['medicines'][:20]:
+            self.stdout.write(f"  {row['medicine']} ({row['category']}): {row['prescriptions']}")
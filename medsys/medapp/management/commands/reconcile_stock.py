@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from medapp.models import MedicineStock, StockLot
+from medapp.stock import ledger_totals
+
+
+def reconcile(dry_run=False):
+    """Rebuild lot and medicine balances from the stock ledger.
+
+    Returns ``{'lots': {id: (stored, actual)}, 'medicines': {id: (stored, actual)}}``
+    for every balance that was wrong.
+    """
+    with transaction.atomic():
+        lot_totals, medicine_totals = ledger_totals()
+        drift = {'lots': {}, 'medicines': {}}
+        for lot_id, stored in StockLot.objects.values_list('id', 'on_hand').iterator():
+            actual = lot_totals.get(lot_id, 0)
+            if stored != actual:
+                drift['lots'][lot_id] = (stored, actual)
+        stored = dict(MedicineStock.objects.values_list('medicine_id', 'on_hand'))
+        for medicine_id in stored.keys() | medicine_totals.keys():
+            if stored.get(medicine_id, 0) != medicine_totals.get(medicine_id, 0):
+                drift['medicines'][medicine_id] = (stored.get(medicine_id, 0), medicine_totals.get(medicine_id, 0))
+
+        if not dry_run:
+            StockLot.objects.bulk_update(
+                [StockLot(id=lot_id, on_hand=actual) for lot_id, (_, actual) in drift['lots'].items()],
+                ['on_hand'], batch_size=5000,
+            )
+            MedicineStock.objects.bulk_create(
+                [MedicineStock(medicine_id=medicine_id, on_hand=actual)
+                 for medicine_id, (_, actual) in drift['medicines'].items()],
+                update_conflicts=True, unique_fields=['medicine'], update_fields=['on_hand'], batch_size=5000,
+            )
+    return drift
+
+
+class Command(BaseCommand):
+    help = "Rebuild lot and per-medicine stock balances from the stock ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        drift = reconcile(dry_run=options['dry_run'])
+        for kind in ('lots', 'medicines'):
+            for pk, (stored, actual) in sorted(drift[kind].items()):
+                self.stdout.write(f"{kind[:-1]} {pk}: {stored} -> {actual}")
+        verb = "Found" if options['dry_run'] else "Repaired"
+        total = len(drift['lots']) + len(drift['medicines'])
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} drifted balance(s)."))
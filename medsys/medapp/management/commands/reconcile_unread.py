@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from medapp.models import Message, UnreadCounter
+
+
+def reconcile(dry_run=False):
+    """Recount unread messages per recipient and repair counters that drifted.
+
+    Returns ``{user_id: (stored, actual)}`` for every counter that was wrong.
+    """
+    with transaction.atomic():
+        actual = dict(
+            Message.objects.filter(is_read=False).values('recipient_id').annotate(n=Count('id'))
+            .order_by().values_list('recipient_id', 'n')
+        )
+        stored = dict(UnreadCounter.objects.select_for_update().values_list('user_id', 'count'))
+        drift = {
+            user_id: (stored.get(user_id, 0), actual.get(user_id, 0))
+            for user_id in stored.keys() | actual.keys()
+            if stored.get(user_id, 0) != actual.get(user_id, 0)
+        }
+        if drift and not dry_run:
+            UnreadCounter.objects.bulk_create(
+                [UnreadCounter(user_id=user_id, count=count) for user_id, (_, count) in drift.items()],
+                update_conflicts=True, unique_fields=['user'], update_fields=['count'],
+            )
+    return drift
+
+
+class Command(BaseCommand):
+    help = "Recount unread messages and repair per-user unread counters that have drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        drift = reconcile(dry_run=options['dry_run'])
+        for user_id, (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f"user {user_id}: {stored} -> {actual}")
+        verb = "Found" if options['dry_run'] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drift)} drifted counter(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from medapp.interactions import scan_all
+
+
+class Command(BaseCommand):
+    help = "Re-check all active prescriptions for interactions if the interaction table changed since the last scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Scan even if the table is unchanged.")
+
+    def handle(self, *args, **options):
+        scan = scan_all(force=options['force'])
+        if scan is None:
+            self.stdout.write("Interaction table unchanged since the last scan; nothing to do.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Scan complete: {scan.alerts} interaction alert(s)."))
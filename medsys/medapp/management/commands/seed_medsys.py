@@ -0,0 +1,310 @@
+import datetime
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from medapp.models import (
+    FREQUENCY_CHOICES, AdmissionRecord, Bed, Medicine, MedicineCategory, MedicineStock, Message, Patient, PatientMedicalHistory,
+    Prescription, Room, StockLot, StockMovement, Ward,
+)
+from medapp.beds import rebuild_occupancy
+from medapp.billing import issue_invoices
+from medapp.schedules import sync_schedules
+from medapp.management.commands.reconcile_unread import reconcile as reconcile_unread
+
+FIRST_NAMES = ['Aarav', 'Maya', 'Liam', 'Sofia', 'Noah', 'Ingrid', 'Omar', 'Priya', 'Lars', 'Chen', 'Amara', 'Jonas']
+LAST_NAMES = ['Hansen', 'Patel', 'Okafor', 'Berg', 'Garcia', 'Tupe', 'Nilsen', 'Kim', 'Haddad', 'Larsen', 'Silva']
+GENDERS = ['Male', 'Female', 'Other']
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+CONDITIONS = ['Hypertension', 'Diabetes', 'Asthma', 'Pneumonia', 'Migraine', 'Fracture', 'Influenza', 'Anaemia']
+CATEGORIES = ['Tablets', 'Syrups', 'Injections', 'Capsules', 'Inhalers', 'Ointments', 'Drops', 'Patches']
+DOSAGES = ['1 tablet', '2 tablets', '5 ml', '10 ml', '1 puff', '1 injection']
+FREQUENCIES = [value for value, label in FREQUENCY_CHOICES]
+DAILY_RATES = [Decimal('80.00'), Decimal('120.00'), Decimal('150.00'), Decimal('250.00')]
+WARDS = ['Cardiology', 'Oncology', 'Orthopaedics', 'Neurology', 'Maternity', 'Paediatrics', 'Respiratory', 'Surgery']
+
+
+@contextmanager
+def historical_timestamps(*fields):
+    # bulk_create honours auto_now_add, which would stamp every seeded row with
+    # the same instant; switch it off so generated history keeps its dates.
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate synthetic patients, admissions, prescriptions and messages for scale testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--doctors', type=int, default=20)
+        parser.add_argument('--staff', type=int, default=50)
+        parser.add_argument('--categories', type=int, default=len(CATEGORIES))
+        parser.add_argument('--medicines', type=int, default=500)
+        parser.add_argument('--wards', type=int, default=len(WARDS))
+        parser.add_argument('--rooms', type=int, default=20, help="Rooms per ward.")
+        parser.add_argument('--beds', type=int, default=2, help="Beds per room.")
+        parser.add_argument('--histories', type=int, default=2, help="Average histories per patient.")
+        parser.add_argument('--admissions', type=int, default=2, help="Average admissions per patient.")
+        parser.add_argument('--prescriptions', type=int, default=5, help="Average prescriptions per admission.")
+        parser.add_argument('--messages', type=int, default=3, help="Average messages per admitted patient.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--password', default='medsys', help="Shared password, hashed once for every seeded user.")
+        parser.add_argument('--prefix', default='seed')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.prefix = options['prefix']
+        self.password = make_password(options['password'])
+        self.now = timezone.now().replace(microsecond=0)
+        self.groups = {name: Group.objects.get_or_create(name=name)[0] for name in ('Doctors', 'Staff', 'Patients')}
+
+        started = time.monotonic()
+        with transaction.atomic():
+            self.medicine_ids = self.seed_catalog(options['categories'], options['medicines'])
+            self.seed_stock(self.medicine_ids)
+            self.bed_ids = self.seed_wards(options['wards'], options['rooms'], options['beds'])
+            self.doctor_ids = self.seed_clinicians('doctor', 'Doctors', options['doctors'])
+            self.staff_ids = self.seed_clinicians('staff', 'Staff', options['staff'])
+        if not self.doctor_ids or not self.staff_ids:
+            raise CommandError("At least one doctor and one staff member are required.")
+        if not self.bed_ids:
+            raise CommandError("At least one bed is required.")
+        self.occupied_beds = set(
+            AdmissionRecord.objects.filter(discharge_date__isnull=True).values_list('bed_id', flat=True)
+        )
+
+        start = User.objects.filter(username__startswith=f'{self.prefix}_patient_').count()
+        total = options['patients']
+        batch_size = options['batch_size']
+        rows = 0
+        with historical_timestamps(
+            Patient._meta.get_field('created_at'),
+            AdmissionRecord._meta.get_field('created_at'),
+            Prescription._meta.get_field('created_at'),
+            Message._meta.get_field('timestamp'),
+        ):
+            for offset in range(0, total, batch_size):
+                count = min(batch_size, total - offset)
+                with transaction.atomic():
+                    rows += self.seed_patient_batch(start + offset, count)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{offset + count}/{total} patients, {rows} rows, {rows / elapsed:.0f} rows/s")
+
+        # bulk_create bypasses Message.save and save_admission, so derive the
+        # counters and invoices afterwards.
+        beds = rebuild_occupancy()
+        reconcile_unread()
+        invoices = issue_invoices(AdmissionRecord.objects.filter(discharge_date__isnull=False))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {total} patients ({rows} rows, {beds} beds occupied, {len(invoices)} invoices) in {time.monotonic() - started:.1f}s"
+        ))
+
+    # ------------------------------
+    # Catalog and clinicians
+    # ------------------------------
+
+    def seed_catalog(self, category_count, medicine_count):
+        missing = category_count - MedicineCategory.objects.count()
+        if missing > 0:
+            MedicineCategory.objects.bulk_create([
+                MedicineCategory(name=CATEGORIES[i % len(CATEGORIES)] + ('' if i < len(CATEGORIES) else f' {i}'))
+                for i in range(missing)
+            ])
+        category_ids = list(MedicineCategory.objects.values_list('id', flat=True))
+
+        missing = medicine_count - Medicine.objects.count()
+        if missing > 0:
+            Medicine.objects.bulk_create([
+                Medicine(
+                    name=f"Medicine {i:05d}",
+                    category_id=self.rng.choice(category_ids),
+                    unit_price=Decimal(self.rng.randint(50, 50000)) / 100,
+                    description=f"Synthetic formulary item {i}",
+                    active=self.rng.random() > 0.05,
+                )
+                for i in range(missing)
+            ], batch_size=self.options['batch_size'])
+        return list(Medicine.objects.filter(active=True).values_list('id', flat=True))
+
+    def seed_stock(self, medicine_ids):
+        # One lot per medicine, booked through the ledger so reconcile_stock agrees.
+        stocked = set(MedicineStock.objects.values_list('medicine_id', flat=True))
+        missing = [medicine_id for medicine_id in medicine_ids if medicine_id not in stocked]
+        batch_size = self.options['batch_size']
+        lots = StockLot.objects.bulk_create([
+            StockLot(
+                medicine_id=medicine_id,
+                lot_number=f"{self.prefix}-{medicine_id}",
+                expiry_date=self.now.date() + datetime.timedelta(days=self.rng.randint(30, 720)),
+                on_hand=self.rng.randint(0, 500),
+            )
+            for medicine_id in missing
+        ], batch_size=batch_size)
+        MedicineStock.objects.bulk_create([
+            MedicineStock(medicine_id=lot.medicine_id, on_hand=lot.on_hand, reorder_level=50) for lot in lots
+        ], batch_size=batch_size)
+        StockMovement.objects.bulk_create([
+            StockMovement(medicine_id=lot.medicine_id, lot=lot, kind='receive', quantity=lot.on_hand)
+            for lot in lots if lot.on_hand
+        ], batch_size=batch_size)
+
+    def seed_wards(self, ward_count, rooms_per_ward, beds_per_room):
+        types = [code for code, label in Bed.TYPE_CHOICES]
+        for i in range(Ward.objects.filter(code__startswith=f'{self.prefix}-').count(), ward_count):
+            ward = Ward.objects.create(
+                name=WARDS[i % len(WARDS)] + ('' if i < len(WARDS) else f' {i}'), code=f'{self.prefix}-{i}',
+            )
+            rooms = Room.objects.bulk_create([
+                Room(ward=ward, number=f'{i + 1}{r:02d}', capacity=beds_per_room, daily_rate=self.rng.choice(DAILY_RATES))
+                for r in range(1, rooms_per_ward + 1)
+            ])
+            Bed.objects.bulk_create([
+                Bed(room=room, ward=ward, label=chr(ord('A') + b), bed_type=self.rng.choice(types))
+                for room in rooms for b in range(beds_per_room)
+            ])
+        return list(Bed.objects.filter(active=True).values_list('id', flat=True))
+
+    def seed_clinicians(self, role, group_name, count):
+        username_prefix = f'{self.prefix}_{role}_'
+        existing = User.objects.filter(username__startswith=username_prefix).count()
+        if count > existing:
+            users = User.objects.bulk_create([self.make_user(username_prefix, i) for i in range(existing, count)])
+            self.add_to_group(users, group_name)
+        return list(
+            User.objects.filter(username__startswith=username_prefix, groups__name=group_name).values_list('id', flat=True)
+        )
+
+    def make_user(self, username_prefix, index):
+        first = self.rng.choice(FIRST_NAMES)
+        last = self.rng.choice(LAST_NAMES)
+        username = f'{username_prefix}{index}'
+        return User(
+            username=username, first_name=first, last_name=last,
+            email=f'{username}@example.org', password=self.password,
+        )
+
+    def add_to_group(self, users, group_name):
+        Membership = User.groups.through
+        group_id = self.groups[group_name].id
+        Membership.objects.bulk_create([Membership(user_id=user.id, group_id=group_id) for user in users])
+
+    # ------------------------------
+    # Patients and their records
+    # ------------------------------
+
+    def seed_patient_batch(self, start, count):
+        rng = self.rng
+        options = self.options
+        batch_size = options['batch_size']
+
+        users = User.objects.bulk_create([self.make_user(f'{self.prefix}_patient_', start + i) for i in range(count)])
+        self.add_to_group(users, 'Patients')
+        patients = Patient.objects.bulk_create([
+            Patient(
+                user_id=user.id,
+                date_of_birth=datetime.date(rng.randint(1930, 2020), rng.randint(1, 12), rng.randint(1, 28)),
+                gender=rng.choice(GENDERS),
+                blood_group=rng.choice(BLOOD_GROUPS),
+                phone=f'+47 {rng.randint(40000000, 99999999)}',
+                emergency_contact=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                created_at=self.now - datetime.timedelta(days=rng.randint(0, 3 * 365)),
+            )
+            for user in users
+        ])
+
+        histories = []
+        admissions = []
+        for patient in patients:
+            for _ in range(rng.randint(0, 2 * options['histories'])):
+                histories.append(PatientMedicalHistory(
+                    patient_id=patient.id,
+                    condition_name=rng.choice(CONDITIONS),
+                    diagnosis_date=(patient.created_at - datetime.timedelta(days=rng.randint(0, 2000))).date(),
+                    status1=rng.choice(PatientMedicalHistory.STATUS_CHOICES1)[0],
+                ))
+            admissions.extend(self.make_admissions(patient, rng.randint(0, 2 * options['admissions'])))
+        PatientMedicalHistory.objects.bulk_create(histories, batch_size=batch_size)
+        AdmissionRecord.objects.bulk_create(admissions, batch_size=batch_size)
+
+        user_ids = {patient.id: patient.user_id for patient in patients}
+        prescriptions = []
+        messages = []
+        for admission in admissions:
+            end = admission.discharge_date or self.now
+            span = max(int((end - admission.admission_date).total_seconds()), 1)
+            # Only current stays get structured schedules; older rows keep
+            # free-text dosages as legacy data does.
+            still_admitted = admission.discharge_date is None
+            for _ in range(rng.randint(0, 2 * options['prescriptions'])):
+                created_at = admission.admission_date + datetime.timedelta(seconds=rng.randrange(span))
+                prescriptions.append(Prescription(
+                    patient_id=admission.patient_id,
+                    assistant_doctor_id=admission.assistant_doctor_id,
+                    medicine_id=rng.choice(self.medicine_ids) if self.medicine_ids else None,
+                    dosage=rng.choice(DOSAGES),
+                    duration_days=rng.randint(1, 30),
+                    frequency=rng.choice(FREQUENCIES) if still_admitted else None,
+                    start_date=created_at.date() if still_admitted else None,
+                    created_at=created_at,
+                ))
+            for _ in range(rng.randint(0, 2 * options['messages'])):
+                messages.append(Message(
+                    sender_id=user_ids[admission.patient_id],
+                    recipient_id=admission.assistant_doctor_id,
+                    subject=f"Question about {rng.choice(CONDITIONS).lower()}",
+                    body="Synthetic message body.",
+                    timestamp=admission.admission_date + datetime.timedelta(seconds=rng.randrange(span)),
+                    is_read=admission.discharge_date is not None or rng.random() < 0.5,
+                ))
+        Prescription.objects.bulk_create(prescriptions, batch_size=batch_size)
+        doses, _ = sync_schedules([p for p in prescriptions if p.frequency], created=True)
+        Message.objects.bulk_create(messages, batch_size=batch_size)
+
+        return (
+            2 * len(users) + len(patients) + len(histories) + len(admissions) + len(prescriptions) + doses + len(messages)
+        )
+
+    def make_admissions(self, patient, count):
+        rng = self.rng
+        admissions = []
+        admitted = self.now - datetime.timedelta(days=rng.randint(30, 3 * 365))
+        for i in range(count):
+            stay = datetime.timedelta(days=rng.randint(1, 21), hours=rng.randint(0, 23))
+            bed = rng.choice(self.bed_ids)
+            last = i == count - 1
+            still_admitted = last and bed not in self.occupied_beds and rng.random() < 0.1
+            if still_admitted:
+                self.occupied_beds.add(bed)
+                admitted = max(admitted, self.now - stay)
+            admissions.append(AdmissionRecord(
+                patient_id=patient.id,
+                admission_date=admitted,
+                discharge_date=None if still_admitted else min(admitted + stay, self.now),
+                bed_id=bed,
+                primary_doctor_id=rng.choice(self.doctor_ids),
+                assistant_doctor_id=rng.choice(self.staff_ids),
+                admission_reason=rng.choice(CONDITIONS),
+                discharge_summary=None if still_admitted else "Recovered.",
+                status='admitted' if still_admitted else 'discharged',
+                created_at=admitted,
+            ))
+            admitted = admitted + stay + datetime.timedelta(days=rng.randint(1, 90))
+            if admitted >= self.now:
+                break
+        return admissions
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0017_admissionrecord_assistant_doctor_delete_staff"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="admissionrecord",
+            index=models.Index(
+                fields=["primary_doctor", "created_at"],
+                name="admission_doctor_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="admissionrecord",
+            index=models.Index(
+                fields=["patient", "admission_date"], name="admission_patient_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="admissionrecord",
+            index=models.Index(
+                condition=models.Q(("discharge_date__isnull", True)),
+                fields=["room_number"],
+                name="admission_open_room_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["recipient", "timestamp"], name="message_recipient_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientmedicalhistory",
+            index=models.Index(
+                fields=["patient", "diagnosis_date"], name="history_patient_diag_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prescription",
+            index=models.Index(
+                fields=["assistant_doctor", "patient", "created_at"],
+                name="presc_staff_patient_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prescription",
+            index=models.Index(
+                fields=["patient", "created_at"], name="presc_patient_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0018_hot_path_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="prescription",
+            index=models.Index(
+                fields=["assistant_doctor", "created_at"],
+                name="presc_staff_created_idx",
+            ),
+        ),
+    ]
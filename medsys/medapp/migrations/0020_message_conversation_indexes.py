@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0019_prescription_staff_created_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["recipient", "sender", "timestamp"],
+                name="message_conversation_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                condition=models.Q(("is_read", False)),
+                fields=["recipient", "sender"],
+                name="message_unread_idx",
+            ),
+        ),
+    ]
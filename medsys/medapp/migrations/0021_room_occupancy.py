@@ -0,0 +1,83 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_occupancy(apps, schema_editor):
+    AdmissionRecord = apps.get_model("medapp", "AdmissionRecord")
+    RoomOccupancy = apps.get_model("medapp", "RoomOccupancy")
+    # The most recent open admission keeps a room that was double-booked.
+    occupancies = {}
+    open_admissions = AdmissionRecord.objects.filter(
+        discharge_date__isnull=True
+    ).order_by("admission_date", "id")
+    for admission in open_admissions:
+        occupancies[admission.room_number] = RoomOccupancy(
+            room_number=admission.room_number,
+            admission_id=admission.id,
+            occupied_since=admission.admission_date,
+        )
+    RoomOccupancy.objects.bulk_create(occupancies.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0020_message_conversation_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoomOccupancy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "room_number",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (1, "1"),
+                            (2, "2"),
+                            (3, "3"),
+                            (4, "4"),
+                            (5, "5"),
+                            (6, "6"),
+                            (7, "7"),
+                            (8, "8"),
+                            (9, "9"),
+                            (10, "10"),
+                            (11, "11"),
+                            (12, "12"),
+                            (13, "13"),
+                            (14, "14"),
+                            (15, "15"),
+                            (16, "16"),
+                            (17, "17"),
+                            (18, "18"),
+                            (19, "19"),
+                            (20, "20"),
+                        ],
+                        unique=True,
+                    ),
+                ),
+                ("occupied_since", models.DateTimeField()),
+                (
+                    "admission",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occupancy",
+                        to="medapp.admissionrecord",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,221 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# ROOM_CHOICES before wards existed.
+LEGACY_ROOMS = range(1, 21)
+
+
+def migrate_rooms_to_beds(apps, schema_editor):
+    Ward = apps.get_model("medapp", "Ward")
+    Room = apps.get_model("medapp", "Room")
+    Bed = apps.get_model("medapp", "Bed")
+    AdmissionRecord = apps.get_model("medapp", "AdmissionRecord")
+    RoomOccupancy = apps.get_model("medapp", "RoomOccupancy")
+    BedOccupancy = apps.get_model("medapp", "BedOccupancy")
+
+    # Each legacy room becomes a one-bed room in a single general ward.
+    ward = Ward.objects.create(name="General Ward", code="general")
+    numbers = set(LEGACY_ROOMS) | set(
+        AdmissionRecord.objects.values_list("room_number", flat=True)
+    )
+    beds = {}
+    for number in sorted(numbers):
+        room = Room.objects.create(ward=ward, number=str(number), capacity=1)
+        beds[number] = Bed.objects.create(room=room, ward=ward, label="A")
+
+    for number, bed in beds.items():
+        AdmissionRecord.objects.filter(room_number=number).update(bed=bed)
+    BedOccupancy.objects.bulk_create(
+        BedOccupancy(
+            bed=beds[occupancy.room_number],
+            admission_id=occupancy.admission_id,
+            occupied_since=occupancy.occupied_since,
+        )
+        for occupancy in RoomOccupancy.objects.all()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0021_room_occupancy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Bed",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("label", models.CharField(max_length=10)),
+                (
+                    "bed_type",
+                    models.CharField(
+                        choices=[
+                            ("general", "General"),
+                            ("icu", "Intensive care"),
+                            ("isolation", "Isolation"),
+                            ("maternity", "Maternity"),
+                            ("paediatric", "Paediatric"),
+                        ],
+                        default="general",
+                        max_length=20,
+                    ),
+                ),
+                ("active", models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BedOccupancy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("occupied_since", models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Room",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.CharField(max_length=20)),
+                (
+                    "capacity",
+                    models.PositiveSmallIntegerField(
+                        default=1, help_text="Number of beds the room is staffed for."
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Ward",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("code", models.SlugField(max_length=20, unique=True)),
+                ("description", models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="admissionrecord",
+            name="bed",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="admissions",
+                to="medapp.bed",
+            ),
+        ),
+        migrations.AddField(
+            model_name="bedoccupancy",
+            name="admission",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="occupancy",
+                to="medapp.admissionrecord",
+            ),
+        ),
+        migrations.AddField(
+            model_name="bedoccupancy",
+            name="bed",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="occupancy",
+                to="medapp.bed",
+            ),
+        ),
+        migrations.AddField(
+            model_name="bed",
+            name="room",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="beds",
+                to="medapp.room",
+            ),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="ward",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="rooms",
+                to="medapp.ward",
+            ),
+        ),
+        migrations.AddField(
+            model_name="bed",
+            name="ward",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="beds",
+                to="medapp.ward",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="room",
+            constraint=models.UniqueConstraint(
+                fields=("ward", "number"), name="room_ward_number_uniq"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bed",
+            index=models.Index(
+                condition=models.Q(("active", True)),
+                fields=["ward", "bed_type"],
+                name="bed_search_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bed",
+            constraint=models.UniqueConstraint(
+                fields=("room", "label"), name="bed_room_label_uniq"
+            ),
+        ),
+        migrations.RunPython(migrate_rooms_to_beds, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name="admissionrecord",
+            name="admission_open_room_idx",
+        ),
+        migrations.RemoveField(
+            model_name="admissionrecord",
+            name="room_number",
+        ),
+        migrations.RemoveField(
+            model_name="roomoccupancy",
+            name="admission",
+        ),
+        migrations.DeleteModel(
+            name="RoomOccupancy",
+        ),
+    ]
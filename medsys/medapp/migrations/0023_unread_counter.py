@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    Message = apps.get_model("medapp", "Message")
+    UnreadCounter = apps.get_model("medapp", "UnreadCounter")
+    counts = (
+        Message.objects.filter(is_read=False)
+        .values("recipient_id")
+        .annotate(n=models.Count("id"))
+        .order_by()
+    )
+    UnreadCounter.objects.bulk_create(
+        UnreadCounter(user_id=row["recipient_id"], count=row["n"]) for row in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("medapp", "0022_wards_and_beds"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UnreadCounter",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="unread_counter",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
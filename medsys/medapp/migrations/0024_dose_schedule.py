@@ -0,0 +1,88 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0023_unread_counter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="prescription",
+            name="dose_times",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text="Times of day as HH:MM; defaults from frequency.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="prescription",
+            name="frequency",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                choices=[
+                    (1, "Once a day"),
+                    (2, "Twice a day"),
+                    (3, "Three times a day"),
+                    (4, "Four times a day"),
+                    (6, "Every 4 hours"),
+                ],
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="prescription",
+            name="start_date",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="DoseEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scheduled_at", models.DateTimeField()),
+                ("taken_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="dose_events",
+                        to="medapp.patient",
+                    ),
+                ),
+                (
+                    "prescription",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="dose_events",
+                        to="medapp.prescription",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["patient", "scheduled_at"], name="dose_patient_time_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("prescription", "scheduled_at"),
+                        name="dose_prescription_time_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
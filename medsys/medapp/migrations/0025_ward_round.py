@@ -0,0 +1,73 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_occupancy_patient(apps, schema_editor):
+    BedOccupancy = apps.get_model("medapp", "BedOccupancy")
+    # A patient can hold one bed; if several are held the latest admission
+    # keeps its bed and the others are released.
+    seen = set()
+    for occupancy in BedOccupancy.objects.select_related("admission").order_by(
+        "-admission__admission_date", "-id"
+    ):
+        patient_id = occupancy.admission.patient_id
+        if patient_id in seen:
+            occupancy.delete()
+        else:
+            seen.add(patient_id)
+            occupancy.patient_id = patient_id
+            occupancy.save(update_fields=["patient"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0024_dose_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="doseevent",
+            name="cancelled",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="doseevent",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="doseevent",
+            index=models.Index(
+                condition=models.Q(("cancelled", False), ("taken_at__isnull", True)),
+                fields=["scheduled_at"],
+                name="dose_pending_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="doseevent",
+            index=models.Index(fields=["updated_at", "id"], name="dose_updated_idx"),
+        ),
+        migrations.AddField(
+            model_name="bedoccupancy",
+            name="patient",
+            field=models.OneToOneField(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="bed_occupancy",
+                to="medapp.patient",
+            ),
+        ),
+        migrations.RunPython(backfill_occupancy_patient, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="bedoccupancy",
+            name="patient",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="bed_occupancy",
+                to="medapp.patient",
+            ),
+        ),
+    ]
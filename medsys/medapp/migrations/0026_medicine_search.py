@@ -0,0 +1,73 @@
+from django.db import migrations
+
+# SQLite FTS5 index over the medicine catalog. The rowid is the medicine id;
+# triggers keep it in step with every write, bulk inserts included. Other
+# databases fall back to LIKE lookups in medapp.search.
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE medapp_medicine_search USING fts5(
+        name, description, category, tokenize = 'trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER medapp_medicine_search_insert AFTER INSERT ON medapp_medicine BEGIN
+        INSERT INTO medapp_medicine_search (rowid, name, description, category)
+        SELECT new.id, new.name, coalesce(new.description, ''), c.name
+        FROM medapp_medicinecategory c WHERE c.id = new.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER medapp_medicine_search_update
+    AFTER UPDATE OF name, description, category_id ON medapp_medicine BEGIN
+        DELETE FROM medapp_medicine_search WHERE rowid = old.id;
+        INSERT INTO medapp_medicine_search (rowid, name, description, category)
+        SELECT new.id, new.name, coalesce(new.description, ''), c.name
+        FROM medapp_medicinecategory c WHERE c.id = new.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER medapp_medicine_search_delete AFTER DELETE ON medapp_medicine BEGIN
+        DELETE FROM medapp_medicine_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER medapp_medicine_search_category
+    AFTER UPDATE OF name ON medapp_medicinecategory BEGIN
+        UPDATE medapp_medicine_search SET category = new.name
+        WHERE rowid IN (SELECT id FROM medapp_medicine WHERE category_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO medapp_medicine_search (rowid, name, description, category)
+    SELECT m.id, m.name, coalesce(m.description, ''), c.name
+    FROM medapp_medicine m JOIN medapp_medicinecategory c ON c.id = m.category_id
+    """,
+]
+
+DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS medapp_medicine_search_insert",
+    "DROP TRIGGER IF EXISTS medapp_medicine_search_update",
+    "DROP TRIGGER IF EXISTS medapp_medicine_search_delete",
+    "DROP TRIGGER IF EXISTS medapp_medicine_search_category",
+    "DROP TABLE IF EXISTS medapp_medicine_search",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for sql in statements:
+                schema_editor.execute(sql)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0025_ward_round"),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_INDEX), run_on_sqlite(DROP_INDEX)),
+    ]
@@ -0,0 +1,210 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0026_medicine_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InteractionScan",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("interactions", models.PositiveIntegerField()),
+                ("latest_change", models.DateTimeField(null=True)),
+                ("alerts", models.PositiveIntegerField(default=0)),
+                ("finished_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Interaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "severity",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (1, "Minor"),
+                            (2, "Moderate"),
+                            (3, "Major"),
+                            (4, "Contraindicated"),
+                        ]
+                    ),
+                ),
+                ("description", models.TextField(blank=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "category_a",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="medapp.medicinecategory",
+                    ),
+                ),
+                (
+                    "category_b",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="medapp.medicinecategory",
+                    ),
+                ),
+                (
+                    "medicine_a",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="medapp.medicine",
+                    ),
+                ),
+                (
+                    "medicine_b",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="medapp.medicine",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="InteractionAlert",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "severity",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (1, "Minor"),
+                            (2, "Moderate"),
+                            (3, "Major"),
+                            (4, "Contraindicated"),
+                        ]
+                    ),
+                ),
+                ("detected_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "interaction",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="alerts",
+                        to="medapp.interaction",
+                    ),
+                ),
+                (
+                    "other",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="medapp.prescription",
+                    ),
+                ),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="interaction_alerts",
+                        to="medapp.patient",
+                    ),
+                ),
+                (
+                    "prescription",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="interaction_alerts",
+                        to="medapp.prescription",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="interaction",
+            index=models.Index(fields=["updated_at"], name="interaction_updated_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="interaction",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    models.Q(
+                        ("category_a__isnull", True),
+                        ("category_b__isnull", True),
+                        ("medicine_a__isnull", False),
+                        ("medicine_a__lte", models.F("medicine_b")),
+                        ("medicine_b__isnull", False),
+                    ),
+                    models.Q(
+                        ("category_a__isnull", False),
+                        ("category_a__lte", models.F("category_b")),
+                        ("category_b__isnull", False),
+                        ("medicine_a__isnull", True),
+                        ("medicine_b__isnull", True),
+                    ),
+                    _connector="OR",
+                ),
+                name="interaction_one_ordered_pair",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="interaction",
+            constraint=models.UniqueConstraint(
+                fields=("medicine_a", "medicine_b"),
+                name="interaction_medicine_pair_uniq",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="interaction",
+            constraint=models.UniqueConstraint(
+                fields=("category_a", "category_b"),
+                name="interaction_category_pair_uniq",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="interactionalert",
+            index=models.Index(
+                fields=["patient", "detected_at"], name="alert_patient_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="interactionalert",
+            constraint=models.UniqueConstraint(
+                fields=("prescription", "other", "interaction"), name="alert_pair_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0028_pharmacy_stock"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Invoice",
+            fields=[
+                (
+                    "admission",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="invoice",
+                        serialize=False,
+                        to="medapp.admissionrecord",
+                    ),
+                ),
+                ("room_days", models.PositiveIntegerField()),
+                ("room_charges", models.DecimalField(decimal_places=2, max_digits=12)),
+                (
+                    "medicine_charges",
+                    models.DecimalField(decimal_places=2, max_digits=12),
+                ),
+                ("total", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("issued_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="daily_rate",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                help_text="Charge per day for a bed in this room.",
+                max_digits=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="admissionrecord",
+            index=models.Index(
+                condition=models.Q(("discharge_date__isnull", False)),
+                fields=["discharge_date"],
+                name="admission_discharge_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="patient",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="invoices",
+                to="medapp.patient",
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medapp", "0029_admission_billing"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="admissionrecord",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="patient",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="patientmedicalhistory",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="prescription",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="admissionrecord",
+            index=models.Index(fields=["updated_at"], name="admission_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(fields=["updated_at"], name="patient_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patientmedicalhistory",
+            index=models.Index(fields=["updated_at"], name="history_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="prescription",
+            index=models.Index(fields=["updated_at"], name="presc_updated_idx"),
+        ),
+    ]
@@ -1,5 +1,11 @@
-from django.db import models
+import datetime
+from collections import Counter
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # ------------------------------
 # Medicine Management Models
@@ -34,6 +40,13 @@ class Patient(models.Model):
     phone = models.CharField(max_length=20, null=True)
     emergency_contact = models.CharField(max_length=100, null=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='patient_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.get_full_name()}"
 
@@ -48,10 +61,79 @@ class PatientMedicalHistory(models.Model):
     diagnosis_date = models.DateField()
     status1 = models.CharField(max_length=20, choices=STATUS_CHOICES1, null=True, blank=True)
     notes = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'diagnosis_date'], name='history_patient_diag_idx'),
+            models.Index(fields=['updated_at'], name='history_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.condition_name} for {self.patient}"
 
-ROOM_CHOICES = [(i, str(i)) for i in range(1, 21)]
+
+# ------------------------------
+# Ward & Bed Models
+# ------------------------------
+
+class Ward(models.Model):
+    name = models.CharField(max_length=100)
+    code = models.SlugField(max_length=20, unique=True)
+    description = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return self.name
+
+class Room(models.Model):
+    ward = models.ForeignKey(Ward, on_delete=models.CASCADE, related_name='rooms')
+    number = models.CharField(max_length=20)
+    capacity = models.PositiveSmallIntegerField(default=1, help_text="Number of beds the room is staffed for.")
+    daily_rate = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Charge per day for a bed in this room.")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ward', 'number'], name='room_ward_number_uniq'),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Beds carry a copy of the ward; a room moved to another ward takes them along.
+            self.beds.exclude(ward_id=self.ward_id).update(ward_id=self.ward_id)
+
+    def __str__(self):
+        return f"{self.ward.code} {self.number}"
+
+class Bed(models.Model):
+    TYPE_CHOICES = [
+        ('general', 'General'),
+        ('icu', 'Intensive care'),
+        ('isolation', 'Isolation'),
+        ('maternity', 'Maternity'),
+        ('paediatric', 'Paediatric'),
+    ]
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='beds')
+    # Copied from the room so free-bed searches filter on one indexed table.
+    ward = models.ForeignKey(Ward, on_delete=models.CASCADE, related_name='beds')
+    label = models.CharField(max_length=10)
+    bed_type = models.CharField(max_length=20, choices=TYPE_CHOICES, default='general')
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'label'], name='bed_room_label_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['ward', 'bed_type'], name='bed_search_idx', condition=models.Q(active=True)),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.ward_id = self.room.ward_id
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.ward.code} {self.room.number}-{self.label}"
 
 class AdmissionRecord(models.Model):
     STATUS_CHOICES = [
@@ -62,21 +144,66 @@ class AdmissionRecord(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='admissions')
     admission_date = models.DateTimeField()
     discharge_date = models.DateTimeField(null=True, blank=True)
-    room_number = models.PositiveSmallIntegerField(choices=ROOM_CHOICES)
+    bed = models.ForeignKey(Bed, on_delete=models.PROTECT, null=True, related_name='admissions')
     primary_doctor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='primary_admissions')
     assistant_doctor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assistant_doctor_admissions')
     admission_reason = models.TextField()
     discharge_summary = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['primary_doctor', 'created_at'], name='admission_doctor_created_idx'),
+            models.Index(fields=['updated_at'], name='admission_updated_idx'),
+            models.Index(fields=['patient', 'admission_date'], name='admission_patient_date_idx'),
+            models.Index(fields=['discharge_date'], name='admission_discharge_idx', condition=models.Q(discharge_date__isnull=False)),
+        ]
+
     def __str__(self):
         return f"Admission {self.id} for {self.patient}"
 
 
+class BedOccupancy(models.Model):
+    # One row per occupied bed, maintained by medapp.beds. The unique bed is
+    # what rules out double-booking under concurrent admissions; the unique
+    # patient makes "where is this patient now" a single-row join.
+    bed = models.OneToOneField(Bed, on_delete=models.CASCADE, related_name='occupancy')
+    admission = models.OneToOneField(AdmissionRecord, on_delete=models.CASCADE, related_name='occupancy')
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, related_name='bed_occupancy')
+    occupied_since = models.DateTimeField()
+
+    def __str__(self):
+        return f"Bed {self.bed_id} ({self.admission_id})"
+
+
 # ------------------------------
 # Prescription & Dosage Models
 # ------------------------------
 
+FREQUENCY_CHOICES = [
+    (1, 'Once a day'),
+    (2, 'Twice a day'),
+    (3, 'Three times a day'),
+    (4, 'Four times a day'),
+    (6, 'Every 4 hours'),
+]
+
+# Times of day used when a prescription gives a frequency but no dose_times.
+DEFAULT_DOSE_TIMES = {
+    1: ['08:00'],
+    2: ['08:00', '20:00'],
+    3: ['08:00', '14:00', '20:00'],
+    4: ['06:00', '12:00', '18:00', '22:00'],
+    6: ['02:00', '06:00', '10:00', '14:00', '18:00', '22:00'],
+}
+
+# Fields that change when and how often doses are due.
+SCHEDULE_FIELDS = {'patient', 'frequency', 'dose_times', 'start_date', 'duration_days'}
+# Fields that change which drugs a prescription can interact with.
+INTERACTION_FIELDS = {'patient', 'medicine'}
+
 class Prescription(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='prescriptions')
     assistant_doctor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='written_prescriptions')
@@ -84,14 +211,266 @@ class Prescription(models.Model):
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, null=True)
     dosage = models.CharField(max_length=100, default="1")
     duration_days = models.IntegerField(null=True, blank=True)
+    frequency = models.PositiveSmallIntegerField(choices=FREQUENCY_CHOICES, null=True, blank=True)
+    dose_times = models.JSONField(default=list, blank=True, help_text="Times of day as HH:MM; defaults from frequency.")
+    start_date = models.DateField(null=True, blank=True)
     notes = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['assistant_doctor', 'patient', 'created_at'], name='presc_staff_patient_idx'),
+            models.Index(fields=['updated_at'], name='presc_updated_idx'),
+            models.Index(fields=['assistant_doctor', 'created_at'], name='presc_staff_created_idx'),
+            models.Index(fields=['patient', 'created_at'], name='presc_patient_created_idx'),
+        ]
+
+    def times_of_day(self):
+        times = self.dose_times or DEFAULT_DOSE_TIMES.get(self.frequency, [])
+        return sorted(datetime.time.fromisoformat(value) for value in times)
+
+    def save(self, *args, **kwargs):
+        from .interactions import check_prescriptions
+        from .schedules import sync_schedules
+
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or SCHEDULE_FIELDS.intersection(update_fields):
+                sync_schedules([self], created=adding)
+            if update_fields is None or INTERACTION_FIELDS.intersection(update_fields):
+                check_prescriptions([self], created=adding)
+
     def __str__(self):
         return f"Prescription for {self.patient} by {self.assistant_doctor}"
 
+
+class DoseEventQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(cancelled=False, taken_at__isnull=True)
+
+    def between(self, start, end):
+        return self.filter(scheduled_at__gte=start, scheduled_at__lt=end).order_by('scheduled_at')
+
+    def on_day(self, day):
+        start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+        return self.between(start, start + datetime.timedelta(days=1))
+
+
+class DoseEvent(models.Model):
+    # One row per scheduled dose, generated by medapp.schedules. patient is
+    # copied from the prescription so per-patient days are one index range.
+    # Doses dropped by an edit are cancelled rather than deleted so clients
+    # following updated_at see them go.
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='dose_events')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='dose_events')
+    scheduled_at = models.DateTimeField()
+    taken_at = models.DateTimeField(null=True, blank=True)
+    cancelled = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DoseEventQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prescription', 'scheduled_at'], name='dose_prescription_time_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'scheduled_at'], name='dose_patient_time_idx'),
+            models.Index(
+                fields=['scheduled_at'], name='dose_pending_time_idx',
+                condition=models.Q(taken_at__isnull=True, cancelled=False),
+            ),
+            models.Index(fields=['updated_at', 'id'], name='dose_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.prescription.medicine} at {self.scheduled_at:%Y-%m-%d %H:%M}"
+
+# ------------------------------
+# Drug Interactions
+# ------------------------------
+
+SEVERITY_CHOICES = [
+    (1, 'Minor'),
+    (2, 'Moderate'),
+    (3, 'Major'),
+    (4, 'Contraindicated'),
+]
+
+
+class Interaction(models.Model):
+    # Either a medicine pair or a category pair, stored with the lower id
+    # first so each pair has one row. medapp.interactions keeps these in an
+    # in-memory index.
+    medicine_a = models.ForeignKey(Medicine, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    medicine_b = models.ForeignKey(Medicine, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    category_a = models.ForeignKey(MedicineCategory, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    category_b = models.ForeignKey(MedicineCategory, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    severity = models.PositiveSmallIntegerField(choices=SEVERITY_CHOICES)
+    description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(medicine_a__isnull=False, medicine_b__isnull=False, category_a__isnull=True,
+                             category_b__isnull=True, medicine_a__lte=F('medicine_b'))
+                    | models.Q(medicine_a__isnull=True, medicine_b__isnull=True, category_a__isnull=False,
+                               category_b__isnull=False, category_a__lte=F('category_b'))
+                ),
+                name='interaction_one_ordered_pair',
+            ),
+            models.UniqueConstraint(fields=['medicine_a', 'medicine_b'], name='interaction_medicine_pair_uniq'),
+            models.UniqueConstraint(fields=['category_a', 'category_b'], name='interaction_category_pair_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['updated_at'], name='interaction_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.medicine_a_id and self.medicine_b_id and self.medicine_a_id > self.medicine_b_id:
+            self.medicine_a_id, self.medicine_b_id = self.medicine_b_id, self.medicine_a_id
+        if self.category_a_id and self.category_b_id and self.category_a_id > self.category_b_id:
+            self.category_a_id, self.category_b_id = self.category_b_id, self.category_a_id
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        if self.medicine_a_id:
+            return f"{self.medicine_a} + {self.medicine_b} ({self.get_severity_display()})"
+        return f"{self.category_a} + {self.category_b} ({self.get_severity_display()})"
+
+
+class InteractionAlert(models.Model):
+    # prescription is the later of the two, other the one it clashes with.
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='interaction_alerts')
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='interaction_alerts')
+    other = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='+')
+    interaction = models.ForeignKey(Interaction, on_delete=models.CASCADE, related_name='alerts')
+    severity = models.PositiveSmallIntegerField(choices=SEVERITY_CHOICES)
+    detected_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prescription', 'other', 'interaction'], name='alert_pair_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'detected_at'], name='alert_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.interaction} for {self.patient}"
+
+
+class InteractionScan(models.Model):
+    # One row per full re-scan; the interaction table's row count and latest
+    # update identify the version that was scanned.
+    interactions = models.PositiveIntegerField()
+    latest_change = models.DateTimeField(null=True)
+    alerts = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Interaction scan at {self.finished_at:%Y-%m-%d %H:%M}"
+
+# ------------------------------
+# Pharmacy Stock
+# ------------------------------
+
+class MedicineStock(models.Model):
+    # Running balance per medicine, moved in step with the ledger by
+    # medapp.stock with conditional F() updates; reconcile_stock rebuilds it.
+    medicine = models.OneToOneField(Medicine, on_delete=models.CASCADE, primary_key=True, related_name='stock')
+    on_hand = models.PositiveIntegerField(default=0)
+    reorder_level = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.medicine}: {self.on_hand}"
+
+
+class StockLot(models.Model):
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='lots')
+    lot_number = models.CharField(max_length=50)
+    expiry_date = models.DateField(null=True, blank=True)
+    on_hand = models.PositiveIntegerField(default=0)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicine', 'lot_number'], name='lot_medicine_number_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['medicine', 'expiry_date'], name='lot_open_idx', condition=models.Q(on_hand__gt=0)),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine} lot {self.lot_number}"
+
+
+class StockMovement(models.Model):
+    # The ledger: receipts are positive, dispensing negative, one row per lot.
+    KIND_CHOICES = [
+        ('receive', 'Received'),
+        ('dispense', 'Dispensed'),
+    ]
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='stock_movements')
+    lot = models.ForeignKey(StockLot, on_delete=models.PROTECT, related_name='movements')
+    prescription = models.ForeignKey(Prescription, on_delete=models.SET_NULL, null=True, blank=True, related_name='dispensations')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['medicine', 'created_at'], name='movement_medicine_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {abs(self.quantity)} x {self.lot}"
+
+
+# ------------------------------
+# Billing
+# ------------------------------
+
+class Invoice(models.Model):
+    # Materialised by medapp.billing when an admission is discharged; the
+    # amounts are a snapshot of prices and rates at that time.
+    admission = models.OneToOneField(AdmissionRecord, on_delete=models.CASCADE, primary_key=True, related_name='invoice')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='invoices')
+    room_days = models.PositiveIntegerField()
+    room_charges = models.DecimalField(max_digits=12, decimal_places=2)
+    medicine_charges = models.DecimalField(max_digits=12, decimal_places=2)
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+    issued_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Invoice for admission {self.admission_id}: {self.total}"
+
+
 # ------------------------------
 # Message
 # ------------------------------
 
+class MessageQuerySet(models.QuerySet):
+    def mark_read(self):
+        """Mark unread messages in this queryset read and decrement their counters.
+
+        Returns the number of messages marked read.
+        """
+        with transaction.atomic():
+            unread = self.filter(is_read=False)
+            # Locking the rows keeps a concurrent mark_read from decrementing twice.
+            counts = Counter(unread.select_for_update().values_list('recipient_id', flat=True))
+            updated = unread.update(is_read=True, updated_at=timezone.now())
+            for user_id, count in counts.items():
+                UnreadCounter.add(user_id, -count)
+        return updated
+
+
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')  
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')  
@@ -99,6 +478,62 @@ class Message(models.Model):
     body = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'timestamp'], name='message_recipient_time_idx'),
+            models.Index(fields=['recipient', 'updated_at'], name='message_updated_idx'),
+            models.Index(fields=['recipient', 'sender', 'timestamp'], name='message_conversation_idx'),
+            models.Index(fields=['recipient', 'sender'], name='message_unread_idx', condition=models.Q(is_read=False)),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            # The stored row says which counter this save moves, if any.
+            stored = None
+            if not self._state.adding:
+                stored = (
+                    Message.objects.select_for_update().filter(pk=self.pk).values_list('recipient_id', 'is_read').first()
+                )
+            super().save(*args, **kwargs)
+            deltas = Counter()
+            if stored and not stored[1]:
+                deltas[stored[0]] -= 1
+            if not self.is_read:
+                deltas[self.recipient_id] += 1
+            for user_id, delta in deltas.items():
+                if delta:
+                    UnreadCounter.add(user_id, delta)
 
     def __str__(self):
-        return f"From {self.sender.username} to {self.recipient.username} - {self.subject}"
\ No newline at end of file
+        return f"From {self.sender.username} to {self.recipient.username} - {self.subject}"
+
+
+class UnreadCounter(models.Model):
+    # Denormalised count of a user's unread messages, kept in step by
+    # Message.save, MessageQuerySet.mark_read and medapp.signals on delete;
+    # reconcile_unread repairs drift.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def add(cls, user_id, delta):
+        counters = cls.objects.filter(user_id=user_id)
+        if counters.update(count=Greatest(F('count') + delta, 0)):
+            return
+        if delta <= 0:
+            # Nothing to take from, e.g. the user is being deleted too.
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, count=delta)
+        except IntegrityError:
+            # Created concurrently; apply the delta to that row instead.
+            counters.update(count=Greatest(F('count') + delta, 0))
+
+    @classmethod
+    def for_user(cls, user_id):
+        return cls.objects.filter(user_id=user_id).values_list('count', flat=True).first() or 0
\ No newline at end of file
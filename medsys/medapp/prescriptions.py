@@ -0,0 +1,36 @@
+from django.db import transaction
+
+from .interactions import check_prescriptions
+from .models import Prescription
+from .schedules import sync_schedules
+
+
+def create_prescriptions(patient, assistant_doctor, lines):
+    """Insert one prescription per cleaned line in a single transaction.
+
+    bulk_create skips Prescription.save and model signals, so dose events and
+    interaction checks run here for the whole batch and callers own any cache
+    invalidation. Returns the prescriptions; their interaction alerts are
+    attached as ``alerts``.
+    """
+    prescriptions = [
+        Prescription(
+            patient=patient,
+            assistant_doctor=assistant_doctor,
+            medicine_id=line['medicine'],
+            dosage=line['dosage'],
+            duration_days=line.get('duration_days'),
+            frequency=line.get('frequency'),
+            dose_times=line.get('dose_times') or [],
+            start_date=line.get('start_date'),
+            notes=line.get('notes') or None,
+        )
+        for line in lines
+    ]
+    with transaction.atomic():
+        Prescription.objects.bulk_create(prescriptions)
+        sync_schedules(prescriptions, created=True)
+        alerts = check_prescriptions(prescriptions, created=True)
+    for prescription in prescriptions:
+        prescription.alerts = [alert for alert in alerts if prescription.pk in (alert.prescription_id, alert.other_id)]
+    return prescriptions
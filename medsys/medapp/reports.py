@@ -0,0 +1,187 @@
+import datetime
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.db.models import BigIntegerField, Count, Func, Q
+from django.utils import timezone
+
+from .models import AdmissionRecord, Bed, Prescription
+
+# Upper bounds, in days, of the length-of-stay buckets; the last is open-ended.
+STAY_BOUNDS = (1, 2, 4, 7, 14, 30)
+STAY_LABELS = ('< 1 day', '1-2 days', '2-4 days', '4-7 days', '1-2 weeks', '2-4 weeks', '30+ days')
+
+
+class EpochSeconds(Func):
+    # Plain integers skip the per-row datetime parsing that dominates a
+    # streamed pass over a million admissions.
+    output_field = BigIntegerField()
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) AS bigint)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS integer)", **extra_context)
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+# ------------------------------
+# Accumulators
+# ------------------------------
+
+class OccupancyCounter:
+    """Beds in use per local day of a window, as a difference array.
+
+    Each stay adds one at its first day and removes one after its last, so a
+    stay costs two array writes however long it is; a running sum at the end
+    turns the differences into daily counts. Days are found by bisecting the
+    window's midnights, which keeps daylight saving changes exact.
+    """
+
+    def __init__(self, start, days):
+        self.days = days
+        self.midnights = array('d', (
+            local_midnight(start + datetime.timedelta(days=offset)).timestamp() for offset in range(days + 1)
+        ))
+        self.changes = array('q', bytes(8 * (days + 1)))
+
+    def add(self, admitted, discharged):
+        first = max(bisect_right(self.midnights, admitted) - 1, 0)
+        last = min(bisect_right(self.midnights, discharged) - 1, self.days - 1)
+        if first <= last:
+            self.changes[first] += 1
+            self.changes[last + 1] -= 1
+
+    def counts(self):
+        return list(accumulate(self.changes[:self.days]))
+
+
+class StayHistogram:
+    """Length-of-stay counts per bucket, with running totals for the mean."""
+
+    def __init__(self):
+        self.buckets = array('q', bytes(8 * (len(STAY_BOUNDS) + 1)))
+        self.stays = 0
+        self.total_days = 0.0
+        self.longest = 0.0
+
+    def add(self, days):
+        self.buckets[bisect_right(STAY_BOUNDS, days)] += 1
+        self.stays += 1
+        self.total_days += days
+        self.longest = max(self.longest, days)
+
+    def as_dict(self):
+        return {
+            'stays': self.stays,
+            'mean_days': round(self.total_days / self.stays, 1) if self.stays else None,
+            'longest_days': round(self.longest, 1),
+            'buckets': list(self.buckets),
+        }
+
+
+# ------------------------------
+# Report
+# ------------------------------
+
+def admission_stats(start, end, batch_size=20000):
+    """Daily occupancy and per-doctor stay lengths for ``start`` <= day < ``end``.
+
+    One streamed pass over the admissions overlapping the window. Memory is
+    one array per window and one per doctor, not per admission. A patient
+    counts as occupying a bed on every local day their stay touches; stays
+    count towards the distributions if they ended inside the window.
+    """
+    window_start, window_end = local_midnight(start), local_midnight(end)
+    first, last = window_start.timestamp(), window_end.timestamp()
+    now = timezone.now().timestamp()
+
+    occupancy = OccupancyCounter(start, (end - start).days)
+    stays = {}
+    admissions = (
+        AdmissionRecord.objects.filter(admission_date__lt=window_end)
+        .filter(Q(discharge_date__isnull=True) | Q(discharge_date__gte=window_start))
+        .order_by()
+        .values_list(EpochSeconds('admission_date'), EpochSeconds('discharge_date'), 'primary_doctor_id')
+    )
+    for admitted, discharged, doctor_id in admissions.iterator(chunk_size=batch_size):
+        if discharged is None:
+            occupancy.add(admitted, now)
+            continue
+        occupancy.add(admitted, discharged)
+        if first <= discharged < last:
+            if doctor_id not in stays:
+                stays[doctor_id] = StayHistogram()
+            stays[doctor_id].add((discharged - admitted) / 86400)
+    return occupancy.counts(), stays
+
+
+def prescribing_volume(start, end):
+    """Prescriptions written in the window per medicine, busiest first, with category totals."""
+    prescriptions = Prescription.objects.filter(
+        created_at__gte=local_midnight(start), created_at__lt=local_midnight(end), medicine__isnull=False,
+    )
+    medicines = list(
+        prescriptions.values('medicine_id', 'medicine__name', 'medicine__category__name')
+        .annotate(prescriptions=Count('id'))
+        .order_by('-prescriptions', 'medicine__name')
+    )
+    categories = {}
+    for row in medicines:
+        category = row['medicine__category__name']
+        categories[category] = categories.get(category, 0) + row['prescriptions']
+    return medicines, sorted(categories.items(), key=lambda item: (-item[1], item[0]))
+
+
+def report_window(start=None, end=None, days=30):
+    """``(start, end)`` dates, end exclusive, from ISO dates or ``days`` ending on ``end``.
+
+    ``end`` is the last day reported and defaults to today. Raises ValueError.
+    """
+    end = (datetime.date.fromisoformat(end) if end else timezone.localdate()) + datetime.timedelta(days=1)
+    start = datetime.date.fromisoformat(start) if start else end - datetime.timedelta(days=days)
+    if start >= end:
+        raise ValueError("The start date must not be after the end date.")
+    return start, end
+
+
+def build_report(start, end):
+    """Occupancy, length of stay and prescribing for ``start`` <= day < ``end``."""
+    counts, stays = admission_stats(start, end)
+    doctors = {
+        pk: (f'{first} {last}'.strip() or username)
+        for pk, first, last, username in User.objects.filter(pk__in=[pk for pk in stays if pk])
+        .values_list('pk', 'first_name', 'last_name', 'username')
+    }
+    medicines, categories = prescribing_volume(start, end)
+    peak = max(counts, default=0)
+    return {
+        'start': start,
+        'end': end - datetime.timedelta(days=1),
+        'beds': Bed.objects.filter(active=True).count(),
+        'occupancy': {
+            'days': [
+                {'date': start + datetime.timedelta(days=offset), 'occupied': count}
+                for offset, count in enumerate(counts)
+            ],
+            'mean': round(sum(counts) / len(counts), 1) if counts else None,
+            'peak': peak,
+            'peak_date': start + datetime.timedelta(days=counts.index(peak)) if counts else None,
+        },
+        'stay_buckets': STAY_LABELS,
+        'stays': sorted(
+            ({'doctor_id': pk, 'doctor': doctors.get(pk, '-'), **histogram.as_dict()} for pk, histogram in stays.items()),
+            key=lambda row: (-row['stays'], row['doctor']),
+        ),
+        'medicines': [
+            {
+                'medicine_id': row['medicine_id'], 'medicine': row['medicine__name'],
+                'category': row['medicine__category__name'], 'prescriptions': row['prescriptions'],
+            }
+            for row in medicines
+        ],
+        'categories': [{'category': name, 'prescriptions': count} for name, count in categories],
+    }
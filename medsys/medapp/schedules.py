@@ -0,0 +1,129 @@
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Trim
+from django.utils import timezone
+
+from .changes import CURSOR_OVERLAP
+from .models import DoseEvent
+
+
+def dose_datetimes(prescription):
+    """Every dose time of ``prescription``, or none without a frequency and duration.
+
+    Doses run for ``duration_days`` days from ``start_date`` (or the day the
+    prescription was written) at its times of day, in the current time zone.
+    """
+    times = prescription.times_of_day()
+    if not times or not prescription.duration_days:
+        return []
+    start = prescription.start_date or timezone.localdate(prescription.created_at)
+    tz = timezone.get_current_timezone()
+    days = [start + datetime.timedelta(days=offset) for offset in range(prescription.duration_days)]
+    return [timezone.make_aware(datetime.datetime.combine(day, time), tz) for day in days for time in times]
+
+
+def sync_schedules(prescriptions, created=False):
+    """Bring the dose events of ``prescriptions`` in line with their schedules.
+
+    Works on the whole batch at once: one read of the existing events, one
+    bulk insert of new doses and one update each for doses cancelled or
+    restored. Doses already taken are kept. ``created`` skips the read for
+    rows that were just inserted. Returns ``(scheduled, cancelled)``.
+    """
+    prescriptions = [p for p in prescriptions if p.pk]
+    existing = defaultdict(dict)
+    moved = set()
+    events = DoseEvent.objects.none() if created else DoseEvent.objects.filter(prescription__in=prescriptions)
+    patients = {p.pk: p.patient_id for p in prescriptions}
+    for prescription_id, scheduled_at, event_id, taken_at, cancelled, patient_id in events.values_list(
+        'prescription_id', 'scheduled_at', 'id', 'taken_at', 'cancelled', 'patient_id',
+    ):
+        existing[prescription_id][scheduled_at] = (event_id, taken_at, cancelled)
+        if patient_id != patients[prescription_id]:
+            moved.add(prescription_id)
+
+    new = []
+    cancel = []
+    restore = []
+    for prescription in prescriptions:
+        wanted = set(dose_datetimes(prescription))
+        have = existing[prescription.pk]
+        for at, (event_id, taken_at, cancelled) in have.items():
+            if at not in wanted and taken_at is None and not cancelled:
+                cancel.append(event_id)
+            elif at in wanted and cancelled:
+                restore.append(event_id)
+        new.extend(
+            DoseEvent(prescription_id=prescription.pk, patient_id=prescription.patient_id, scheduled_at=at)
+            for at in sorted(wanted - have.keys())
+        )
+
+    # update() skips auto_now, so stamp updated_at explicitly.
+    now = timezone.now()
+    with transaction.atomic(savepoint=False):
+        if cancel:
+            DoseEvent.objects.filter(id__in=cancel).update(cancelled=True, updated_at=now)
+        if restore:
+            DoseEvent.objects.filter(id__in=restore).update(cancelled=False, updated_at=now)
+        for prescription_id in moved:
+            DoseEvent.objects.filter(prescription_id=prescription_id).update(
+                patient_id=patients[prescription_id], updated_at=now,
+            )
+        DoseEvent.objects.bulk_create(new, batch_size=5000)
+    return len(new) + len(restore), len(cancel)
+
+
+# ------------------------------
+# Ward Round
+# ------------------------------
+
+BED = 'patient__bed_occupancy__bed__'
+
+WARD_ROUND_FIELDS = {
+    'ward': F(BED + 'ward__name'),
+    'ward_code': F(BED + 'ward__code'),
+    'room': F(BED + 'room__number'),
+    'bed': F(BED + 'label'),
+    'patient_name': Trim(Concat(F('patient__user__first_name'), Value(' '), F('patient__user__last_name'))),
+    'medicine': F('prescription__medicine__name'),
+    'dosage': F('prescription__dosage'),
+}
+
+
+def ward_round(start, end):
+    """Pending doses between ``start`` and ``end`` for patients currently in a bed.
+
+    One query: a range read of the pending-dose index joined through the
+    occupancy table to bed, room and ward, ordered for walking the wards.
+    """
+    return (
+        DoseEvent.objects.pending()
+        .filter(scheduled_at__gte=start, scheduled_at__lt=end, patient__bed_occupancy__isnull=False)
+        .values('id', 'patient_id', 'scheduled_at', **WARD_ROUND_FIELDS)
+        .order_by(BED + 'ward__code', BED + 'room__number', BED + 'label', 'scheduled_at', 'id')
+    )
+
+
+def ward_round_changes(start, end, since, since_id=0):
+    """Doses in the window whose row changed after ``(since, since_id)``.
+
+    Unlike ward_round() this keeps taken and cancelled doses and patients who
+    left their bed, flagged by ``due``, so a client can drop them. Reads the
+    ``(updated_at, id)`` index and returns ``(rows, (updated_at, id))`` for the
+    next call.
+    """
+    since -= CURSOR_OVERLAP
+    rows = list(
+        DoseEvent.objects.filter(Q(updated_at__gt=since) | Q(updated_at=since, id__gt=since_id))
+        .filter(scheduled_at__gte=start, scheduled_at__lt=end)
+        .values('id', 'patient_id', 'scheduled_at', 'taken_at', 'cancelled', 'updated_at', **WARD_ROUND_FIELDS)
+        .order_by('updated_at', 'id')
+    )
+    cursor = (since + CURSOR_OVERLAP, since_id)
+    for row in rows:
+        row['due'] = row['taken_at'] is None and not row['cancelled'] and row['bed'] is not None
+        cursor = max(cursor, (row.pop('updated_at'), row['id']))
+    return rows, cursor
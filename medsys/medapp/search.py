@@ -0,0 +1,105 @@
+from django.db import connection
+from django.db.models import Q
+
+from .models import Medicine
+
+SEARCH_LIMIT = 20
+# Typo matches need one intact run of this many characters from the query, so
+# common trigrams alone do not pull in the whole catalog for ranking.
+FUZZY_RUN = 4
+# Share of the query's trigrams a name must contain to count as a typo match.
+FUZZY_THRESHOLD = 0.6
+
+SEARCH_SQL = """
+    SELECT m.id, m.name, c.name
+    FROM medapp_medicine_search s
+    JOIN medapp_medicine m ON m.id = s.rowid
+    JOIN medapp_medicinecategory c ON c.id = m.category_id
+    WHERE medapp_medicine_search MATCH %s AND m.active
+    ORDER BY {order}
+    LIMIT %s
+"""
+
+
+def trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_medicines(query, limit=SEARCH_LIMIT):
+    """Active medicines matching ``query`` as ``(id, name, category)`` rows.
+
+    Substring matches on name, description or category come first, names
+    starting with the query ahead of the rest. If that leaves room, names
+    sharing a run of the query and most of its trigrams fill it, which
+    catches a typo or two in longer queries.
+    """
+    query = ' '.join(query.split())
+    if not query:
+        return []
+    if connection.vendor != 'sqlite':
+        return like_medicines(Q(name__icontains=query) | Q(description__icontains=query), limit)
+    if len(query) < 3:
+        # Trigrams need three characters, so short queries only match name prefixes.
+        return like_medicines(Q(name__istartswith=query), limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SEARCH_SQL.format(order="m.name LIKE %s DESC, rank, m.name"),
+            [fts_phrase(query), query + '%', limit],
+        )
+        rows = cursor.fetchall()
+        if len(rows) < limit and len(query) > FUZZY_RUN:
+            wanted = trigrams(query)
+            runs = {query[i:i + FUZZY_RUN] for i in range(len(query) - FUZZY_RUN + 1)}
+            match = 'name : (' + ' OR '.join(fts_phrase(run) for run in sorted(runs)) + ')'
+            cursor.execute(SEARCH_SQL.format(order="rank"), [match, limit * 5])
+            seen = {row[0] for row in rows}
+            fuzzy = []
+            for row in cursor.fetchall():
+                score = len(wanted & trigrams(row[1])) / len(wanted)
+                if row[0] not in seen and score >= FUZZY_THRESHOLD:
+                    fuzzy.append((score, row))
+            fuzzy.sort(key=lambda item: -item[0])
+            rows += [row for _, row in fuzzy[:limit - len(rows)]]
+    return rows
+
+
+def like_medicines(condition, limit):
+    matches = Medicine.objects.filter(condition, active=True).order_by('name')
+    return list(matches.values_list('id', 'name', 'category__name')[:limit])
+
+
+def search_people(queryset, query, user='', limit=SEARCH_LIMIT):
+    """Rows of ``queryset`` whose user matches every word of ``query``.
+
+    ``user`` is the path from the queryset's model to User, e.g. ``'user__'``.
+    Each word may match the first name, last name or username.
+    """
+    for word in query.split():
+        queryset = queryset.filter(
+            Q(**{f'{user}first_name__icontains': word})
+            | Q(**{f'{user}last_name__icontains': word})
+            | Q(**{f'{user}username__icontains': word})
+        )
+    return queryset.order_by(f'{user}last_name', f'{user}first_name', 'pk')[:limit]
+
+
+def search_beds(queryset, query):
+    """Beds of ``queryset`` matching every word of ``query``.
+
+    Each word may start the ward code or room number, appear in the ward
+    name, or be the bed label, so "cardio 101" finds that room's beds.
+    """
+    for word in query.split():
+        queryset = queryset.filter(
+            Q(ward__code__istartswith=word)
+            | Q(ward__name__icontains=word)
+            | Q(room__number__istartswith=word)
+            | Q(label__iexact=word)
+        )
+    return queryset
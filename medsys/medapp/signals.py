@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Message, UnreadCounter
+
+
+# ------------------------------
+# Unread Counters
+# ------------------------------
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    # Also sent per row for queryset deletes and CASCADEs from a deleted user.
+    if not instance.is_read:
+        UnreadCounter.add(instance.recipient_id, -1)
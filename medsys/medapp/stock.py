@@ -0,0 +1,121 @@
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import MedicineStock, StockLot, StockMovement
+
+
+class OutOfStock(Exception):
+    def __init__(self, medicine_id, requested):
+        super().__init__(f"Not enough stock of medicine {medicine_id} to dispense {requested}.")
+        self.medicine_id = medicine_id
+        self.requested = requested
+
+
+# ------------------------------
+# Receiving and Dispensing
+# ------------------------------
+
+def add_to_balance(medicine_id, delta):
+    # Same upsert as UnreadCounter.add: update first, create on a miss.
+    balances = MedicineStock.objects.filter(medicine_id=medicine_id)
+    if balances.update(on_hand=F('on_hand') + delta):
+        return
+    try:
+        with transaction.atomic():
+            MedicineStock.objects.create(medicine_id=medicine_id, on_hand=delta)
+    except IntegrityError:
+        balances.update(on_hand=F('on_hand') + delta)
+
+
+@transaction.atomic
+def receive(medicine_id, lot_number, quantity, expiry_date=None, user=None):
+    """Book ``quantity`` units of a lot into stock and return the ledger row."""
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    lot, created = StockLot.objects.get_or_create(
+        medicine_id=medicine_id, lot_number=lot_number,
+        defaults={'expiry_date': expiry_date, 'on_hand': quantity},
+    )
+    if not created:
+        StockLot.objects.filter(pk=lot.pk).update(on_hand=F('on_hand') + quantity)
+    add_to_balance(medicine_id, quantity)
+    return StockMovement.objects.create(
+        medicine_id=medicine_id, lot=lot, kind='receive', quantity=quantity, user=user,
+    )
+
+
+@transaction.atomic
+def dispense(prescription, quantity, user=None):
+    """Take ``quantity`` units for ``prescription``, earliest expiry first.
+
+    The balance is decremented with a conditional UPDATE, so concurrent
+    pharmacists cannot both take the last units, and only this medicine's
+    open lots are locked. Raises OutOfStock and rolls back if the balance
+    or the lots fall short. Returns the ledger rows written, one per lot.
+    """
+    medicine_id = prescription.medicine_id
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    taken = MedicineStock.objects.filter(medicine_id=medicine_id, on_hand__gte=quantity).update(
+        on_hand=F('on_hand') - quantity,
+    )
+    if not taken:
+        raise OutOfStock(medicine_id, quantity)
+
+    lots = (
+        StockLot.objects.select_for_update().filter(medicine_id=medicine_id, on_hand__gt=0)
+        .order_by(F('expiry_date').asc(nulls_last=True), 'id')
+    )
+    movements = []
+    remaining = quantity
+    for lot in lots:
+        take = min(remaining, lot.on_hand)
+        StockLot.objects.filter(pk=lot.pk).update(on_hand=F('on_hand') - take)
+        movements.append(StockMovement(
+            medicine_id=medicine_id, lot=lot, prescription=prescription, kind='dispense', quantity=-take, user=user,
+        ))
+        remaining -= take
+        if not remaining:
+            break
+    if remaining:
+        # The balance said yes but the lots disagree; reconcile_stock repairs this.
+        raise OutOfStock(medicine_id, quantity)
+    return StockMovement.objects.bulk_create(movements)
+
+
+# ------------------------------
+# Reporting and Reconciliation
+# ------------------------------
+
+def low_stock(days=7):
+    """Medicines at or below their reorder level, with units dispensed in the last ``days``.
+
+    One grouped query over the balances joined to recent dispensing.
+    """
+    since = timezone.now() - datetime.timedelta(days=days)
+    dispensed = Sum(
+        'medicine__stock_movements__quantity',
+        filter=Q(medicine__stock_movements__kind='dispense', medicine__stock_movements__created_at__gte=since),
+    )
+    return (
+        MedicineStock.objects.filter(on_hand__lte=F('reorder_level'), medicine__active=True)
+        .annotate(dispensed=-Coalesce(dispensed, Value(0)))
+        .values('medicine_id', 'medicine__name', 'on_hand', 'reorder_level', 'dispensed')
+        .order_by('on_hand', 'medicine__name')
+    )
+
+
+def ledger_totals(batch_size=5000):
+    """Sum the ledger per lot and per medicine in one streaming pass."""
+    lots = defaultdict(int)
+    medicines = defaultdict(int)
+    movements = StockMovement.objects.order_by().values_list('lot_id', 'medicine_id', 'quantity')
+    for lot_id, medicine_id, quantity in movements.iterator(chunk_size=batch_size):
+        lots[lot_id] += quantity
+        medicines[medicine_id] += quantity
+    return lots, medicines
@@ -1,3 +1,878 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .beds import BedUnavailable, free_beds, rebuild_occupancy, save_admission
+from .billing import invoice_discharges, invoice_rows
+from .changes import CURSOR_OVERLAP
+from .fhir import export_resources, parse_since
+from .forms import AdmissionForm, HistoryForm, PrescriptionForm
+from .interactions import check_patient, check_prescriptions, scan_all
+from .management.commands.load_interactions import load_interactions, read_interactions
+from .management.commands.optimize_db import maintenance_statements
+from .management.commands.reconcile_stock import reconcile as reconcile_stock
+from .management.commands.reconcile_unread import reconcile
+from .models import (
+    AdmissionRecord, Bed, BedOccupancy, DoseEvent, Interaction, InteractionAlert, Invoice, Medicine, MedicineCategory,
+    MedicineStock, Message, Patient, PatientMedicalHistory, Prescription, Room, StockLot, StockMovement, UnreadCounter,
+    Ward,
+)
+from .prescriptions import create_prescriptions
+from .reports import build_report, report_window
+from .schedules import sync_schedules, ward_round, ward_round_changes
+from .search import search_medicines
+from .stock import OutOfStock, dispense, low_stock, receive
 
 # Create your tests here.
+
+# ------------------------------
+# Bed Allocation
+# ------------------------------
+
+class BedAllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(user=User.objects.create_user('pat'), gender='F', blood_group='O+')
+        cls.other = Patient.objects.create(user=User.objects.create_user('other'), gender='M', blood_group='A+')
+        cls.ward = Ward.objects.create(name='Cardiology', code='cardio')
+        cls.icu = Ward.objects.create(name='Intensive Care', code='icu')
+        room = Room.objects.create(ward=cls.ward, number='101', capacity=2)
+        cls.bed_a = Bed.objects.create(room=room, label='A')
+        cls.bed_b = Bed.objects.create(room=room, label='B', bed_type='isolation')
+        cls.icu_bed = Bed.objects.create(room=Room.objects.create(ward=cls.icu, number='1'), label='A', bed_type='icu')
+
+    def admission(self, patient, bed, **kwargs):
+        return AdmissionRecord(
+            patient=patient, bed=bed, admission_date=timezone.now(), admission_reason='Asthma', **kwargs
+        )
+
+    def test_occupied_bed_cannot_be_allocated_twice(self):
+        save_admission(self.admission(self.patient, self.bed_a))
+        with self.assertRaises(BedUnavailable):
+            save_admission(self.admission(self.other, self.bed_a))
+        # The losing admission is rolled back with its occupancy.
+        self.assertEqual(AdmissionRecord.objects.filter(bed=self.bed_a).count(), 1)
+        self.assertEqual(BedOccupancy.objects.get(bed=self.bed_a).admission.patient, self.patient)
+
+    def test_discharge_and_bed_change_release_bed(self):
+        admission = save_admission(self.admission(self.patient, self.bed_a))
+        admission.bed = self.bed_b
+        save_admission(admission)
+        self.assertEqual(list(free_beds(ward='cardio')), [self.bed_a])
+
+        admission.discharge_date = timezone.now()
+        save_admission(admission)
+        self.assertFalse(BedOccupancy.objects.exists())
+
+    def test_search_by_ward_and_type(self):
+        save_admission(self.admission(self.patient, self.bed_a))
+        self.assertEqual(list(free_beds(ward='cardio')), [self.bed_b])
+        self.assertEqual(list(free_beds(ward='cardio', bed_type='icu')), [])
+        self.assertEqual(list(free_beds(bed_type='icu')), [self.icu_bed])
+        self.assertEqual(Bed.objects.get(pk=self.icu_bed.pk).ward, self.icu)
+
+    def test_form_offers_free_beds_and_current_bed(self):
+        admission = save_admission(self.admission(self.patient, self.bed_a))
+        with self.assertNumQueries(1):
+            beds = list(AdmissionForm().fields['bed'].queryset)
+        self.assertNotIn(self.bed_a, beds)
+        self.assertIn(self.bed_a, AdmissionForm(instance=admission).fields['bed'].queryset)
+        # Only the current bed is rendered; the rest are searched for.
+        html = str(AdmissionForm(instance=admission)['bed'])
+        self.assertIn('cardio 101-A', html)
+        self.assertNotIn('<option', html)
+
+    def test_moving_a_room_moves_its_beds(self):
+        room = self.bed_a.room
+        room.ward = self.icu
+        room.save()
+        self.assertEqual(list(free_beds(ward='cardio')), [])
+        self.assertEqual(list(free_beds(ward='icu')), [self.icu_bed, self.bed_a, self.bed_b])
+
+    def test_bed_search_api(self):
+        doctor = User.objects.create_user('doc')
+        doctor.groups.create(name='Doctors')
+        self.client.force_login(doctor)
+        response = self.client.get(reverse('bed_search'), {'ward': 'cardio', 'type': 'isolation'})
+        self.assertEqual([bed['name'] for bed in response.json()['beds']], ['cardio 101-B'])
+        response = self.client.get(reverse('bed_search'), {'q': 'intensive a'})
+        self.assertEqual(response.json()['results'], [{'id': self.icu_bed.id, 'label': 'icu 1-A'}])
+        self.assertEqual(self.client.get(reverse('bed_search'), {'type': 'sofa'}).status_code, 400)
+
+    def test_rebuild_keeps_latest_admission_per_bed(self):
+        first = self.admission(self.patient, self.bed_a)
+        second = self.admission(self.other, self.bed_a)
+        AdmissionRecord.objects.bulk_create([first, second])
+        self.assertEqual(rebuild_occupancy(), 1)
+        self.assertEqual(BedOccupancy.objects.get().admission_id, second.id)
+
+
+# ------------------------------
+# Unread Counters
+# ------------------------------
+
+class UnreadCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user('pat')
+        cls.staff = User.objects.create_user('staff')
+        cls.other = User.objects.create_user('other')
+
+    def send(self, recipient, **kwargs):
+        return Message.objects.create(sender=self.patient, recipient=recipient, subject='Hi', body='.', **kwargs)
+
+    def test_sending_increments_recipient_counter(self):
+        self.send(self.staff)
+        self.send(self.staff)
+        self.send(self.staff, is_read=True)
+        self.assertEqual(UnreadCounter.for_user(self.staff.id), 2)
+        self.assertEqual(UnreadCounter.for_user(self.other.id), 0)
+
+    def test_bulk_mark_read_decrements_each_recipient(self):
+        for _ in range(3):
+            self.send(self.staff)
+        self.send(self.other)
+        self.assertEqual(Message.objects.filter(sender=self.patient).mark_read(), 4)
+        self.assertEqual(Message.objects.mark_read(), 0)
+        self.assertEqual(UnreadCounter.for_user(self.staff.id), 0)
+        self.assertEqual(UnreadCounter.for_user(self.other.id), 0)
+
+    def test_saving_a_read_flag_moves_the_counter(self):
+        message = self.send(self.staff)
+        message.is_read = True
+        message.save()
+        self.assertEqual(UnreadCounter.for_user(self.staff.id), 0)
+        message.is_read = False
+        message.recipient = self.other
+        message.save()
+        message.save()
+        self.assertEqual((UnreadCounter.for_user(self.staff.id), UnreadCounter.for_user(self.other.id)), (0, 1))
+
+    def test_deleting_unread_messages_decrements(self):
+        self.send(self.staff)
+        self.send(self.staff, is_read=True)
+        Message.objects.create(sender=self.other, recipient=self.staff, subject='Hi', body='.')
+        self.assertEqual(UnreadCounter.for_user(self.staff.id), 2)
+        Message.objects.filter(is_read=True).delete()
+        self.assertEqual(UnreadCounter.for_user(self.staff.id), 2)
+        # Deleting the sender's account cascades to their messages.
+        self.other.delete()
+        self.assertEqual(UnreadCounter.for_user(self.staff.id), 1)
+        self.staff.delete()
+        self.assertFalse(UnreadCounter.objects.exists())
+
+    def test_reconcile_repairs_drift(self):
+        self.send(self.staff)
+        Message.objects.bulk_create([Message(sender=self.patient, recipient=self.other, subject='Hi', body='.')])
+        UnreadCounter.objects.filter(user=self.staff).update(count=5)
+        self.assertEqual(reconcile(dry_run=True), {self.staff.id: (5, 1), self.other.id: (0, 1)})
+        self.assertEqual(UnreadCounter.for_user(self.staff.id), 5)
+        reconcile()
+        self.assertEqual(reconcile(), {})
+        self.assertEqual(UnreadCounter.for_user(self.other.id), 1)
+
+
+# ------------------------------
+# Dose Schedules
+# ------------------------------
+
+class DoseScheduleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(user=User.objects.create_user('pat'), gender='F', blood_group='O+')
+        cls.start = datetime.date(2026, 3, 1)
+
+    def prescribe(self, **kwargs):
+        return Prescription.objects.create(patient=self.patient, start_date=self.start, **kwargs)
+
+    def test_events_follow_frequency_and_duration(self):
+        prescription = self.prescribe(frequency=2, duration_days=3)
+        times = list(prescription.dose_events.order_by('scheduled_at').values_list('scheduled_at', flat=True))
+        self.assertEqual(len(times), 6)
+        self.assertEqual(times[0], timezone.make_aware(datetime.datetime(2026, 3, 1, 8)))
+        self.assertEqual(times[-1], timezone.make_aware(datetime.datetime(2026, 3, 3, 20)))
+
+    def test_edit_only_touches_affected_events(self):
+        prescription = self.prescribe(frequency=2, duration_days=3)
+        first_day = set(prescription.dose_events.on_day(self.start).values_list('id', flat=True))
+        taken = prescription.dose_events.order_by('-scheduled_at').first()
+        taken.taken_at = timezone.now()
+        taken.save()
+
+        prescription.duration_days = 2
+        prescription.dose_times = ['08:00', '13:00', '20:00']
+        prescription.save()
+        self.assertEqual(sync_schedules([prescription]), (0, 0))
+        # Day one keeps its 08:00 and 20:00 rows and gains 13:00; day three
+        # only keeps the dose already taken.
+        self.assertTrue(first_day < set(prescription.dose_events.on_day(self.start).values_list('id', flat=True)))
+        self.assertEqual(prescription.dose_events.filter(cancelled=False).count(), 7)
+        self.assertEqual(prescription.dose_events.filter(cancelled=True).count(), 1)
+        self.assertTrue(prescription.dose_events.filter(pk=taken.pk).exists())
+
+    def test_due_today_is_an_index_range(self):
+        self.prescribe(frequency=4, duration_days=5)
+        self.prescribe(frequency=1, duration_days=1)
+        self.prescribe(dosage='as needed')
+        self.assertEqual(DoseEvent.objects.filter(patient=self.patient).on_day(self.start).count(), 5)
+
+    def test_batch_generates_schedules_in_bulk(self):
+        lines = [{'medicine': None, 'dosage': '1', 'frequency': 3, 'duration_days': 10, 'start_date': self.start}] * 4
+        # Savepoint, prescriptions, dose events, release.
+        with self.assertNumQueries(4):
+            create_prescriptions(self.patient, None, lines)
+        self.assertEqual(DoseEvent.objects.count(), 120)
+
+
+# ------------------------------
+# Ward Round
+# ------------------------------
+
+class WardRoundTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ward = Ward.objects.create(name='Cardiology', code='cardio')
+        room = Room.objects.create(ward=cls.ward, number='101', capacity=2)
+        cls.beds = [Bed.objects.create(room=room, label=label) for label in 'BA']
+        cls.patients = [
+            Patient.objects.create(user=User.objects.create_user(name, first_name=name.title()), gender='F', blood_group='O+')
+            for name in ('ann', 'bea', 'cal')
+        ]
+        # Tomorrow, since moving patients only re-sends doses still to come.
+        cls.start = timezone.localdate() + datetime.timedelta(days=1)
+        morning = timezone.make_aware(datetime.datetime.combine(cls.start, datetime.time(7)))
+        cls.window = (morning, morning + datetime.timedelta(hours=3))
+
+    def setUp(self):
+        self.admissions = [
+            save_admission(AdmissionRecord(
+                patient=patient, bed=bed, admission_date=timezone.now(), admission_reason='Asthma',
+            ))
+            for patient, bed in zip(self.patients, self.beds)
+        ]
+        for patient in self.patients:
+            Prescription.objects.create(patient=patient, frequency=2, duration_days=2, start_date=self.start)
+
+    def test_lists_admitted_patients_by_bed_in_one_query(self):
+        with self.assertNumQueries(1):
+            rows = list(ward_round(*self.window))
+        # Cal has no bed; Bea is in bed A so comes first.
+        self.assertEqual([(row['bed'], row['patient_name']) for row in rows], [('A', 'Bea'), ('B', 'Ann')])
+        self.assertEqual(rows[0]['room'], '101')
+        self.assertEqual(rows[0]['ward'], 'Cardiology')
+
+    def test_changes_since_cursor(self):
+        rows, cursor = ward_round_changes(*self.window, since=timezone.now())
+        # Everything was just written, so the overlap re-reads it.
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(sum(row['due'] for row in rows), 2)
+
+        DoseEvent.objects.update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+        cursor = (timezone.now() - datetime.timedelta(minutes=1), 0)
+        self.assertEqual(ward_round_changes(*self.window, *cursor)[0], [])
+
+        discharged = self.admissions[0]
+        discharged.discharge_date = timezone.now()
+        save_admission(discharged)
+        prescription = Prescription.objects.get(patient=self.patients[1])
+        prescription.dose_times = ['09:00', '20:00']
+        prescription.save()
+
+        rows = ward_round_changes(*self.window, *cursor)[0]
+        changed = {(row['patient_id'], row['scheduled_at'].hour): row['due'] for row in rows}
+        self.assertEqual(changed, {
+            (self.patients[0].id, 8): False,
+            (self.patients[1].id, 8): False,
+            (self.patients[1].id, 9): True,
+        })
+
+    def test_view_and_delta(self):
+        staff = User.objects.create_user('nurse')
+        staff.groups.create(name='Staff')
+        self.client.force_login(staff)
+        due = timezone.localtime() + datetime.timedelta(hours=1)
+        Prescription.objects.create(
+            patient=self.patients[0], frequency=1, dose_times=[f'{due:%H:%M}'], duration_days=1, start_date=due.date(),
+        )
+
+        response = self.client.get(reverse('ward_round'))
+        self.assertContains(response, 'Room 101')
+        self.assertContains(response, 'Ann')
+        data = self.client.get(reverse('ward_round'), {'format': 'json', 'hours': 2}).json()
+        self.assertEqual([row['patient_name'] for row in data['rows']], ['Ann'])
+
+        DoseEvent.objects.update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(self.client.get(reverse('ward_round'), {'since': data['cursor']}).json()['rows'], [])
+        self.assertEqual(self.client.get(reverse('ward_round'), {'since': 'nonsense'}).status_code, 400)
+
+
+# ------------------------------
+# Medicine Search
+# ------------------------------
+
+class MedicineSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.antibiotics = MedicineCategory.objects.create(name='Antibiotics')
+        painkillers = MedicineCategory.objects.create(name='Painkillers')
+        Medicine.objects.bulk_create([
+            Medicine(name='Amoxicillin', category=cls.antibiotics, unit_price=3),
+            Medicine(name='Co-amoxiclav', category=cls.antibiotics, unit_price=5),
+            Medicine(name='Paracetamol', category=painkillers, unit_price=1, description='Fever and mild pain'),
+            Medicine(name='Amoxil (withdrawn)', category=cls.antibiotics, unit_price=3, active=False),
+        ])
+
+    def names(self, query):
+        return [name for _, name, _ in search_medicines(query)]
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(self.names('amox'), ['Amoxicillin', 'Co-amoxiclav'])
+        self.assertEqual(self.names('am'), ['Amoxicillin'])
+        self.assertEqual(self.names('fever'), ['Paracetamol'])
+
+    def test_typos_still_match(self):
+        self.assertEqual(self.names('amoxicilin'), ['Amoxicillin'])
+        self.assertEqual(self.names('paracetmol'), ['Paracetamol'])
+        self.assertEqual(self.names('zzzz'), [])
+
+    def test_index_follows_writes(self):
+        medicine = Medicine.objects.create(name='Ibuprofen', category=self.antibiotics, unit_price=2)
+        self.assertEqual(self.names('ibupro'), ['Ibuprofen'])
+        medicine.name = 'Naproxen'
+        medicine.save()
+        self.assertEqual(self.names('ibupro'), [])
+        self.antibiotics.name = 'Penicillins'
+        self.antibiotics.save()
+        self.assertCountEqual(self.names('penicillins'), ['Amoxicillin', 'Co-amoxiclav', 'Naproxen'])
+        medicine.delete()
+        self.assertEqual(self.names('naprox'), [])
+
+    def test_form_renders_only_the_selected_medicine(self):
+        medicine = Medicine.objects.get(name='Paracetamol')
+        with self.assertNumQueries(0):
+            html = PrescriptionForm()['medicine'].as_widget()
+        self.assertNotIn('Amoxicillin', html)
+        self.assertIn('Paracetamol', PrescriptionForm(initial={'medicine': medicine.pk})['medicine'].as_widget())
+
+    def test_search_endpoint(self):
+        staff = User.objects.create_user('staff')
+        staff.groups.create(name='Staff')
+        self.client.force_login(staff)
+        response = self.client.get(reverse('medicine_search'), {'q': 'para'})
+        self.assertEqual(response.json()['results'][0]['label'], 'Paracetamol')
+
+
+# ------------------------------
+# Patient and Staff Pickers
+# ------------------------------
+
+class PickerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('doc')
+        cls.doctor.groups.create(name='Doctors')
+        cls.staff = User.objects.create_user('nurse', first_name='Nina', last_name='Ross')
+        cls.staff.groups.create(name='Staff')
+        cls.recorded, cls.new = [
+            Patient.objects.create(user=User.objects.create_user(name, first_name=name.title(), last_name='Smith'),
+                                   gender='F', blood_group='O+')
+            for name in ('ann', 'bea')
+        ]
+        PatientMedicalHistory.objects.create(patient=cls.recorded, condition_name='Asthma', diagnosis_date='2026-01-01')
+        AdmissionRecord.objects.create(
+            patient=cls.new, assistant_doctor=cls.staff, admission_reason='Asthma', admission_date=timezone.now(),
+        )
+
+    def search(self, name, **params):
+        return [row['label'] for row in self.client.get(reverse(name), params).json()['results']]
+
+    def test_forms_render_without_listing_rows(self):
+        with self.assertNumQueries(0):
+            html = HistoryForm().as_p() + PrescriptionForm(doctor=self.staff).as_p()
+        self.assertNotIn('Smith', html)
+        with self.assertNumQueries(1):
+            html = AdmissionForm(initial={'assistant_doctor': self.staff.pk})['assistant_doctor'].as_widget()
+        self.assertIn('Nina Ross', html)
+
+    def test_validation_checks_submitted_key_only(self):
+        data = {'condition_name': 'Flu', 'diagnosis_date': '2026-02-01'}
+        form = HistoryForm({**data, 'patient': self.recorded.pk})
+        self.assertIn('patient', form.errors)
+        # The field's lookup by primary key, then the model's own foreign key check.
+        with self.assertNumQueries(2):
+            self.assertTrue(HistoryForm({**data, 'patient': self.new.pk}).is_valid())
+
+    def test_garbage_id_is_a_form_error(self):
+        self.client.force_login(self.doctor)
+        response = self.client.post(reverse('add_patient'), {'patient': 'abc', 'assistant_doctor': 'x1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('patient', response.context['history_form'].errors)
+
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('add_prescription'), {'patient': 'abc', 'medicine': '1.5', 'dosage': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('medicine', response.context['form'].errors)
+
+    def test_search_endpoints(self):
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.search('patient_search', q='smith'), ['Ann Smith', 'Bea Smith'])
+        self.assertEqual(self.search('patient_search', q='smith', scope='unrecorded'), ['Bea Smith'])
+        self.assertEqual(self.search('staff_search', q='nina ro'), ['Nina Ross'])
+        self.assertEqual(self.client.get(reverse('patient_search'), {'scope': 'all'}).status_code, 400)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.search('patient_search', scope='assigned'), ['Bea Smith'])
+        self.assertEqual(self.client.get(reverse('staff_search')).status_code, 302)
+
+
+# ------------------------------
+# Drug Interactions
+# ------------------------------
+
+class InteractionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(user=User.objects.create_user('pat'), gender='F', blood_group='O+')
+        cls.anticoagulants = MedicineCategory.objects.create(name='Anticoagulants')
+        cls.nsaids = MedicineCategory.objects.create(name='NSAIDs')
+        other = MedicineCategory.objects.create(name='Analgesics')
+        cls.warfarin = Medicine.objects.create(name='Warfarin', category=cls.anticoagulants, unit_price=1)
+        cls.aspirin = Medicine.objects.create(name='Aspirin', category=other, unit_price=1)
+        cls.ibuprofen = Medicine.objects.create(name='Ibuprofen', category=cls.nsaids, unit_price=1)
+        cls.paracetamol = Medicine.objects.create(name='Paracetamol', category=other, unit_price=1)
+
+    def setUp(self):
+        Interaction.objects.create(medicine_a=self.warfarin, medicine_b=self.aspirin, severity=3, description='Bleeding')
+        Interaction.objects.create(category_a=self.nsaids, category_b=self.anticoagulants, severity=2)
+
+    def prescribe(self, medicine, **kwargs):
+        return Prescription.objects.create(patient=self.patient, medicine=medicine, **kwargs)
+
+    def test_saving_a_prescription_raises_alerts(self):
+        warfarin = self.prescribe(self.warfarin)
+        self.prescribe(self.paracetamol)
+        aspirin = self.prescribe(self.aspirin)
+        ibuprofen = self.prescribe(self.ibuprofen)
+        alerts = InteractionAlert.objects.order_by('prescription_id')
+        self.assertEqual(
+            [(a.prescription_id, a.other_id, a.severity) for a in alerts],
+            [(aspirin.id, warfarin.id, 3), (ibuprofen.id, warfarin.id, 2)],
+        )
+        # Pairs are stored lowest id first whichever way round they were given.
+        self.assertEqual(Interaction.objects.get(severity=2).category_a, self.anticoagulants)
+
+    def test_finished_prescriptions_are_ignored(self):
+        self.prescribe(self.warfarin, start_date=datetime.date(2020, 1, 1), duration_days=7)
+        self.prescribe(self.aspirin)
+        self.assertFalse(InteractionAlert.objects.exists())
+
+    def test_check_costs_no_per_pair_queries(self):
+        for medicine in (self.warfarin, self.paracetamol, self.aspirin):
+            self.prescribe(medicine)
+        new = Prescription.objects.bulk_create([Prescription(patient=self.patient, medicine=self.ibuprofen)])
+        # Index version, the patient's prescriptions, then the alert upsert
+        # inside a savepoint.
+        with self.assertNumQueries(5):
+            alerts = check_prescriptions(new, created=True)
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(len(check_patient(self.patient.id)), 2)
+
+    def test_stale_alerts_are_removed(self):
+        warfarin, aspirin = self.prescribe(self.warfarin), self.prescribe(self.aspirin)
+        self.assertEqual(InteractionAlert.objects.count(), 1)
+        aspirin.medicine = self.paracetamol
+        aspirin.save()
+        self.assertFalse(InteractionAlert.objects.exists())
+
+        aspirin.medicine = self.aspirin
+        aspirin.save()
+        other = Patient.objects.create(user=User.objects.create_user('other'), gender='M', blood_group='A+')
+        aspirin.patient = other
+        aspirin.save()
+        self.assertFalse(InteractionAlert.objects.exists())
+
+        aspirin.patient = self.patient
+        aspirin.save()
+        # Ending a course changes nothing that is saved; the next scan drops it.
+        Prescription.objects.filter(pk=warfarin.pk).update(start_date=datetime.date(2020, 1, 1), duration_days=7)
+        self.assertEqual(scan_all(force=True).alerts, 0)
+        self.assertFalse(InteractionAlert.objects.exists())
+
+    def test_scan_pages_through_patients(self):
+        patients = [self.patient] + [
+            Patient.objects.create(user=User.objects.create_user(f'p{i}'), gender='F', blood_group='O+') for i in range(3)
+        ]
+        for patient in patients:
+            for medicine in (self.warfarin, self.aspirin, self.paracetamol):
+                Prescription.objects.create(patient=patient, medicine=medicine)
+        stale = Prescription.objects.filter(patient=patients[1], medicine=self.aspirin)
+        InteractionAlert.objects.filter(prescription__in=stale).update(severity=1)
+        stale.update(medicine=self.paracetamol)
+        self.assertEqual(scan_all(force=True, batch_size=2).alerts, 3)
+        self.assertEqual(
+            sorted(InteractionAlert.objects.values_list('patient_id', 'severity')),
+            [(patient.id, 3) for patient in patients if patient != patients[1]],
+        )
+
+    def test_csv_load_and_rescan(self):
+        Interaction.objects.all().delete()
+        warfarin, aspirin = self.prescribe(self.warfarin), self.prescribe(self.aspirin)
+        self.assertFalse(InteractionAlert.objects.exists())
+
+        rows = csv.DictReader(io.StringIO(
+            "kind,first,second,severity,description\n"
+            "medicine,Aspirin,Warfarin,minor,\n"
+            "category,NSAIDs,Anticoagulants,2,Bleeding\n"
+        ))
+        interactions, errors = read_interactions(rows)
+        self.assertEqual(errors, [])
+        self.assertEqual(load_interactions(interactions), 2)
+        self.assertEqual(scan_all().alerts, 1)
+        self.assertIsNone(scan_all())
+
+        interactions, _ = read_interactions([
+            {'kind': 'medicine', 'first': 'Warfarin', 'second': 'Aspirin', 'severity': 'major'},
+        ])
+        load_interactions(interactions)
+        self.assertEqual(Interaction.objects.count(), 2)
+        scan_all()
+        alert = InteractionAlert.objects.get()
+        self.assertEqual((alert.prescription_id, alert.other_id, alert.severity), (aspirin.id, warfarin.id, 3))
+
+        _, errors = read_interactions([{'kind': 'medicine', 'first': 'Warfarin', 'second': 'Nope', 'severity': '9'}])
+        self.assertEqual(len(errors), 1)
+
+
+# ------------------------------
+# Pharmacy Stock
+# ------------------------------
+
+class StockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('pharmacist')
+        cls.staff.groups.create(name='Staff')
+        patient = Patient.objects.create(user=User.objects.create_user('pat'), gender='F', blood_group='O+')
+        category = MedicineCategory.objects.create(name='Tablets')
+        cls.medicine = Medicine.objects.create(name='Amoxicillin', category=category, unit_price=1)
+        cls.prescription = Prescription.objects.create(patient=patient, medicine=cls.medicine)
+
+    def setUp(self):
+        receive(self.medicine.id, 'LATE', 30, expiry_date=datetime.date(2027, 6, 1))
+        receive(self.medicine.id, 'EARLY', 10, expiry_date=datetime.date(2027, 1, 1))
+
+    def lots(self):
+        return dict(StockLot.objects.values_list('lot_number', 'on_hand'))
+
+    def test_dispense_takes_earliest_expiry_first(self):
+        movements = dispense(self.prescription, 15, user=self.staff)
+        self.assertEqual([(m.lot.lot_number, m.quantity) for m in movements], [('EARLY', -10), ('LATE', -5)])
+        self.assertEqual(self.lots(), {'EARLY': 0, 'LATE': 25})
+        self.assertEqual(MedicineStock.objects.get().on_hand, 25)
+        self.assertEqual(self.prescription.dispensations.count(), 2)
+
+    def test_short_stock_rolls_back(self):
+        with self.assertRaises(OutOfStock):
+            dispense(self.prescription, 41)
+        self.assertEqual(MedicineStock.objects.get().on_hand, 40)
+        # A balance that disagrees with the lots also refuses.
+        MedicineStock.objects.update(on_hand=100)
+        with self.assertRaises(OutOfStock):
+            dispense(self.prescription, 50)
+        self.assertEqual(self.lots(), {'EARLY': 10, 'LATE': 30})
+        self.assertFalse(StockMovement.objects.filter(kind='dispense').exists())
+
+    def test_low_stock_is_one_query(self):
+        MedicineStock.objects.update(reorder_level=50)
+        dispense(self.prescription, 12)
+        with self.assertNumQueries(1):
+            rows = list(low_stock())
+        self.assertEqual(rows, [{
+            'medicine_id': self.medicine.id, 'medicine__name': 'Amoxicillin',
+            'on_hand': 28, 'reorder_level': 50, 'dispensed': 12,
+        }])
+
+    def test_reconcile_rebuilds_balances_from_ledger(self):
+        dispense(self.prescription, 5)
+        StockLot.objects.filter(lot_number='LATE').update(on_hand=99)
+        MedicineStock.objects.update(on_hand=0)
+        drift = reconcile_stock(dry_run=True)
+        self.assertEqual(drift['medicines'], {self.medicine.id: (0, 35)})
+        self.assertEqual(len(drift['lots']), 1)
+        reconcile_stock()
+        self.assertEqual(self.lots(), {'EARLY': 5, 'LATE': 30})
+        self.assertEqual(reconcile_stock(), {'lots': {}, 'medicines': {}})
+
+    def test_dispense_endpoint(self):
+        self.client.force_login(self.staff)
+        url = reverse('dispense_prescription', args=[self.prescription.id])
+        response = self.client.post(url, {'quantity': 12}, content_type='application/json')
+        self.assertEqual(response.json()['lots'], [{'lot': 'EARLY', 'quantity': 10}, {'lot': 'LATE', 'quantity': 2}])
+        self.assertEqual(self.client.post(url, {'quantity': 500}).status_code, 409)
+        self.assertEqual(self.client.post(url, {'quantity': 'x'}).status_code, 400)
+
+
+# ------------------------------
+# Billing
+# ------------------------------
+
+class BillingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = Group.objects.create(name='Patients')
+        cls.patient = Patient.objects.create(user=User.objects.create_user('pat'), gender='F', blood_group='O+')
+        cls.patient.user.groups.add(cls.patients)
+        room = Room.objects.create(ward=Ward.objects.create(name='Cardiology', code='cardio'), number='101', daily_rate=100)
+        cls.bed = Bed.objects.create(room=room, label='A')
+        category = MedicineCategory.objects.create(name='Tablets')
+        cls.medicine = Medicine.objects.create(name='Amoxicillin', category=category, unit_price=Decimal('2.50'))
+        # Half a day off a day boundary, so the open-stay estimate is five
+        # started days however long the run takes.
+        cls.admitted = timezone.now().replace(microsecond=0) - datetime.timedelta(days=4, hours=12)
+
+    def setUp(self):
+        self.admission = save_admission(AdmissionRecord(
+            patient=self.patient, bed=self.bed, admission_date=self.admitted, admission_reason='Chest pain',
+        ))
+        during = self.admitted + datetime.timedelta(hours=1)
+        for fields, created_at in [
+            ({'frequency': 2, 'duration_days': 3}, during),
+            # Three dose times and no duration: charged for the whole stay.
+            ({'dose_times': ['08:00', '14:00', '20:00']}, during),
+            # A course longer than the stay is capped at the stay.
+            ({'frequency': 1, 'duration_days': 30}, during),
+            # Written before the admission, so not on this bill.
+            ({'frequency': 4, 'duration_days': 3}, self.admitted - datetime.timedelta(days=1)),
+        ]:
+            prescription = Prescription.objects.create(patient=self.patient, medicine=self.medicine, **fields)
+            Prescription.objects.filter(pk=prescription.pk).update(created_at=created_at)
+
+    def discharge(self, after):
+        self.admission.discharge_date = self.admitted + after
+        return save_admission(self.admission)
+
+    def test_discharge_materialises_invoice(self):
+        # Three days and two hours is four started days.
+        self.discharge(datetime.timedelta(days=3, hours=2))
+        invoice = Invoice.objects.get(admission=self.admission)
+        self.assertEqual(invoice.room_days, 4)
+        self.assertEqual(invoice.room_charges, Decimal('400.00'))
+        # 2.50 x (2 doses x 3 days + 3 doses x 4 days + 1 dose x 4 days)
+        self.assertEqual(invoice.medicine_charges, Decimal('55.00'))
+        self.assertEqual(invoice.total, Decimal('455.00'))
+
+        self.admission.discharge_date = None
+        save_admission(self.admission)
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_charges_are_one_query(self):
+        with self.assertNumQueries(1):
+            row = invoice_rows(AdmissionRecord.objects.all(), now=self.admitted + datetime.timedelta(hours=5)).get()
+        self.assertEqual((row['room_days'], row['room_charges']), (1, 100))
+        self.assertEqual(row['medicine_charges'], Decimal('15.00'))
+
+    def test_invoice_a_days_discharges(self):
+        AdmissionRecord.objects.filter(pk=self.admission.pk).update(discharge_date=self.admitted + datetime.timedelta(days=2))
+        day = (self.admitted + datetime.timedelta(days=2)).date()
+        with self.assertNumQueries(2):
+            invoices = invoice_discharges(day)
+        self.assertEqual([(invoice.admission_id, invoice.room_days) for invoice in invoices], [(self.admission.id, 2)])
+        self.assertEqual(invoice_discharges(day + datetime.timedelta(days=1)), [])
+        self.assertEqual(Invoice.objects.get().total, Decimal('230.00'))
+
+    def test_invoice_endpoint(self):
+        self.client.force_login(self.patient.user)
+        url = reverse('admission_invoice', args=[self.admission.id])
+        estimate = self.client.get(url).json()
+        self.assertFalse(estimate['final'])
+        self.assertEqual(estimate['room_days'], 5)
+
+        self.discharge(datetime.timedelta(days=1))
+        invoice = self.client.get(url).json()
+        self.assertTrue(invoice['final'])
+        self.assertEqual(invoice['total'], '115.00')
+
+        other = Patient.objects.create(user=User.objects.create_user('nosy'), gender='M', blood_group='A+')
+        other.user.groups.add(self.patients)
+        self.client.force_login(other.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+# ------------------------------
+# Reports
+# ------------------------------
+
+class ReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('doc', first_name='Ada', last_name='Berg')
+        patient = Patient.objects.create(user=User.objects.create_user('pat'), gender='F', blood_group='O+')
+        at = lambda day, hour=12: timezone.make_aware(datetime.datetime(2026, 1, day, hour))
+        for admitted, discharged in [
+            (at(2, 10), at(4, 9)),
+            (at(1) - datetime.timedelta(days=2), at(1)),
+            (at(8), None),
+            (at(20), at(22)),
+        ]:
+            AdmissionRecord.objects.create(
+                patient=patient, primary_doctor=cls.doctor, admission_date=admitted, discharge_date=discharged,
+                admission_reason='Asthma', status='admitted',
+            )
+        category = MedicineCategory.objects.create(name='Tablets')
+        medicines = [Medicine.objects.create(name=name, category=category, unit_price=1) for name in ('Aspirin', 'Zinc')]
+        for medicine, day in [(medicines[0], 2), (medicines[0], 3), (medicines[1], 5), (medicines[1], 15)]:
+            prescription = Prescription.objects.create(patient=patient, medicine=medicine)
+            Prescription.objects.filter(pk=prescription.pk).update(created_at=at(day))
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.groups.create(name='Staff')
+
+    def test_report(self):
+        start, end = report_window('2026-01-01', '2026-01-10')
+        with self.assertNumQueries(4):
+            report = build_report(start, end)
+        self.assertEqual([day['occupied'] for day in report['occupancy']['days']], [1, 1, 1, 1, 0, 0, 0, 1, 1, 1])
+        self.assertEqual(report['occupancy']['peak_date'], datetime.date(2026, 1, 1))
+        [stays] = report['stays']
+        self.assertEqual((stays['doctor'], stays['stays'], stays['mean_days']), ('Ada Berg', 2, 2.0))
+        self.assertEqual(stays['buckets'], [0, 1, 1, 0, 0, 0, 0])
+        self.assertEqual([(row['medicine'], row['prescriptions']) for row in report['medicines']], [('Aspirin', 2), ('Zinc', 1)])
+        self.assertEqual(report['categories'], [{'category': 'Tablets', 'prescriptions': 3}])
+
+    def test_report_page(self):
+        self.client.force_login(self.staff)
+        url = reverse('staff_report')
+        response = self.client.get(url, {'start': '2026-01-01', 'end': '2026-01-31', 'format': 'json'})
+        self.assertEqual(len(response.json()['occupancy']['days']), 31)
+        self.assertContains(self.client.get(url, {'days': 7}), 'Bed Occupancy')
+        self.assertEqual(self.client.get(url, {'start': '2024-01-01', 'end': '2026-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': 'soon'}).status_code, 400)
+
+
+# ------------------------------
+# FHIR Export
+# ------------------------------
+
+class FhirExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', first_name='Ada', last_name='Berg')
+        cls.patient = Patient.objects.create(user=cls.user, gender='Female', blood_group='O+', phone='555')
+        PatientMedicalHistory.objects.create(
+            patient=cls.patient, condition_name='Asthma', diagnosis_date=datetime.date(2020, 1, 1), status1='chronic',
+        )
+        AdmissionRecord.objects.create(
+            patient=cls.patient, admission_date=timezone.now(), admission_reason='Wheeze', status='admitted',
+        )
+        category = MedicineCategory.objects.create(name='Inhalers')
+        medicine = Medicine.objects.create(name='Salbutamol', category=category, unit_price=1)
+        cls.prescription = Prescription.objects.create(
+            patient=cls.patient, medicine=medicine, frequency=2, duration_days=5, start_date=timezone.localdate(),
+        )
+        cls.admin = User.objects.create_superuser('admin')
+
+    def export(self, resource_type, since=None):
+        return [json.loads(line) for line in export_resources(resource_type, since)]
+
+    def test_resources(self):
+        [patient] = self.export('Patient')
+        self.assertEqual(patient['name'], [{'family': 'Berg', 'given': ['Ada']}])
+        self.assertEqual((patient['gender'], patient['telecom'][0]['value']), ('female', '555'))
+        [condition] = self.export('Condition')
+        self.assertEqual(condition['subject'], {'reference': f'Patient/{self.patient.id}'})
+        self.assertEqual(condition['clinicalStatus']['coding'][0]['code'], 'active')
+        [encounter] = self.export('Encounter')
+        self.assertEqual((encounter['status'], encounter['class']['code']), ('in-progress', 'IMP'))
+        [request] = self.export('MedicationRequest')
+        self.assertEqual(request['status'], 'active')
+        self.assertEqual(request['dosageInstruction'][0]['timing']['repeat']['frequency'], 2)
+        self.assertEqual(request['medicationCodeableConcept'], {'text': 'Salbutamol'})
+
+    def test_since_exports_only_changes(self):
+        since = timezone.now()
+        for model in (Patient, PatientMedicalHistory, AdmissionRecord, Prescription):
+            model.objects.update(updated_at=since - datetime.timedelta(minutes=1))
+        self.assertEqual(self.export('MedicationRequest', since), [])
+        self.prescription.notes = 'With spacer'
+        self.prescription.save()
+        self.assertEqual([r['note'] for r in self.export('MedicationRequest', since)], [[{'text': 'With spacer'}]])
+        # Renaming the user re-exports the patient whose name changed.
+        self.user.last_name = 'Hansen'
+        self.user.save()
+        self.assertEqual([r['name'][0]['family'] for r in self.export('Patient', since)], ['Hansen'])
+        self.assertEqual(self.export('Condition', since), [])
+
+    def test_export_endpoint(self):
+        url = reverse('fhir_export')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.admin)
+        response = self.client.get(url, {'_type': 'Patient,Encounter'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual([json.loads(line)['resourceType'] for line in lines], ['Patient', 'Encounter'])
+        for refused in ('gzip;q=0', 'br, gzip; q=0.0', '*;q=0', 'identity'):
+            response = self.client.get(url, {'_type': 'Patient'}, HTTP_ACCEPT_ENCODING=refused)
+            self.assertFalse(response.has_header('Content-Encoding'), refused)
+            self.assertEqual(json.loads(b''.join(response.streaming_content))['resourceType'], 'Patient')
+        response = self.client.get(url, {'_type': 'Patient'}, HTTP_ACCEPT_ENCODING='identity;q=0.5, *;q=0.1')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        since = response['X-Transaction-Time']
+        # Rows stamped just before the cursor are sent again, once each.
+        response = self.client.get(url, {'_since': since, '_type': 'Patient'})
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [str(self.patient.id)])
+        Patient.objects.update(updated_at=parse_since(since) - CURSOR_OVERLAP - datetime.timedelta(seconds=1))
+        response = self.client.get(url, {'_since': since, '_type': 'Patient'})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        self.assertEqual(self.client.get(url, {'_type': 'Observation'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'_since': 'yesterday'}).status_code, 400)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_fhir', output=directory, gzip=True, stdout=io.StringIO())
+            self.assertEqual(sorted(os.listdir(directory)), [
+                'Condition.ndjson.gz', 'Encounter.ndjson.gz', 'MedicationRequest.ndjson.gz', 'Patient.ndjson.gz',
+            ])
+            with gzip.open(os.path.join(directory, 'Patient.ndjson.gz')) as exported:
+                self.assertEqual(json.loads(exported.read())['id'], str(self.patient.id))
+
+
+# ------------------------------
+# SQLite Profile
+# ------------------------------
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite connection settings")
+class SqliteProfileTests(TransactionTestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connections_apply_the_profile(self):
+        self.assertEqual(self.pragma('busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'), settings.SQLITE_PRAGMAS['cache_size'])
+        self.assertEqual(self.pragma('temp_store'), 2)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_optimize_db(self):
+        self.assertEqual(maintenance_statements('postgresql'), ['ANALYZE'])
+        self.assertIn('PRAGMA analysis_limit=0', maintenance_statements('sqlite', full=True))
+        out = io.StringIO()
+        call_command('optimize_db', stdout=out)
+        self.assertIn('ANALYZE:', out.getvalue())
+        self.assertIn('PRAGMA optimize:', out.getvalue())
+        self.assertIn('wal_checkpoint', out.getvalue())
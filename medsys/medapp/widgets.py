@@ -0,0 +1,47 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from django.urls import reverse
+from django.utils.http import urlencode
+
+
+class AutocompleteWidget(forms.Widget):
+    """A search box that fills a hidden primary key from a JSON endpoint.
+
+    Only the selected option is ever rendered, so the page does not grow with
+    the table behind the field. The endpoint answers ``?q=`` plus any fixed
+    ``params`` with ``{"results": [{"id": ..., "label": ...}]}``.
+    """
+
+    template_name = 'widgets/autocomplete.html'
+
+    class Media:
+        js = ['autocomplete.js']
+
+    def __init__(self, url_name, params=None, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.params = params or {}
+        self.choices = []
+
+    def label_for(self, value):
+        if value in (None, ''):
+            return ''
+        if isinstance(self.choices, ModelChoiceIterator):
+            queryset = self.choices.queryset
+            # A re-rendered form carries whatever was posted, e.g. "abc".
+            try:
+                pk = queryset.model._meta.pk.to_python(value)
+            except (ValueError, ValidationError):
+                return ''
+            obj = queryset.filter(pk=pk).first()
+            return self.choices.field.label_from_instance(obj) if obj else ''
+        return {str(key): label for key, label in self.choices}.get(str(value), '')
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget'].update({
+            'url': reverse(self.url_name) + (f'?{urlencode(self.params)}' if self.params else ''),
+            'label': self.label_for(context['widget']['value']),
+        })
+        return context
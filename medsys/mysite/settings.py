@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +48,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "accounts.middleware.RoleMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -64,6 +66,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "accounts.context_processors.unread_messages",
             ],
         },
     },
@@ -75,14 +78,66 @@ WSGI_APPLICATION = "mysite.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Applied to every new SQLite connection. busy_timeout is in milliseconds,
+# cache_size in KiB when negative.
+SQLITE_PRAGMAS = {
+    "busy_timeout": 20000,
+    "cache_size": -32000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+# Deployment only (MEDSYS_SQLITE_WAL=1). WAL lets readers run alongside the
+# one writer, and synchronous=NORMAL is durable across crashes in WAL mode
+# and only syncs at checkpoints. The journal mode is stored in the database
+# file itself, so it stays off for the demo db.sqlite3 kept in git.
+SQLITE_WAL_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+}
+if os.environ.get("MEDSYS_SQLITE_WAL") == "1":
+    SQLITE_PRAGMAS = {**SQLITE_WAL_PRAGMAS, **SQLITE_PRAGMAS}
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "init_command": ";".join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+            # Writers take the lock at BEGIN and wait busy_timeout for it. A
+            # deferred transaction that reads first fails at once with
+            # "database is locked" when it cannot upgrade to a write.
+            "transaction_mode": "IMMEDIATE",
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    # Shared by every worker process on the host without touching the
+    # database: role versions (accounts.roles) and fragment generations
+    # (accounts.fragments), small values that change only on writes. Use
+    # Memcached or Redis instead when workers run on several hosts.
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "var" / "cache",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+    # Rendered dashboard fragments (accounts.fragments), per worker. The
+    # least recently used tenth is evicted past MAX_ENTRIES; the generations
+    # in the default cache decide which entries are still current.
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "medsys-fragments",
+        "TIMEOUT": 24 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 5000, "CULL_FREQUENCY": 10},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 